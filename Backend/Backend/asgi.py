@@ -7,10 +7,62 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+os.environ.setdefault('CMS_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Django 3.2 runs every thread sensitive sync call (views, ORM) of every request in one
+# shared thread. Requests take one of CMS_ASGI_THREADS contexts instead, each with its own
+# thread kept for the life of the process, so their database connections persist under
+# CONN_MAX_AGE. A fresh ThreadSensitiveContext per request would start a thread and a
+# connection every time. The context is only held for the synchronous part of a request,
+# from the end of its body to the start of its response: slow uploads and slow readers of
+# responses, streamed ones included, do not count against CMS_ASGI_THREADS.
+ASGI_THREADS = int(os.environ.get('CMS_ASGI_THREADS', 8))
+_contexts = None
+
+
+async def application(scope, receive, send):
+    global _contexts
+    if scope['type'] != 'http':
+        return await django_application(scope, receive, send)
+    if _contexts is None:
+        _contexts = asyncio.Queue()
+        for _ in range(ASGI_THREADS):
+            _contexts.put_nowait(ThreadSensitiveContext())
+    held = []
+
+    async def acquire():
+        context = await _contexts.get()
+        # what ThreadSensitiveContext.__aenter__ does, without the executor shutdown of __aexit__
+        held.append((context, SyncToAsync.thread_sensitive_context.set(context)))
+
+    def release():
+        if held:
+            context, token = held.pop()
+            SyncToAsync.thread_sensitive_context.reset(token)
+            _contexts.put_nowait(context)
+
+    async def receive_body():
+        message = await receive()
+        if message['type'] == 'http.request' and not message.get('more_body', False) and not held:
+            await acquire()
+        return message
+
+    async def send_response(message):
+        if message['type'] == 'http.response.start':
+            # the rest (sending the body, closing the response) runs in the shared thread
+            release()
+        await send(message)
+
+    try:
+        await django_application(scope, receive_body, send_response)
+    finally:
+        release()
@@ -52,7 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.CompressionMiddleware',
+    'main.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,21 +89,117 @@ AUTH_USER_MODEL = 'main.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'main.authentication.ClaimsJWTAuthentication',
     )
 }
 
+# build content and category read responses straight from .values() rows instead of
+# through ContentSerializer/CategorySerializer (same output, see main/fast_serializers.py)
+FAST_READ_SERIALIZERS = True
+
+# unpaginated content lists with at least this many rows are streamed from a server side
+# cursor, rendering and holding one chunk at a time (0 disables streaming)
+CONTENT_STREAM_CHUNK_SIZE = 500
+
+# response encodings in order of preference, those whose module (zstandard, brotli)
+# is missing are skipped
+COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+
+# per route request metrics (main/metrics.py), served in the Prometheus text format at
+# /api/metrics/ with 'Authorization: Bearer <METRICS_TOKEN>'; every worker process keeps
+# and serves its own. Without a token only METRICS_ALLOWED_IPS may read them: leave it empty
+# behind a reverse proxy, which makes every request come from its own (often loopback) address
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get('CMS_METRICS_TOKEN')
+METRICS_ALLOWED_IPS = []
+# log requests slower than this many seconds with their slowest queries (None disables)
+METRICS_SLOW_REQUEST_SECONDS = None
+
+# content list pagination (used when ?cursor= or ?page_size= is sent)
+CONTENT_PAGE_SIZE = 50
+CONTENT_MAX_PAGE_SIZE = 500
+
+# serve content categories from a copy kept on each content row (and search it without the
+# categories join); run manage.py refresh_category_data after turning it on
+CONTENT_DENORMALIZED_CATEGORIES = False
+
+# most documents accepted by one call to the bulk content endpoints
+CONTENT_BULK_MAX_ITEMS = 1000
+
+# content search index, see main/search.py for the available backends
+# ('main.search.InMemorySearchBackend' keeps a pure Python index in each process)
+CONTENT_SEARCH_BACKEND = 'main.search.SQLiteFTSBackend'
+CONTENT_SEARCH_MAX_RESULTS = 1000
+
+# cache used for content and category API responses, see main/cache.py
+# (point CONTENT_CACHE_ALIAS at a shared backend such as Redis when running several processes)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cms',
+    }
+}
+CONTENT_CACHE_ALIAS = 'default'
+# seconds, 0 disables response caching
+CONTENT_CACHE_TIMEOUT = 300
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 with transactions that wait for the write lock
+        'ENGINE': 'main.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # seconds a connection waits for another process' write lock before 'database is locked'
+            'timeout': 20,
+        },
     }
 }
 
+# applied to every new SQLite connection (main.signals): WAL lets readers run next to the
+# writer, synchronous=NORMAL only syncs at checkpoints which is safe with WAL, and reads
+# go through a 256 MB memory map and a 64 MB page cache per connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+
+# set POSTGRES_DB (and POSTGRES_HOST, POSTGRES_PORT, POSTGRES_USER, POSTGRES_PASSWORD)
+# to run on PostgreSQL instead (needs psycopg2). POSTGRES_REPLICA_HOSTS is a comma
+# separated list of read replicas, see main/routers.py
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        # keep connections open between requests, every worker thread holds at most one
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        # ping reused connections before a request (main.signals) so a restarted server
+        # costs a reconnect instead of a failed request
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'connect_timeout': 5},
+    }
+    for number, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(','))):
+        DATABASES['replica_%d' % number] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    # the FTS5 index is SQLite only
+    CONTENT_SEARCH_BACKEND = 'main.search.DatabaseSearchBackend'
+
+# reads go to a random replica and writes to default; a client that just wrote reads
+# from default for REPLICA_PIN_SECONDS so it sees its own changes
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['main.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -113,7 +212,7 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+        'NAME': 'main.validators.CommonPasswordValidator',
     },
     {
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
@@ -121,6 +220,23 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# scrypt hashes in a fraction of the CPU time of PBKDF2; Argon2 is preferred when
+# argon2-cffi is installed. Hashes of the other hashers still verify and are
+# rehashed with the first one on the next successful login.
+PASSWORD_HASHERS = [
+    'main.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+try:
+    import argon2  # noqa: F401
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(PASSWORD_HASHERS.index('django.contrib.auth.hashers.Argon2PasswordHasher')))
+except ImportError:
+    pass
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -144,6 +260,42 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# uploads to the content views are streamed to a temporary file next to the media folder so saving
+# them is a rename, hashed and checked to be pdfs on the fly, see main/uploadhandlers.py; other
+# uploads go through Django's default FILE_UPLOAD_HANDLERS
+FILE_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, 'tmp')
+PDF_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+
+# pdfs are stored once per distinct content under pdfs/<sha256 prefix>/, see main/storage.py
+PDF_STORAGE = 'main.storage.ContentAddressedStorage'
+# unreferenced pdfs saved (or saved again as a duplicate) less than PDF_RELEASE_GRACE seconds ago are
+# only deleted after that delay, as the upload reusing them may not be committed yet
+PDF_RELEASE_GRACE = 300
+
+# let the web server send pdf downloads: None (stream from Django), 'x-accel-redirect'
+# (nginx, with an internal location aliasing MEDIA_ROOT at PDF_SENDFILE_PREFIX) or 'x-sendfile'
+PDF_SENDFILE_MODE = None
+PDF_SENDFILE_PREFIX = '/protected/'
+
+# text and first page thumbnails are derived from uploaded pdfs in PDF_PROCESSING_PROCESSES spawned
+# processes (0 derives them in the job worker itself) and kept per file hash, see main/tasks.py.
+# Thumbnails need pypdfium2 and Pillow, or poppler's pdftoppm; text extraction uses pypdf when installed
+PDF_PROCESSING_PROCESSES = 2
+PDF_THUMBNAIL_WIDTH = 320
+PDF_TEXT_MAX_LENGTH = 100000
+
+# post-upload processing goes through the database job queue of main/jobs.py: threads of the web
+# process run the jobs after each commit (0 leaves them to manage.py run_jobs), failed jobs are
+# retried JOB_MAX_ATTEMPTS times after JOB_RETRY_DELAY seconds doubled every attempt, batch tasks
+# run up to JOB_BATCH_SIZE jobs at once and jobs locked for JOB_LOCK_TIMEOUT seconds are run again.
+# JOB_QUEUE_ALWAYS_EAGER runs tasks inline after commit without queueing them (tests, scripts)
+BACKGROUND_TASK_WORKERS = 2
+JOB_QUEUE_ALWAYS_EAGER = False
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_BATCH_SIZE = 100
+JOB_LOCK_TIMEOUT = 600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -151,6 +303,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 from datetime import timedelta
 
+# serve the read endpoints with native async views, enabled by Backend/asgi.py
+ASYNC_READ_VIEWS = os.environ.get('CMS_ASYNC_VIEWS') == '1'
+
 # JWT token settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -165,4 +320,10 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_REFRESH_SERIALIZER': 'main.serializers.CMSTokenRefreshSerializer',
 }
+
+# seconds a process trusts its cached token version of a user, i.e. how long a revoked
+# access token may still be accepted by other processes (0 checks the database every time)
+JWT_USER_CACHE_TTL = 60
+JWT_USER_CACHE_SIZE = 10000
@@ -0,0 +1,7 @@
+"""
+Standalone benchmarks for the CMS backend.
+
+Run them from the Backend directory, e.g. ``python -m benchmarks.search``.
+Every benchmark works on its own throwaway SQLite database and never touches
+db.sqlite3 or the media folder.
+"""
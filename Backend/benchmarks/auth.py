@@ -0,0 +1,64 @@
+"""
+Measures register and login requests per second through the API with each
+password hasher:
+
+- pbkdf2: Django's default PBKDF2PasswordHasher (the previous configuration)
+- scrypt: main.hashers.ScryptPasswordHasher
+- argon2: Argon2PasswordHasher, when argon2-cffi is installed
+
+Usage: python -m benchmarks.auth [--requests 50] [--hashers pbkdf2 scrypt argon2]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.utils import setup_django
+
+HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'main.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+
+
+def requests_per_second(client, url, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        response = client.post(url, data=json.dumps(payload), content_type='application/json')
+        assert response.status_code in (200, 201), response.content
+    return len(payloads) / (time.perf_counter() - start)
+
+
+def run(names, count):
+    from django.test.utils import override_settings, setup_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    setup_test_environment()
+    client = APIClient()
+    for name in names:
+        if name == 'argon2':
+            try:
+                import argon2  # noqa: F401
+            except ImportError:
+                print('%-8s skipped, argon2-cffi is not installed' % name)
+                continue
+        with override_settings(PASSWORD_HASHERS=[HASHERS[name]]):
+            registrations = [
+                {'email': '%s-%d@example.com' % (name, number), 'full_name': 'Bench', 'phone': '1234567890',
+                 'pincode': '123456', 'password': 'Bench@%d-pass' % number}
+                for number in range(count)
+            ]
+            register = requests_per_second(client, reverse('register'), registrations)
+            logins = [{'email': payload['email'], 'password': payload['password']} for payload in registrations]
+            login = requests_per_second(client, reverse('login'), logins)
+        print('%-8s register %7.1f req/s   login %7.1f req/s' % (name, register, login))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--hashers', nargs='+', choices=sorted(HASHERS), default=['pbkdf2', 'scrypt', 'argon2'])
+    arguments = parser.parse_args()
+    setup_django()
+    run(arguments.hashers, arguments.requests)
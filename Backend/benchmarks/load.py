@@ -0,0 +1,268 @@
+"""
+Load test of the CMS API.
+
+Seeds synthetic users, categories and contents with manage.py generate_data
+(reusing them when --database already holds enough), serves the API in this process with Django's threaded
+WSGI server, then drives every scenario with --concurrency client threads and
+reports per scenario:
+
+- throughput (requests per second) and errors (unexpected status codes)
+- p50/p95/p99 latency in milliseconds
+- database queries per request, from the MetricsMiddleware histograms
+
+Scenarios: register, login, content-list, content-search, content-detail,
+content-create (multipart with a pdf), category-list, category-detail.
+
+Save a run with --output and compare later runs to it with --baseline:
+
+    python -m benchmarks.load --contents 100000 --output baseline.json
+    python -m benchmarks.load --contents 100000 --baseline baseline.json
+
+Usage: python -m benchmarks.load [--users 100] [--categories 50] [--contents 10000]
+       [--requests 200] [--concurrency 8] [--scenarios ...] [--database path]
+       [--no-cache] [--output file] [--baseline file]
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.search import WORDS
+from benchmarks.utils import setup_django, percentile
+
+PASSWORD = 'Bench@1234'
+DUMMY_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main', 'tests', 'dummy.pdf')
+
+
+def seed(user_count, category_count, content_count, seed_value):
+    """
+    Tops the database up to the requested numbers of bench users
+    (bench-<n>@example.com, all with PASSWORD), categories and contents with the
+    generate_data command, so a seeded --database is reused as is.
+    """
+    from django.core.management import call_command
+    from main.models import User, Content, Category
+
+    call_command(
+        'generate_data',
+        users=max(0, user_count - User.objects.filter(email__startswith='bench-').count()),
+        categories=max(0, category_count - Category.objects.count()),
+        contents=max(0, content_count - Content.objects.count()),
+        email_prefix='bench', password=PASSWORD, seed=seed_value, stdout=io.StringIO(),
+    )
+
+
+class State:
+    """
+    What the scenarios need: tokens of a sample of bench users with their content ids.
+    """
+    def __init__(self, rng, sample_size=50):
+        from main.models import User, Content, Category
+        from main.tokens import CMSRefreshToken
+
+        users = list(User.objects.filter(email__startswith='bench-').order_by('id')[:sample_size])
+        content_ids = {}
+        for author_id, content_id in Content.objects.filter(author__in=users).values_list('author_id', 'id'):
+            content_ids.setdefault(author_id, []).append(content_id)
+        self.users = [
+            (user.email, str(CMSRefreshToken.for_user(user).access_token), content_ids.get(user.id, []))
+            for user in users
+        ]
+        self.categories = list(Category.objects.values_list('id', flat=True)[:1000])
+        with open(DUMMY_PDF, 'rb') as f:
+            self.pdf = f.read()
+        self.registrations = itertools.count()
+        self.run_id = '%x' % int(time.time())
+        self.rng = rng
+        self.lock = threading.Lock()
+
+    def user(self):
+        with self.lock:
+            return self.rng.choice(self.users)
+
+    def choice(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+
+def auth(token):
+    return {'Authorization': 'Bearer %s' % token}
+
+
+def register(session, url, state):
+    number = next(state.registrations)
+    return session.post(url + '/api/register/', json={
+        'email': 'load-%s-%d@example.com' % (state.run_id, number), 'full_name': 'Load', 'phone': '1234567890',
+        'pincode': '123456', 'password': 'Load@%d-pass' % number,
+    })
+
+
+def login(session, url, state):
+    email, token, content_ids = state.user()
+    return session.post(url + '/api/login/', json={'email': email, 'password': PASSWORD})
+
+
+def content_list(session, url, state):
+    email, token, content_ids = state.user()
+    return session.get(url + '/api/contents/', headers=auth(token))
+
+
+def content_search(session, url, state):
+    email, token, content_ids = state.user()
+    return session.get(url + '/api/contents/', params={'query': state.choice(WORDS)}, headers=auth(token))
+
+
+def content_detail(session, url, state):
+    email, token, content_ids = state.user()
+    content_id = state.choice(content_ids) if content_ids else 0
+    return session.get(url + '/api/contents/%d/' % content_id, headers=auth(token))
+
+
+def content_create(session, url, state):
+    email, token, content_ids = state.user()
+    return session.post(url + '/api/contents/create/', headers=auth(token), data={
+        'title': 'Load test', 'body': 'Load test body', 'summary': 'Load test summary',
+        'categories': [state.choice(state.categories)],
+    }, files={'pdf_file': ('load.pdf', state.pdf, 'application/pdf')})
+
+
+def category_list(session, url, state):
+    email, token, content_ids = state.user()
+    return session.get(url + '/api/categories/', headers=auth(token))
+
+
+def category_detail(session, url, state):
+    email, token, content_ids = state.user()
+    return session.get(url + '/api/categories/%d/' % state.choice(state.categories), headers=auth(token))
+
+
+# name: (request function, url name and method of the route, expected status codes)
+SCENARIOS = {
+    'register': (register, ('register', 'POST'), {201}),
+    'login': (login, ('login', 'POST'), {200}),
+    'content-list': (content_list, ('content-list', 'GET'), {200}),
+    'content-search': (content_search, ('content-list', 'GET'), {200}),
+    'content-detail': (content_detail, ('content-detail', 'GET'), {200}),
+    'content-create': (content_create, ('content-create', 'POST'), {201}),
+    'category-list': (category_list, ('category-list', 'GET'), {200}),
+    'category-detail': (category_detail, ('category-detail', 'GET'), {200}),
+}
+
+
+def start_server():
+    """
+    Serves the API on a free local port from a daemon thread and returns its url.
+    """
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        # headers and body are separate writes, Nagle would hold the body for the client's delayed ack
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:%d' % server.server_port
+
+
+def run_scenario(name, url, state, count, concurrency):
+    import requests
+    from main import metrics
+
+    function, route, expected = SCENARIOS[name]
+    sessions = threading.local()
+
+    def call(_):
+        if not hasattr(sessions, 'session'):
+            sessions.session = requests.Session()
+        start = time.perf_counter()
+        response = function(sessions.session, url, state)
+        response.content
+        return time.perf_counter() - start, response.status_code in expected
+
+    metrics.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(call, range(count)))
+    elapsed = time.perf_counter() - start
+    durations = [duration for duration, ok in results]
+    queries = metrics.QUERY_COUNT.series.get(route)
+    return {
+        'requests': count,
+        'errors': sum(1 for duration, ok in results if not ok),
+        'throughput': count / elapsed,
+        'p50': percentile(durations, 50) * 1000,
+        'p95': percentile(durations, 95) * 1000,
+        'p99': percentile(durations, 99) * 1000,
+        'queries': queries[-1] / queries[-2] if queries else None,
+    }
+
+
+def report(results, baseline=None):
+    print('%-16s %8s %7s %9s %9s %9s %9s %9s' % ('scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+    for name, result in results.items():
+        line = '%-16s %8d %7d %9.1f %9.2f %9.2f %9.2f %9s' % (
+            name, result['requests'], result['errors'], result['throughput'], result['p50'], result['p95'], result['p99'],
+            '-' if result['queries'] is None else '%.1f' % result['queries'],
+        )
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += '   req/s %+.0f%%  p95 %+.0f%%' % (
+                (result['throughput'] / previous['throughput'] - 1) * 100, (result['p95'] / previous['p95'] - 1) * 100,
+            )
+        print(line)
+
+
+def run(arguments):
+    from django.conf import settings
+
+    # serve like production: no debug query log, cache as configured unless --no-cache
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+    if arguments.no_cache:
+        settings.CONTENT_CACHE_TIMEOUT = 0
+    rng = random.Random(arguments.seed)
+    start = time.perf_counter()
+    seed(arguments.users, arguments.categories, arguments.contents, arguments.seed)
+    print('seeded %d users, %d categories, %d contents in %.1f s' % (
+        arguments.users, arguments.categories, arguments.contents, time.perf_counter() - start))
+    state = State(rng)
+    url = start_server()
+    results = {}
+    for name in arguments.scenarios:
+        results[name] = run_scenario(name, url, state, arguments.requests, arguments.concurrency)
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump({'arguments': vars(arguments), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--contents', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--database', help='SQLite file to seed and reuse (default: a temporary one)')
+    parser.add_argument('--no-cache', action='store_true', help='disable the response cache')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the generated data and requests')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results of an earlier --output')
+    arguments = parser.parse_args()
+    setup_django(arguments.database)
+    run(arguments)
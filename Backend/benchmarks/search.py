@@ -0,0 +1,87 @@
+"""
+Compares the content search paths at growing corpus sizes:
+
+- icontains: the original OR of four icontains filters joined through categories
+- fts5: main.search.SQLiteFTSBackend
+- memory: main.search.InMemorySearchBackend (main.inverted_index)
+
+Usage: python -m benchmarks.search [--sizes 10000 100000 1000000] [--repeat 20]
+"""
+import argparse
+import random
+
+from benchmarks.utils import setup_django, summary, timed
+
+WORDS = [
+    'annual', 'report', 'brochure', 'python', 'django', 'guide', 'market', 'finance', 'health', 'policy',
+    'travel', 'insurance', 'product', 'manual', 'release', 'notes', 'summary', 'quarter', 'growth', 'sales',
+    'design', 'system', 'network', 'security', 'customer', 'support', 'pricing', 'contract', 'legal', 'review',
+]
+QUERIES = ['python', 'annual report', 'secu', 'finance growth', 'nomatch']
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(size, rng):
+    from main.models import User, Content, Category
+    author = User.objects.filter(email='bench@example.com').first()
+    if author is None:
+        author = User.objects.create_user(email='bench@example.com', password='Bench@1234', full_name='Bench')
+        Category.objects.bulk_create([Category(name=word.title()) for word in WORDS])
+    categories = list(Category.objects.values_list('id', flat=True))
+    through = Content.categories.through
+    start = Content.objects.count()
+    batch = []
+    for number in range(start, size):
+        batch.append(Content(
+            title=sentence(rng, 3)[:30], body=sentence(rng, 30)[:300], summary=sentence(rng, 6)[:60],
+            pdf_file='pdfs/bench.pdf', author=author,
+        ))
+        if len(batch) == 5000:
+            Content.objects.bulk_create(batch)
+            batch = []
+    Content.objects.bulk_create(batch)
+    links = [
+        through(content_id=content_id, category_id=rng.choice(categories))
+        for content_id in Content.objects.filter(id__gt=start).values_list('id', flat=True)
+    ]
+    through.objects.bulk_create(links, batch_size=5000)
+
+
+def run(sizes, repeat):
+    from django.db.models import Q
+    from main.models import Content
+    from main.search import SQLiteFTSBackend, InMemorySearchBackend
+
+    rng = random.Random(0)
+    fts = SQLiteFTSBackend()
+    memory = InMemorySearchBackend()
+    fts.setup()
+    for size in sizes:
+        seed(size, rng)
+        print('\n== %d contents ==' % Content.objects.count())
+        _, build = timed(fts.rebuild)
+        print('fts5 build      %.1f s' % build[0])
+        _, build = timed(memory.rebuild)
+        print('memory build    %.1f s' % build[0])
+        for query in QUERIES:
+            icontains = lambda: list(Content.objects.filter(
+                Q(title__icontains=query) | Q(body__icontains=query) | Q(summary__icontains=query) | Q(categories__name__icontains=query)
+            ).distinct().values_list('id', flat=True))
+            matches, durations = timed(icontains, repeat=max(1, repeat // 5))
+            print('%-15r icontains %-32s (%d matches)' % (query, summary(durations), len(matches)))
+            matches, durations = timed(fts.search, query, repeat=repeat)
+            print('%-15r fts5      %-32s (top %d)' % (query, summary(durations), len(matches)))
+            matches, durations = timed(memory.search, query, repeat=repeat)
+            print('%-15r memory    %-32s (top %d)' % (query, summary(durations), len(matches)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    arguments = parser.parse_args()
+    setup_django()
+    run(sorted(arguments.sizes), arguments.repeat)
@@ -0,0 +1,63 @@
+"""
+Builds and renders the content list with ContentSerializer + JSONRenderer
+(the previous read path) and with ContentValuesSerializer + FastJSONRenderer,
+checks that both produce the same bytes and prints their throughput.
+
+Usage: python -m benchmarks.serializers [--contents 1000] [--categories 3] [--repeat 5]
+"""
+import argparse
+import statistics
+
+from benchmarks.utils import setup_django, timed
+
+
+def run(count, category_count, repeat):
+    from django.db import transaction
+    from django.test import RequestFactory
+    from django.test.utils import setup_test_environment
+    from rest_framework.renderers import JSONRenderer
+    from main.fast_serializers import ContentValuesSerializer
+    from main.models import User, Content, Category
+    from main.renderers import FastJSONRenderer, orjson
+    from main.serializers import ContentSerializer
+    from main.views import get_content_queryset
+
+    setup_test_environment()
+    author = User.objects.create_user(email='bench@example.com', password='Bench@1234', full_name='Bench')
+    categories = [Category.objects.create(name='Category %d' % number) for number in range(category_count)]
+    with transaction.atomic():
+        contents = Content.objects.bulk_create_with_ids([
+            Content(title='Title %d' % number, body='Body ' * 100, summary='Summary ' * 10, pdf_file='pdfs/bench %d.pdf' % number, pdf_page_count=1, author=author)
+            for number in range(count)
+        ])
+    Content.categories.through.objects.bulk_create([
+        Content.categories.through(content_id=content.id, category_id=category.id)
+        for content in contents for category in categories
+    ])
+    request = RequestFactory().get('/')
+
+    def drf():
+        queryset = get_content_queryset().order_by('id')
+        return JSONRenderer().render(ContentSerializer(queryset, many=True, context={'request': request}).data)
+
+    def fast():
+        serializer = ContentValuesSerializer()
+        return FastJSONRenderer().render(serializer.to_representation(serializer.get_queryset(get_content_queryset().order_by('id')), request))
+
+    expected, drf_durations = timed(drf, repeat=repeat)
+    output, fast_durations = timed(fast, repeat=repeat)
+    assert output == expected, 'fast serializers changed the output'
+    drf_time, fast_time = statistics.median(drf_durations), statistics.median(fast_durations)
+    print('%d contents x %d categories, %d bytes, orjson %s' % (count, category_count, len(output), 'installed' if orjson else 'missing'))
+    print('%-6s %8.1f ms  %8.0f contents/s' % ('drf', drf_time * 1000, count / drf_time))
+    print('%-6s %8.1f ms  %8.0f contents/s  (%.1fx)' % ('fast', fast_time * 1000, count / fast_time, drf_time / fast_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--contents', type=int, default=1000)
+    parser.add_argument('--categories', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args()
+    setup_django()
+    run(arguments.contents, arguments.categories, arguments.repeat)
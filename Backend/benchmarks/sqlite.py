@@ -0,0 +1,82 @@
+"""
+Read/write throughput of one SQLite file shared by N worker processes, like
+gunicorn workers, with the stock SQLite settings and with SQLITE_PRAGMAS.
+
+Every worker loops for --seconds, writing a content (create) with probability
+--writes and otherwise reading the newest 50 contents, and counts the
+operations that failed with 'database is locked'.
+
+Usage: python -m benchmarks.sqlite [--workers 1 4 8] [--seconds 5] [--writes 0.2]
+"""
+import argparse
+import multiprocessing
+import random
+import time
+
+from benchmarks.utils import setup_django
+
+PROFILES = {
+    # what Django does out of the box: deferred transactions, rollback journal, full sync, 5 s busy wait
+    'default': ('django.db.backends.sqlite3', {'journal_mode': 'delete', 'synchronous': 'full'}, 5),
+    'tuned': ('main.backends.sqlite3', None, 20),
+}
+
+
+def worker(arguments):
+    seconds, writes, seed = arguments
+    from django.db import OperationalError
+    from main.models import User, Content
+
+    rng = random.Random(seed)
+    author = User.objects.get(email='bench@example.com')
+    reads = written = locked = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < writes:
+                Content.objects.create(title='Bench', body='Bench body', summary='Bench', pdf_file='pdfs/bench.pdf', pdf_page_count=1, author=author)
+                written += 1
+            else:
+                list(Content.objects.order_by('-id').values('id', 'title', 'summary')[:50])
+                reads += 1
+        except OperationalError:
+            locked += 1
+    return reads, written, locked
+
+
+def run(worker_counts, seconds, writes):
+    from django.conf import settings
+    from django.db import connections
+    from main.models import User, Content
+
+    tuned_pragmas = dict(settings.SQLITE_PRAGMAS)
+    author = User.objects.create_user(email='bench@example.com', password='Bench@1234', full_name='Bench')
+    Content.objects.bulk_create([
+        Content(title='Bench', body='Bench body', summary='Bench', pdf_file='pdfs/bench.pdf', pdf_page_count=1, author=author)
+        for _ in range(1000)
+    ])
+    context = multiprocessing.get_context('fork')
+    for name, (engine, pragmas, timeout) in PROFILES.items():
+        settings.SQLITE_PRAGMAS = tuned_pragmas if pragmas is None else pragmas
+        settings.DATABASES['default'].update(ENGINE=engine, OPTIONS={'timeout': timeout})
+        # drop the connection object so the next one is built by the profile's engine
+        connections['default'].close()
+        del connections['default']
+        for count in worker_counts:
+            # forked workers must open their own connections
+            connections.close_all()
+            with context.Pool(count) as pool:
+                results = pool.map(worker, [(seconds, writes, seed) for seed in range(count)])
+            reads, written, locked = (sum(column) for column in zip(*results))
+            print('%-8s %2d workers  %8.0f reads/s  %7.0f writes/s  %5d locked' % (
+                name, count, reads / seconds, written / seconds, locked))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writes', type=float, default=0.2)
+    arguments = parser.parse_args()
+    setup_django()
+    run(arguments.workers, arguments.seconds, arguments.writes)
@@ -0,0 +1,52 @@
+import os
+import statistics
+import tempfile
+import time
+
+
+def setup_django(database_name=None):
+    """
+    Configures Django against a fresh SQLite database in a temporary directory
+    and creates the schema. Returns the temporary directory path.
+    """
+    directory = tempfile.mkdtemp(prefix='cms-bench-')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = database_name or os.path.join(directory, 'bench.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(directory, 'media')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    return directory
+
+
+def timed(function, *args, repeat=1, **kwargs):
+    """
+    Calls function repeat times and returns (last result, list of durations in seconds).
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+    return result, durations
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of a list of numbers.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summary(durations):
+    """
+    Formats durations (seconds) as median/p95 milliseconds.
+    """
+    return 'median %.2f ms, p95 %.2f ms' % (statistics.median(durations) * 1000, percentile(durations, 95) * 1000)
@@ -1,7 +1,14 @@
 from django.contrib import admin
-from .models import User,Content,Category
+from .models import User,Content,Category,Job
 # Register your models here.
 
 admin.site.register(User)
 admin.site.register(Content)
-admin.site.register(Category)
\ No newline at end of file
+admin.site.register(Category)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'locked_by', 'created_at')
+    list_filter = ('status', 'name')
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import USER_CLAIMS
+
+
+class TTLCache:
+    """
+    Small thread safe mapping whose entries expire ttl seconds after being set.
+    Beyond maxsize entries the oldest ones are dropped.
+    """
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+token_versions = TTLCache(getattr(settings, 'JWT_USER_CACHE_TTL', 60), getattr(settings, 'JWT_USER_CACHE_SIZE', 10000))
+
+
+def get_token_version(user_id):
+    """
+    Returns the current token version of a user, or None if the user does not exist.
+    It is read from the primary, where a revocation is visible right away.
+    """
+    version = token_versions.get(user_id)
+    if version is None:
+        version = User.objects.using(router.db_for_write(User)).filter(**{api_settings.USER_ID_FIELD: user_id}).values_list('token_version', flat=True).first()
+        if version is not None:
+            token_versions.set(user_id, version)
+    return version
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds request.user from the claims embedded by
+    main.tokens.CMSRefreshToken instead of loading the user row.
+
+    Only the token version of the user is checked, from a per process cache
+    kept for JWT_USER_CACHE_TTL seconds. Revoking tokens (User.revoke_tokens()
+    or changing the password, is_staff or is_active) therefore reaches other
+    processes within that delay. Tokens issued without the claims fall back to
+    the regular user query.
+    """
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            user = super().get_user(validated_token)
+            if validated_token.get('token_version', 0) != user.token_version:
+                raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+            return user
+        return self.get_claims_user(validated_token, get_token_version(validated_token[api_settings.USER_ID_CLAIM]))
+
+    def get_claims_user(self, validated_token, token_version):
+        if token_version is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if validated_token['token_version'] != token_version:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        if not validated_token['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        claims = {api_settings.USER_ID_FIELD: validated_token[api_settings.USER_ID_CLAIM]}
+        claims.update((claim, validated_token[claim]) for claim in USER_CLAIMS)
+        # from_db() takes the values in model field order; every other field is deferred and loaded on first access
+        field_names = [field.attname for field in User._meta.concrete_fields if field.attname in claims]
+        return User.from_db(router.db_for_read(User), field_names, [claims[name] for name in field_names])
+
+    async def authenticate_async(self, request):
+        """
+        authenticate() for async views. The token is checked on the event loop
+        and the database is only queried, in a worker thread, when the token
+        version of the user is not cached or the token carries no claims.
+        """
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if not all(claim in validated_token for claim in USER_CLAIMS):
+            return await sync_to_async(self.get_user)(validated_token), validated_token
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        token_version = token_versions.get(user_id)
+        if token_version is None:
+            token_version = await sync_to_async(get_token_version)(user_id)
+        return self.get_claims_user(validated_token, token_version), validated_token
@@ -0,0 +1,12 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Django's SQLite backend, but transactions take the write lock when they
+    begin. A deferred transaction that has already read cannot wait for the
+    lock held by another process: SQLite fails it with 'database is locked'
+    right away instead of honouring the busy timeout.
+    """
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,146 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+from .routers import pinned_to_primary
+
+KEY_PREFIX = 'cms'
+
+# response headers set by views that are cached with the data
+CACHED_HEADERS = ('Link',)
+
+
+def get_cache():
+    """
+    Returns the Django cache configured by the CONTENT_CACHE_ALIAS setting.
+    """
+    return caches[getattr(settings, 'CONTENT_CACHE_ALIAS', 'default')]
+
+
+def get_scope(user):
+    """
+    Staff users all see the same data, everybody else only sees their own contents.
+    """
+    return 'staff' if user.is_staff else 'user:%s' % user.pk
+
+
+def content_namespaces(request):
+    return ['categories', 'contents:%s' % get_scope(request.user)]
+
+
+def category_namespaces(request):
+    return ['categories']
+
+
+def get_generations(namespaces):
+    """
+    Returns the current generation number of every namespace. Cached responses
+    embed these numbers in their keys, so bumping a generation makes all
+    responses built from that namespace unreachable at once.
+    """
+    keys = ['%s:gen:%s' % (KEY_PREFIX, namespace) for namespace in namespaces]
+    generations = get_cache().get_many(keys)
+    return [generations.get(key, 0) for key in keys]
+
+
+def bump_generations(*namespaces):
+    """
+    Bumps the generations of the namespaces now, so the writing request reads
+    its own changes, and once more when the current transaction commits: other
+    requests may cache responses built from the old rows until then.
+    """
+    increment_generations(namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: increment_generations(namespaces))
+
+
+def increment_generations(namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        key = '%s:gen:%s' % (KEY_PREFIX, namespace)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add() and incr()
+            cache.set(key, 1, None)
+
+
+def invalidate_contents(author_ids):
+    """
+    Drops cached content responses of the given authors and of staff users.
+    """
+    bump_generations('contents:staff', *['contents:user:%s' % author_id for author_id in set(author_ids)])
+
+
+def invalidate_categories():
+    """
+    Drops cached category responses and every content response, which embed category names.
+    """
+    bump_generations('categories')
+
+
+def make_etag(data):
+    return '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    return '*' in candidates or etag in candidates or 'W/' + etag in candidates
+
+
+def cached_response(endpoint, namespaces):
+    """
+    Caches the successful responses of a read only function view per user scope,
+    endpoint, path arguments and query string, and answers If-None-Match with
+    304 Not Modified. namespaces(request) lists the generations the response
+    depends on; main.signals bumps them whenever the underlying rows change.
+
+    Apply it below @api_view and @permission_classes so request.user is set.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = getattr(settings, 'CONTENT_CACHE_TIMEOUT', 300)
+            if not timeout:
+                return view(request, *args, **kwargs)
+            if getattr(settings, 'DATABASE_REPLICAS', None) and not pinned_to_primary.get():
+                # a lagging replica may answer with rows older than the current generations,
+                # so only keep its responses as long as clients that wrote stay on the primary
+                timeout = min(timeout, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+            cache = get_cache()
+            variant = json.dumps([request.scheme, request.get_host(), kwargs, sorted(request.query_params.lists())])
+            key = '%s:response:%s:%s:%s:%s' % (
+                KEY_PREFIX, endpoint, get_scope(request.user),
+                '.'.join(str(generation) for generation in get_generations(namespaces(request))),
+                hashlib.md5(variant.encode()).hexdigest(),
+            )
+            cached = cache.get(key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != status.HTTP_200_OK:
+                    return response
+                headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+                cached = (make_etag(response.data), response.data, headers)
+                cache.set(key, cached, timeout)
+            etag, data, headers = cached
+            if etag_matches(request, etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(data, status=status.HTTP_200_OK, headers=headers)
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapper
+    return decorator
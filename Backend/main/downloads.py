@@ -0,0 +1,130 @@
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    Read only window of length bytes of an open file starting at offset start.
+
+    It keeps fileno() so WSGI servers that send file wrappers with sendfile()
+    (e.g. gunicorn) still do so without copying, bounded by Content-Length.
+    """
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Parses a single range Range header into (start, end) with end inclusive.
+
+    Returns None when the whole file should be sent (no header, a malformed
+    one or several ranges) and raises ValueError when the range lies outside
+    the file.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            raise ValueError('Empty suffix range.')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable.')
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """
+    A Range is only honoured when If-Range, if sent, still names the current file.
+    """
+    header = request.META.get('HTTP_IF_RANGE')
+    if not header:
+        return True
+    if header.startswith('"') or header.startswith('W/'):
+        return header == etag
+    return parse_http_date_safe(header) == last_modified
+
+
+def serve_file(request, storage, name, filename, etag=None):
+    """
+    Returns a response sending the stored file name with conditional request
+    (If-None-Match, If-Modified-Since) and single byte range support.
+
+    The PDF_SENDFILE_MODE setting hands the transfer over to the fronting web
+    server: 'x-accel-redirect' for nginx (files exposed under the internal
+    PDF_SENDFILE_PREFIX location) or 'x-sendfile' for Apache/lighttpd.
+    Otherwise the file is streamed with FileResponse, which the WSGI server
+    can send with os.sendfile().
+    """
+    size = storage.size(name)
+    last_modified = int(storage.get_modified_time(name).timestamp())
+    etag = quote_etag(etag) if etag else '"%x-%x"' % (last_modified, size)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        mode = getattr(settings, 'PDF_SENDFILE_MODE', None)
+        if mode == 'x-accel-redirect':
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Accel-Redirect'] = quote(getattr(settings, 'PDF_SENDFILE_PREFIX', '/protected/') + name)
+        elif mode == 'x-sendfile':
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Sendfile'] = storage.path(name)
+        else:
+            response = stream_file(request, storage, name, size, etag, last_modified)
+        if response.status_code != 416:
+            response['Content-Disposition'] = 'inline; filename="%s"' % filename
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def stream_file(request, storage, name, size, etag, last_modified):
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+    if byte_range is not None and not if_range_matches(request, etag, last_modified):
+        byte_range = None
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type='application/pdf')
+        response['Content-Length'] = size
+        return response
+    start, end = byte_range
+    response = FileResponse(FileRange(file, start, end - start + 1), status=206, content_type='application/pdf')
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    return response
@@ -0,0 +1,108 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+
+from .models import Content
+
+# fields of ContentSerializer, in output order
+CONTENT_FIELDS = ('id', 'title', 'body', 'summary', 'pdf_file', 'thumbnail', 'categories')
+# fields holding stored file names, output as absolute urls
+FILE_FIELDS = ('pdf_file', 'thumbnail')
+
+
+def use_fast_serializers():
+    return getattr(settings, 'FAST_READ_SERIALIZERS', True)
+
+
+def media_url_builder(request, storage):
+    """
+    Returns a function mapping a stored file name to the absolute url that
+    serializers.FileField would output. For file system storages the absolute
+    base url is built once and names are only quoted and appended to it.
+    """
+    if isinstance(storage, FileSystemStorage) and type(storage).url is FileSystemStorage.url:
+        prefix = request.build_absolute_uri(storage.base_url)
+        return lambda name: prefix + filepath_to_uri(name).lstrip('/') if name else None
+    return lambda name: request.build_absolute_uri(storage.url(name)) if name else None
+
+
+class ContentValuesSerializer:
+    """
+    Read only serializer producing the same output as ContentSerializer from
+    .values() rows: no model instance, serializer field or nested
+    CategorySerializer is built per item. Categories are loaded with one
+    query for all the rows, or read from category_data with
+    CONTENT_DENORMALIZED_CATEGORIES.
+
+    contents = ContentValuesSerializer().get_queryset(queryset)
+    data = ContentValuesSerializer().to_representation(contents, request)
+    """
+    def __init__(self, fields=CONTENT_FIELDS):
+        self.fields = [field for field in CONTENT_FIELDS if field in fields]
+
+    @property
+    def denormalized(self):
+        return getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False)
+
+    def get_queryset(self, contents):
+        # id is always read, pagination and categories are keyed by it
+        columns = ['id'] + [field for field in self.fields if field not in ('id', 'categories')]
+        if 'categories' in self.fields and self.denormalized:
+            columns.append('category_data')
+        return contents.prefetch_related(None).values(*columns)
+
+    def to_representation(self, rows, request):
+        rows = list(rows)
+        categories = self.get_categories(rows) if 'categories' in self.fields and not self.denormalized else None
+        urls = {
+            field: media_url_builder(request, Content._meta.get_field(field).storage)
+            for field in FILE_FIELDS if field in self.fields
+        }
+        data = []
+        for row in rows:
+            item = {}
+            for field in self.fields:
+                if field in urls:
+                    item[field] = urls[field](row[field])
+                elif field == 'categories':
+                    item[field] = row['category_data'] if categories is None else categories.get(row['id'], [])
+                else:
+                    item[field] = row[field]
+            data.append(item)
+        return data
+
+    def iter_representation(self, rows, request, chunk_size):
+        """
+        Yields the representation of rows (e.g. queryset.iterator()) one list of
+        at most chunk_size items at a time.
+        """
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield self.to_representation(chunk, request)
+
+    def get_categories(self, rows):
+        links = Content.categories.through.objects.filter(
+            content_id__in=[row['id'] for row in rows]
+        ).order_by('category_id').values_list('content_id', 'category_id', 'category__name')
+        categories = {}
+        for content_id, category_id, name in links:
+            categories.setdefault(content_id, []).append({'id': category_id, 'name': name})
+        return categories
+
+
+class CategoryValuesSerializer:
+    """
+    Read only serializer producing the same output as CategorySerializer from .values() rows.
+    """
+    fields = ('id', 'name')
+
+    def get_queryset(self, categories):
+        return categories.values(*self.fields)
+
+    def to_representation(self, rows, request=None):
+        return list(rows)
@@ -0,0 +1,32 @@
+from .fast_serializers import CONTENT_FIELDS, ContentValuesSerializer
+
+
+class ContentFieldset(ContentValuesSerializer):
+    """
+    Compact representation of contents restricted to some fields, selected with
+    ?fields=id,title or ?exclude=body,categories (comma separated).
+
+    Only the selected columns are read, with .values(), so no model instance
+    or nested serializer is built. Categories, when selected, take one more
+    query for the whole page (none with CONTENT_DENORMALIZED_CATEGORIES).
+    """
+    @classmethod
+    def from_request(cls, request):
+        """
+        Returns the fieldset asked for by the request, or None for the full representation.
+        Raises ValueError on unknown field names.
+        """
+        fields = request.query_params.get('fields')
+        exclude = request.query_params.get('exclude')
+        if fields is None and exclude is None:
+            return None
+        fields = cls.parse(fields) if fields is not None else set(CONTENT_FIELDS)
+        return cls(fields - cls.parse(exclude or ''))
+
+    @staticmethod
+    def parse(value):
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names - set(CONTENT_FIELDS)
+        if unknown:
+            raise ValueError('Unknown content fields: %s. Choose from %s.' % (', '.join(sorted(unknown)), ', '.join(CONTENT_FIELDS)))
+        return names
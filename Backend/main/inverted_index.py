@@ -0,0 +1,184 @@
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase word tokens.
+    """
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index with BM25 scoring.
+
+    Every term maps to two parallel arrays sorted by document id: the ids of
+    the documents containing it and the (field weighted) term frequencies.
+    Documents are added, replaced and removed one at a time, so the index
+    never needs a full rebuild after it has been loaded.
+
+    Queries are whitespace separated terms that must all match (AND); the
+    keyword OR separates alternative groups and a trailing * matches every
+    term starting with the given prefix, e.g. ``django guide OR pyth*``.
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._vocabulary = []
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._doc_authors = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id, fields, author_id=None):
+        """
+        Indexes a document given as (text, weight) pairs, replacing any
+        previous version of it.
+        """
+        frequencies = Counter()
+        for text, weight in fields:
+            for token in tokenize(text):
+                frequencies[token] += weight
+        with self._lock:
+            self.remove(doc_id)
+            for term, frequency in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array('q'), array('I'))
+                    insort(self._vocabulary, term)
+                ids, tfs = postings
+                if not ids or ids[-1] < doc_id:
+                    ids.append(doc_id)
+                    tfs.append(frequency)
+                else:
+                    position = bisect_left(ids, doc_id)
+                    ids.insert(position, doc_id)
+                    tfs.insert(position, frequency)
+            length = sum(frequencies.values())
+            self._doc_terms[doc_id] = tuple(frequencies)
+            self._doc_lengths[doc_id] = length
+            self._doc_authors[doc_id] = author_id
+            self._total_length += length
+
+    def remove(self, doc_id):
+        """
+        Drops a document from the index; unknown ids are ignored.
+        """
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                ids, tfs = self._postings[term]
+                position = bisect_left(ids, doc_id)
+                del ids[position]
+                del tfs[position]
+                if not ids:
+                    del self._postings[term]
+                    del self._vocabulary[bisect_left(self._vocabulary, term)]
+            self._total_length -= self._doc_lengths.pop(doc_id)
+            del self._doc_authors[doc_id]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._vocabulary.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._doc_authors.clear()
+            self._total_length = 0
+
+    def expand(self, prefix):
+        """
+        Returns every indexed term starting with prefix.
+        """
+        vocabulary = self._vocabulary
+        position = bisect_left(vocabulary, prefix)
+        terms = []
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            terms.append(vocabulary[position])
+            position += 1
+        return terms
+
+    def parse(self, query, prefix=False):
+        """
+        Parses a query into OR groups of AND clauses, where every clause is the
+        list of terms it may match. With prefix=True every word is treated as
+        a prefix, as if it ended with *.
+        """
+        groups = [[]]
+        for word in query.split():
+            if word == 'OR':
+                if groups[-1]:
+                    groups.append([])
+                continue
+            is_prefix = prefix or word.endswith('*')
+            for token in tokenize(word):
+                terms = self.expand(token) if is_prefix else [token]
+                groups[-1].append([term for term in terms if term in self._postings])
+        return [group for group in groups if group]
+
+    def search(self, query, prefix=False, author_id=None, limit=None):
+        """
+        Returns ids of documents matching query, highest BM25 score first.
+        """
+        with self._lock:
+            scores = {}
+            for group in self.parse(query, prefix=prefix):
+                for doc_id, score in self._search_group(group, author_id).items():
+                    scores[doc_id] = max(score, scores.get(doc_id, 0.0))
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return ranked[:limit] if limit is not None else ranked
+
+    def _search_group(self, clauses, author_id):
+        if not all(clauses):
+            return {}
+        # start from the rarest clause so later clauses only probe few candidates
+        clauses = sorted(clauses, key=lambda terms: sum(len(self._postings[term][0]) for term in terms))
+        scores = None
+        for terms in clauses:
+            if scores is None:
+                scores = {}
+                for term in terms:
+                    ids, tfs = self._postings[term]
+                    idf = self._idf(len(ids))
+                    for doc_id, tf in zip(ids, tfs):
+                        if author_id is None or self._doc_authors[doc_id] == author_id:
+                            scores[doc_id] = scores.get(doc_id, 0.0) + self._score(idf, tf, doc_id)
+            else:
+                matched = {}
+                for term in terms:
+                    ids, tfs = self._postings[term]
+                    idf = self._idf(len(ids))
+                    for doc_id in scores:
+                        position = bisect_left(ids, doc_id)
+                        if position < len(ids) and ids[position] == doc_id:
+                            matched[doc_id] = matched.get(doc_id, scores[doc_id]) + self._score(idf, tfs[position], doc_id)
+                scores = matched
+            if not scores:
+                break
+        return scores
+
+    def _idf(self, document_frequency):
+        count = len(self._doc_lengths)
+        return math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _score(self, idf, tf, doc_id):
+        average_length = self._total_length / len(self._doc_lengths)
+        norm = 1 - self.b + self.b * self._doc_lengths[doc_id] / average_length
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
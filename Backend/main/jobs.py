@@ -0,0 +1,231 @@
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# task name: function, filled by @task
+tasks = {}
+
+
+def task(batch=False):
+    """
+    Registers a function as a task that can be enqueued. The function of a batch
+    task takes a single list: workers merge the lists of the pending jobs of the
+    task into one call of at most JOB_BATCH_SIZE jobs, so it must accept any
+    list of (JSON, hashable) items at once.
+    """
+    def register(function):
+        function.task_name = '%s.%s' % (function.__module__, function.__name__)
+        function.batch = batch
+        tasks[function.task_name] = function
+        return function
+    return register
+
+
+def get_task(name):
+    if name not in tasks:
+        # registered when its module is imported, e.g. in a fresh worker process
+        import_string(name)
+    return tasks[name]
+
+
+def enqueue(function, *args, delay=0):
+    """
+    Queues a job calling function(*args) with JSON arguments. The job row is
+    written in the current transaction, so it is only run once the changes it
+    is about are committed and is dropped with them on rollback. After the commit
+    the background threads of this process (BACKGROUND_TASK_WORKERS) start
+    running due jobs; manage.py run_jobs runs them in separate processes.
+    JOB_QUEUE_ALWAYS_EAGER calls the function inline after the commit instead.
+    """
+    if getattr(settings, 'JOB_QUEUE_ALWAYS_EAGER', False):
+        transaction.on_commit(lambda: function(*args))
+        return None
+    job = Job.objects.create(
+        name=function.task_name, args=list(args), run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+    if getattr(settings, 'BACKGROUND_TASK_WORKERS', 2):
+        transaction.on_commit(wake_workers)
+    return job
+
+
+class Worker:
+    """
+    Claims due jobs and runs them. Claiming is an UPDATE of pending rows, so
+    workers in any number of threads and processes never run the same job.
+    Failed jobs are retried after JOB_RETRY_DELAY seconds, doubled on every
+    attempt, until they failed max_attempts times. Jobs locked for longer than
+    JOB_LOCK_TIMEOUT seconds (their worker died) are handed out again.
+    """
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or getattr(settings, 'JOB_BATCH_SIZE', 100)
+        self.name = '%s:%d' % (socket.gethostname()[:40], os.getpid())
+
+    def claim(self):
+        """
+        Locks and returns the oldest due job, with the other due jobs of the
+        same task up to batch_size for a batch task. Returns [] when no job is
+        due or another worker took them first. On databases supporting it
+        (PostgreSQL) the due rows are selected FOR UPDATE SKIP LOCKED, so
+        concurrent workers claim different jobs instead of racing for the same.
+        """
+        now = timezone.now()
+        # a token per claim: the rows this call locked, whatever other workers do meanwhile
+        token = '%s:%s' % (self.name, uuid.uuid4().hex[:12])
+        db = router.db_for_write(Job)
+        with transaction.atomic(using=db):
+            due = Job.objects.using(db).filter(status=Job.PENDING, run_at__lte=now)
+            if connections[db].features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            first = due.order_by('run_at', 'id').values_list('id', 'name').first()
+            if first is None:
+                return []
+            job_id, name = first
+            job_ids = [job_id]
+            if getattr(tasks.get(name), 'batch', False):
+                job_ids += due.filter(name=name).exclude(id=job_id).order_by('run_at', 'id').values_list('id', flat=True)[:self.batch_size - 1]
+            Job.objects.using(db).filter(id__in=job_ids, status=Job.PENDING).update(
+                status=Job.RUNNING, locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+            )
+        return list(Job.objects.using(db).filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+    def run(self, jobs):
+        """
+        Runs claimed jobs of one task: deletes them when it succeeds, schedules
+        a retry or marks them failed when it raises. When a merged batch raises,
+        its jobs are run again one by one, so only the jobs whose items fail are
+        retried; batch tasks must therefore be safe to run twice on an item.
+        """
+        try:
+            function = get_task(jobs[0].name)
+            if function.batch:
+                function(list(dict.fromkeys(item for job in jobs for item in job.args[0])))
+            else:
+                function(*jobs[0].args)
+        except Exception:
+            if len(jobs) > 1:
+                logger.warning('Batch of %d %s jobs failed, running them one by one', len(jobs), jobs[0].name, exc_info=True)
+                for job in jobs:
+                    self.run([job])
+                return
+            logger.exception('Job %s failed', jobs[0].name)
+            self.retry(jobs, traceback.format_exc())
+        else:
+            Job.objects.filter(id__in=[job.id for job in jobs]).delete()
+
+    def retry(self, jobs, error):
+        now = timezone.now()
+        delay = getattr(settings, 'JOB_RETRY_DELAY', 10)
+        for job in jobs:
+            if job.attempts >= job.max_attempts:
+                changes = {'status': Job.FAILED}
+            else:
+                changes = {'status': Job.PENDING, 'run_at': now + timedelta(seconds=delay * 2 ** (job.attempts - 1))}
+            Job.objects.filter(id=job.id).update(locked_by='', locked_at=None, last_error=error, **changes)
+
+    def release_stale(self):
+        timeout = timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 600))
+        return Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - timeout).update(
+            status=Job.PENDING, locked_by='', locked_at=None,
+        )
+
+    def run_pending(self, stop=None):
+        """
+        Runs due jobs until none is left (or stop, a threading.Event, is set)
+        and returns the number of jobs run.
+        """
+        self.release_stale()
+        count = 0
+        while stop is None or not stop.is_set():
+            jobs = self.claim()
+            if not jobs:
+                if not Job.objects.filter(status=Job.PENDING, run_at__lte=timezone.now()).exists():
+                    break
+                # another worker claimed them first
+                continue
+            self.run(jobs)
+            count += len(jobs)
+        return count
+
+
+def queue_stats():
+    """
+    Returns the number of jobs per (task name, status) and the age in seconds
+    of the oldest due pending job (0 when there is none).
+    """
+    counts = {
+        (row['name'], row['status']): row['count']
+        for row in Job.objects.values('name', 'status').annotate(count=Count('id')).order_by()
+    }
+    now = timezone.now()
+    oldest = Job.objects.filter(status=Job.PENDING, run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    return counts, (now - oldest).total_seconds() if oldest else 0
+
+
+def queue_metrics():
+    """
+    Returns the job queue gauges in the Prometheus text format.
+    """
+    counts, oldest = queue_stats()
+    return (
+        metrics.gauge('cms_jobs', 'Jobs in the queue per task and status.', ('task', 'status'), counts)
+        + metrics.gauge('cms_jobs_oldest_pending_seconds', 'Age of the oldest due pending job.', (), {(): oldest})
+    )
+
+
+# background threads of this process, woken after commits that enqueued jobs
+
+_executor = None
+_lock = threading.Lock()
+_running = 0
+_pending_wake = False
+
+
+def wake_workers():
+    """
+    Makes a background thread run the due jobs, unless BACKGROUND_TASK_WORKERS
+    threads are already at it, in which case one of them looks again when done.
+    """
+    global _executor, _running, _pending_wake
+    workers = getattr(settings, 'BACKGROUND_TASK_WORKERS', 2)
+    with _lock:
+        if _running >= workers:
+            _pending_wake = True
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cms-jobs')
+        _running += 1
+    _executor.submit(_drain)
+
+
+def _drain():
+    global _running, _pending_wake
+    try:
+        while True:
+            try:
+                Worker().run_pending()
+            except Exception:
+                logger.exception('Running queued jobs failed')
+            with _lock:
+                if not _pending_wake:
+                    _running -= 1
+                    return
+                _pending_wake = False
+    finally:
+        connections.close_all()
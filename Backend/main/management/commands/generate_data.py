@@ -0,0 +1,156 @@
+import hashlib
+import multiprocessing
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.conf import settings
+
+from main.cache import invalidate_categories
+from main.models import User, Content, Category, PdfDerivative
+from main.pdf import extract_text
+from main.search import get_search_backend
+
+WORDS = [
+    'annual', 'report', 'brochure', 'python', 'django', 'guide', 'market', 'finance', 'health', 'policy',
+    'travel', 'insurance', 'product', 'manual', 'release', 'notes', 'summary', 'quarter', 'growth', 'sales',
+    'design', 'system', 'network', 'security', 'customer', 'support', 'pricing', 'contract', 'legal', 'review',
+]
+
+
+def sentence(rng, words, max_length):
+    return ' '.join(rng.choices(WORDS, k=words))[:max_length].strip()
+
+
+def generate_pdf(seed):
+    """
+    Builds a small valid PDF of one to five pages of text, the same for the same seed.
+    Returns (bytes, page count, SHA-256 hex digest). Runs in worker processes.
+    """
+    rng = random.Random(seed)
+    page_count = rng.randint(1, 5)
+    # 1: catalog, 2: page tree, 3: font, then a page and its content stream per page
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(b'%d 0 R' % (4 + 2 * page) for page in range(page_count)), page_count),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for page in range(page_count):
+        text = b'BT /F1 14 Tf 72 720 Td (%s) Tj ET' % sentence(rng, 8, 80).encode()
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (5 + 2 * page))
+        objects.append(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(text), text))
+    data = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    data += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    data += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    data = bytes(data)
+    return data, page_count, hashlib.sha256(data).hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        'Adds synthetic users, categories and contents (with category links and generated pdfs) '
+        'in bulk. The same --seed on the same database generates the same rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--contents', type=int, default=10000)
+        parser.add_argument('--pdfs', type=int, default=100, help='distinct pdf files shared by the contents')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--processes', type=int, default=1, help='worker processes generating the pdfs')
+        parser.add_argument('--email-prefix', default='user', help='users get <prefix>-<n>@example.com emails')
+        parser.add_argument('--password', default='Generated@1234', help='password of every generated user')
+        parser.add_argument('--no-index', action='store_true', help='do not rebuild the search index')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+        self.create_users(options['users'], options['email_prefix'], options['password'], batch_size)
+        self.create_categories(options['categories'], batch_size)
+        if options['contents']:
+            authors = list(User.objects.order_by('id').values_list('id', flat=True))
+            categories = list(Category.objects.order_by('id').values_list('id', flat=True))
+            if not authors:
+                raise CommandError('Contents need at least one user.')
+            pdfs = self.create_pdfs(options['pdfs'], options['seed'], options['processes'])
+            self.create_contents(options['contents'], authors, categories, pdfs, rng, batch_size)
+            if not options['no_index']:
+                get_search_backend().rebuild()
+        invalidate_categories()
+        self.stdout.write(self.style.SUCCESS('Generated the data in %.1f s.' % (time.perf_counter() - start)))
+
+    def create_users(self, count, prefix, password, batch_size):
+        # one hash for everybody: hashing is by far the slowest part of creating a user
+        password = make_password(password)
+        existing = set(User.objects.filter(email__startswith=prefix + '-').values_list('email', flat=True))
+        emails = (email for email in ('%s-%d@example.com' % (prefix, number) for number in range(count + len(existing))) if email not in existing)
+        users = [User(email=email, full_name='Generated User', password=password) for email in emails]
+        User.objects.bulk_create(users[:count], batch_size=batch_size)
+        self.stdout.write('%d users' % count)
+
+    def create_categories(self, count, batch_size):
+        existing = {name.lower() for name in Category.objects.values_list('name', flat=True)}
+        names = (name for name in ('Category %d' % number for number in range(count + len(existing))) if name.lower() not in existing)
+        Category.objects.bulk_create([Category(name=name) for name in names][:count], batch_size=batch_size)
+        self.stdout.write('%d categories' % count)
+
+    def create_pdfs(self, count, seed, processes):
+        """
+        Generates and stores count pdfs with their derivatives (page count and text, no thumbnail),
+        returns their (name, page count, hash, text).
+        """
+        seeds = ['%s-pdf-%d' % (seed, number) for number in range(max(1, count))]
+        if processes > 1:
+            with multiprocessing.Pool(processes) as pool:
+                generated = pool.map(generate_pdf, seeds, chunksize=max(1, len(seeds) // (processes * 4)))
+        else:
+            generated = [generate_pdf(pdf_seed) for pdf_seed in seeds]
+        storage = Content._meta.get_field('pdf_file').storage
+        pdfs = []
+        for number, (data, page_count, digest) in enumerate(generated):
+            content = ContentFile(data)
+            # lets ContentAddressedStorage skip hashing the bytes again
+            content.sha256 = digest
+            pdfs.append((storage.save('pdfs/generated-%d.pdf' % number, content), page_count, digest, extract_text(data)))
+        PdfDerivative.objects.bulk_create([
+            PdfDerivative(sha256=digest, page_count=page_count, text=text) for name, page_count, digest, text in pdfs
+        ], ignore_conflicts=True)
+        self.stdout.write('%d pdfs' % len(pdfs))
+        return pdfs
+
+    def create_contents(self, count, authors, categories, pdfs, rng, batch_size):
+        through = Content.categories.through
+        denormalized = getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False)
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            contents = []
+            for _ in range(size):
+                name, page_count, digest, text = rng.choice(pdfs)
+                contents.append(Content(
+                    title=sentence(rng, 3, 30), body=sentence(rng, 40, 300), summary=sentence(rng, 8, 60),
+                    pdf_file=name, pdf_hash=digest, pdf_page_count=page_count, pdf_text=text, author_id=rng.choice(authors),
+                ))
+            with transaction.atomic():
+                Content.objects.bulk_create_with_ids(contents, batch_size=batch_size)
+                if categories:
+                    through.objects.bulk_create([
+                        through(content_id=content.id, category_id=category_id)
+                        for content in contents for category_id in rng.sample(categories, min(len(categories), rng.randint(1, 3)))
+                    ], batch_size=batch_size)
+                if denormalized:
+                    Content.objects.refresh_category_data([content.id for content in contents])
+            created += size
+            self.stdout.write('%d/%d contents' % (created, count))
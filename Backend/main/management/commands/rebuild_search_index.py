@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from main.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Re-indexes every content in the configured search backend.'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.setup()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt with %s.' % type(backend).__name__))
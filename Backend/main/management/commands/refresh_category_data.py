@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Content
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized categories of every content from the categories M2M.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        count = 0
+        while True:
+            ids = list(Content.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            Content.objects.refresh_category_data(ids)
+            count += len(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS('Refreshed the categories of %d contents.' % count))
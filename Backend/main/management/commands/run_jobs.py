@@ -0,0 +1,96 @@
+import multiprocessing
+import threading
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# models are imported in the functions: spawned worker processes import this module before django is set up
+
+
+def work(once, poll_interval, batch_size, stop):
+    """
+    Runs due jobs until stop is set, or until none is due with once.
+    """
+    from main.jobs import Worker
+
+    worker = Worker(batch_size)
+    try:
+        while not stop.is_set():
+            worker.run_pending(stop)
+            if once:
+                break
+            stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+def run_threads(count, arguments, stop):
+    """
+    Runs count worker threads in this process until they are done or interrupted.
+    """
+    if not apps.ready:
+        django.setup()
+    if count <= 1:
+        try:
+            return work(*arguments, stop)
+        except KeyboardInterrupt:
+            return
+    threads = [threading.Thread(target=work, args=arguments + (stop,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # let the threads finish the jobs they claimed
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the jobs of the queue (see main/jobs.py) with --threads worker threads in each of '
+        '--processes worker processes, polling for new and retried jobs until interrupted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help='worker threads per process')
+        parser.add_argument('--processes', type=int, default=1, help='worker processes, e.g. for CPU heavy tasks')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between looks at an empty queue')
+        parser.add_argument('--batch-size', type=int, default=None, help='jobs per call of a batch task (default JOB_BATCH_SIZE)')
+        parser.add_argument('--once', action='store_true', help='run the due jobs, then exit')
+        parser.add_argument('--stats', action='store_true', help='print the number of jobs per task and status, then exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            return self.print_stats()
+        arguments = (options['once'], options['poll_interval'], options['batch_size'])
+        if options['processes'] <= 1:
+            return run_threads(options['threads'], arguments, threading.Event())
+        # the worker processes must not share the connections of this one
+        connections.close_all()
+        stop = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=run_threads, args=(options['threads'], arguments, stop))
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
+
+    def print_stats(self):
+        from main.jobs import queue_stats
+
+        counts, oldest = queue_stats()
+        for (name, status), count in sorted(counts.items()):
+            self.stdout.write('%-50s %-8s %d' % (name, status, count))
+        self.stdout.write('oldest due pending job: %.0f s' % oldest)
@@ -0,0 +1,124 @@
+import threading
+import time
+from contextvars import ContextVar
+
+# upper bounds of the histogram buckets: seconds, queries and bytes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# set by main.middleware.MetricsMiddleware while a request runs
+current_request = ContextVar('current_request', default=None)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observations per label values, in the Prometheus text format.
+    """
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            counts = self.series.get(label_values)
+            if counts is None:
+                # one count per bucket, then +Inf, then the sum
+                counts = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            series = sorted((label_values, list(counts)) for label_values, counts in self.series.items())
+        for label_values, counts in series:
+            labels = ','.join('%s="%s"' % (label, escape(value)) for label, value in zip(self.labels, label_values))
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                lines.append('%s_bucket{%s,le="%s"} %s' % (self.name, labels, bound, count))
+            lines.append('%s_count{%s} %s' % (self.name, labels, counts[-2]))
+            lines.append('%s_sum{%s} %s' % (self.name, labels, counts[-1]))
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('cms_request_duration_seconds', 'Time to answer a request, streamed bodies included.', ('route', 'method', 'status'), LATENCY_BUCKETS)
+QUERY_COUNT = Histogram('cms_request_queries', 'Database queries per request.', ('route', 'method'), QUERY_BUCKETS)
+QUERY_SECONDS = Histogram('cms_request_query_duration_seconds', 'Time spent in database queries per request.', ('route', 'method'), LATENCY_BUCKETS)
+RENDER_SECONDS = Histogram('cms_request_render_duration_seconds', 'Time spent rendering the response body (JSON encoding) per request.', ('route', 'method'), LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram('cms_response_size_bytes', 'Size of response bodies, after compression.', ('route', 'method'), BYTES_BUCKETS)
+
+HISTOGRAMS = [REQUEST_SECONDS, QUERY_COUNT, QUERY_SECONDS, RENDER_SECONDS, RESPONSE_BYTES]
+
+
+class RequestMetrics:
+    """
+    What one request spent, filled in by MetricsMiddleware and record_query.
+    queries keeps (seconds, sql) pairs when slow requests are logged.
+    """
+    def __init__(self, keep_queries=False):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.render_start = None
+        self.render_seconds = 0.0
+        self.response_bytes = 0
+        self.queries = [] if keep_queries else None
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding the query to the metrics of the current request.
+    """
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.query_count += 1
+        metrics.query_seconds += seconds
+        if metrics.queries is not None:
+            metrics.queries.append((seconds, sql))
+
+
+def gauge(name, documentation, labels, samples):
+    """
+    Returns the Prometheus text lines of a gauge from {label values: value}.
+    """
+    lines = ['# HELP %s %s' % (name, documentation), '# TYPE %s gauge' % name]
+    for label_values, value in sorted(samples.items()):
+        if labels:
+            lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % (label, escape(label_value)) for label, label_value in zip(labels, label_values)), value))
+        else:
+            lines.append('%s %s' % (name, value))
+    return lines
+
+
+def expose(extra_lines=()):
+    """
+    Returns the metrics of this process, followed by extra_lines, in the Prometheus text exposition format.
+    """
+    lines = [line for histogram in HISTOGRAMS for line in histogram.expose()]
+    return '\n'.join(lines + list(extra_lines)) + '\n'
+
+
+def clear():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
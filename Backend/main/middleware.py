@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import re
+import time
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import metrics
+from .cache import KEY_PREFIX, get_cache
+from .routers import pinned_to_primary
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'cms_primary'
+
+# bodies shorter than this are not worth compressing
+COMPRESSION_MIN_LENGTH = 200
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml')
+
+
+def gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+# Accept-Encoding token -> factory of objects with compress(data) and flush()
+COMPRESSORS = {'gzip': gzip_compressor}
+
+try:
+    import zstandard
+    COMPRESSORS['zstd'] = lambda: zstandard.ZstdCompressor(level=3).compressobj()
+except ImportError:
+    pass
+
+try:
+    import brotli
+
+    class BrotliCompressor:
+        def __init__(self):
+            self.compressor = brotli.Compressor(quality=4)
+
+        def compress(self, data):
+            return self.compressor.process(data)
+
+        def flush(self):
+            return self.compressor.finish()
+
+    COMPRESSORS['br'] = BrotliCompressor
+except ImportError:
+    pass
+
+
+class ReplicaPinningMiddleware:
+    """
+    Gives clients read-your-writes consistency with read replicas.
+
+    Unsafe requests (POST, PUT, DELETE, ...) read from the primary, and a
+    successful one keeps the client on the primary for REPLICA_PIN_SECONDS,
+    longer than the replicas take to catch up: through a cookie and, as JWT
+    clients rarely keep cookies, through a cache entry per authenticated user
+    holding the time the pin ends.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.authentication = JWTAuthentication()
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        writes = self.writes(request)
+        token = pinned_to_primary.set(writes or PIN_COOKIE in request.COOKIES or self.user_is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            pinned_to_primary.reset(token)
+        if writes and response.status_code < 400:
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        writes = self.writes(request)
+        # the pins of users are in the cache, which may be remote
+        token = pinned_to_primary.set(writes or PIN_COOKIE in request.COOKIES or await sync_to_async(self.user_is_pinned)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            pinned_to_primary.reset(token)
+        if writes and response.status_code < 400:
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    def writes(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS')
+
+    def pin(self, request, response):
+        seconds = settings.REPLICA_PIN_SECONDS
+        response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        # DRF sets the user it authenticated on the underlying request too
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            get_cache().set(pin_key(user.pk), time.time() + seconds, seconds)
+
+    def user_is_pinned(self, request):
+        header = self.authentication.get_header(request)
+        if header is None:
+            return False
+        try:
+            raw_token = self.authentication.get_raw_token(header)
+            if raw_token is None:
+                return False
+            user_id = self.authentication.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM]
+        except (AuthenticationFailed, KeyError):
+            # left for authentication to reject
+            return False
+        return get_cache().get(pin_key(user_id), 0) > time.time()
+
+
+def pin_key(user_id):
+    return '%s:pin:user:%s' % (KEY_PREFIX, user_id)
+
+
+class CompressionMiddleware:
+    """
+    Compresses text and JSON responses, streamed ones chunk by chunk, with the
+    first encoding of COMPRESSION_ENCODINGS that the client accepts and that is
+    available: zstd needs zstandard and br needs brotli, gzip always works.
+    Files (pdf downloads, ranges, X-Accel-Redirect) are left alone.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if not self.is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.get_encoding(request)
+        if encoding is None:
+            return response
+        compressor = COMPRESSORS[encoding]()
+        if response.streaming:
+            response.streaming_content = self.compress_sequence(compressor, response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = compressor.compress(response.content) + compressor.flush()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # the compressed bytes differ from the identity ones
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def get_encoding(self, request):
+        accepted = {}
+        for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            token, _, params = part.strip().partition(';')
+            match = re.search(r'q=([0-9.]+)', params)
+            try:
+                accepted[token.strip().lower()] = float(match.group(1)) if match else 1.0
+            except ValueError:
+                pass
+        for encoding in getattr(settings, 'COMPRESSION_ENCODINGS', ['gzip']):
+            if encoding in COMPRESSORS and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def is_compressible(self, response):
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return False
+        if response.has_header('X-Accel-Redirect') or response.has_header('X-Sendfile'):
+            return False
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return False
+        return response.streaming or len(response.content) >= COMPRESSION_MIN_LENGTH
+
+    def compress_sequence(self, compressor, sequence):
+        for item in sequence:
+            data = compressor.compress(item)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database queries and time, rendering time and body
+    size of every request per route name into main.metrics, served by
+    metrics_view. Streamed responses are measured until their last chunk.
+
+    Requests slower than METRICS_SLOW_REQUEST_SECONDS are logged with their
+    slowest queries. Keep it first in MIDDLEWARE so it sees the whole request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # async mode, as in Django's MiddlewareMixin: __call__ returns __acall__(request)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+        self.install_query_recorder()
+        request_metrics = self.new_request_metrics()
+        token = metrics.current_request.set(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        return self.measure(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return await self.get_response(request)
+        # the connections of the thread running the request's views and queries
+        await sync_to_async(self.install_query_recorder, thread_sensitive=True)()
+        request_metrics = self.new_request_metrics()
+        token = metrics.current_request.set(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        return self.measure(request, response, request_metrics)
+
+    def install_query_recorder(self):
+        for connection in connections.all():
+            if metrics.record_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(metrics.record_query)
+
+    def new_request_metrics(self):
+        return metrics.RequestMetrics(keep_queries=getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None) is not None)
+
+    def measure(self, request, response, request_metrics):
+        if request_metrics.render_start is not None:
+            # DRF responses are rendered after process_template_response, on the way out
+            request_metrics.render_seconds = time.perf_counter() - request_metrics.render_start
+        if response.streaming and getattr(response, 'file_to_stream', None) is None:
+            response.streaming_content = self.measure_stream(request, response, response.streaming_content, request_metrics)
+        else:
+            # files may be sent by the server's wsgi.file_wrapper, bypassing streaming_content
+            request_metrics.response_bytes = int(response.get('Content-Length') or 0) if response.streaming else len(response.content)
+            self.record(request, response, request_metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        request_metrics = metrics.current_request.get()
+        if request_metrics is not None:
+            request_metrics.render_start = time.perf_counter()
+        return response
+
+    def measure_stream(self, request, response, streaming_content, request_metrics):
+        chunks = iter(streaming_content)
+        try:
+            while True:
+                # the chunks are produced here, so their queries count for this request
+                token = metrics.current_request.set(request_metrics)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    metrics.current_request.reset(token)
+                request_metrics.response_bytes += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, request_metrics)
+
+    def record(self, request, response, request_metrics):
+        seconds = time.perf_counter() - request_metrics.start
+        route = request.resolver_match.url_name if request.resolver_match is not None else 'unmatched'
+        method = request.method
+        metrics.REQUEST_SECONDS.observe(seconds, route, method, response.status_code)
+        metrics.QUERY_COUNT.observe(request_metrics.query_count, route, method)
+        metrics.QUERY_SECONDS.observe(request_metrics.query_seconds, route, method)
+        metrics.RENDER_SECONDS.observe(request_metrics.render_seconds, route, method)
+        metrics.RESPONSE_BYTES.observe(request_metrics.response_bytes, route, method)
+        slow = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+        if slow is not None and seconds >= slow:
+            slowest = sorted(request_metrics.queries, key=lambda query: query[0], reverse=True)[:5]
+            logger.warning(
+                'Slow request %s %s (%s, %s) took %.3fs, %d queries in %.3fs, rendering %.3fs. Slowest queries:\n%s',
+                method, request.get_full_path(), route, response.status_code, seconds,
+                request_metrics.query_count, request_metrics.query_seconds, request_metrics.render_seconds,
+                '\n'.join('%.3fs %s' % query for query in slowest),
+            )
@@ -1,6 +1,10 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, connections, router, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.validators import MaxLengthValidator
+from django.db.models.functions import Lower
+from django.utils import timezone
+from .storage import get_pdf_storage
 # Create your models here.
 
 class CustomUserManager(BaseUserManager):
@@ -40,28 +44,234 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # embedded in issued tokens, bumping it revokes every token of the user
+    token_version = models.PositiveIntegerField(default=0)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['full_name', 'phone', 'pincode']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what the issued tokens claim so changing it can revoke them
+        instance._loaded_claims = (instance.__dict__.get('is_staff'), instance.__dict__.get('is_active'))
+        return instance
+
+    def claims_changed(self):
+        """
+        Returns True when the password, is_staff or is_active changed since the user was loaded.
+        """
+        if self._password is not None:
+            return True
+        loaded_claims = getattr(self, '_loaded_claims', None)
+        return loaded_claims is not None and loaded_claims != (self.__dict__.get('is_staff'), self.__dict__.get('is_active'))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self.claims_changed():
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_claims = (self.__dict__.get('is_staff'), self.__dict__.get('is_active'))
+
+    def revoke_tokens(self):
+        """
+        Invalidates every access and refresh token issued to the user so far.
+        """
+        self.token_version = models.F('token_version') + 1
+        self.save(update_fields=['token_version'])
+        self.refresh_from_db(fields=['token_version'])
+
     def __str__(self):
         return self.email
     
+class CategoryManager(models.Manager):
+    def filter_name(self, name):
+        """
+        Case-insensitive exact lookup by name, served by the index on LOWER(name).
+        """
+        return self.alias(lower_name=Lower('name')).filter(lower_name=Lower(models.Value(name)))
+
+
 class Category(models.Model):
-    name = models.CharField(max_length=50)
+    # unique as stored; CategorySerializer also refuses names differing only in case
+    name = models.CharField(max_length=50, unique=True)
+
+    objects = CategoryManager()
+
+    class Meta:
+        indexes = [
+            models.Index(Lower('name'), name='category_name_lower_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+DENORMALIZED_CATEGORY_FIELDS = ['category_data', 'category_names']
+
+
+class ContentManager(models.Manager):
+    def bulk_create_with_ids(self, contents, batch_size=500):
+        """
+        Inserts contents with bulk_create and makes sure every object gets its primary key,
+        even on backends that cannot return ids from a bulk insert. Must run inside a transaction.
+        Other backends without returned ids (MySQL) insert the contents one by one with save().
+        """
+        db = self._db or router.db_for_write(self.model)
+        connection = connections[db]
+        if not connection.in_atomic_block:
+            raise transaction.TransactionManagementError('bulk_create_with_ids() must run inside transaction.atomic().')
+        if connection.vendor != 'sqlite' and not connection.features.can_return_rows_from_bulk_insert:
+            # concurrent inserts can interleave with ours, the ids cannot be read back
+            for content in contents:
+                content.save(force_insert=True, using=db)
+            return contents
+        contents = self.using(db).bulk_create(contents, batch_size=batch_size)
+        if contents and contents[0].pk is None:
+            # SQLite has a single writer, so inside our transaction the newest rows are ours, in insertion order
+            ids = list(self.using(db).order_by('-id').values_list('id', flat=True)[:len(contents)])
+            for content, pk in zip(contents, reversed(ids)):
+                content.pk = pk
+                content._state.adding = False
+        return contents
+
+    def set_categories(self, categories_by_content):
+        """
+        Replaces the categories of many contents at once, given a mapping of content id
+        to category ids. Only the difference with the current links is written, with one
+        bulk insert and one delete on the through table. The current links are read
+        from the database written to, so a lagging replica cannot skew the difference.
+        """
+        through = self.model.categories.through
+        db = self._db or router.db_for_write(through)
+        wanted = {(content_id, category_id) for content_id, category_ids in categories_by_content.items() for category_id in category_ids}
+        current = {
+            (link['content_id'], link['category_id']): link['id']
+            for link in through.objects.using(db).filter(content_id__in=categories_by_content).values('id', 'content_id', 'category_id')
+        }
+        stale = [link_id for pair, link_id in current.items() if pair not in wanted]
+        if stale:
+            through.objects.using(db).filter(id__in=stale).delete()
+        missing = [through(content_id=content_id, category_id=category_id) for content_id, category_id in wanted if (content_id, category_id) not in current]
+        if missing:
+            through.objects.using(db).bulk_create(missing, batch_size=500)
+        if (stale or missing) and getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False):
+            changed_ids = {pair[0] for pair, link_id in current.items() if link_id in stale} | {link.content_id for link in missing}
+            self.refresh_category_data(changed_ids)
+        return bool(stale or missing)
+
+    def refresh_category_data(self, content_ids, batch_size=500):
+        """
+        Rewrites the denormalized category_data and category_names of the given contents
+        from the categories M2M, which stays the source of truth. The links (and content_ids,
+        when it is a queryset) are read from the database written to, in one transaction with
+        the updates, as a replica may not have the change being copied yet.
+        """
+        through = self.model.categories.through
+        db = self._db or router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            if isinstance(content_ids, models.QuerySet):
+                content_ids = content_ids.using(db)
+            content_ids = list(content_ids)
+            for start in range(0, len(content_ids), batch_size):
+                data = {content_id: [] for content_id in content_ids[start:start + batch_size]}
+                links = through.objects.using(db).filter(content_id__in=data).order_by('category_id').values_list('content_id', 'category_id', 'category__name')
+                for content_id, category_id, name in links:
+                    data[content_id].append({'id': category_id, 'name': name})
+                contents = [
+                    self.model(id=content_id, category_data=categories, category_names=' '.join(category['name'] for category in categories))
+                    for content_id, categories in data.items()
+                ]
+                self.using(db).bulk_update(contents, DENORMALIZED_CATEGORY_FIELDS, batch_size=batch_size)
+
+
 class Content(models.Model):
     title = models.CharField(max_length=30,validators=[MaxLengthValidator(30, "Title should not exceed 30 characters.")])
     body = models.CharField(max_length=300, validators=[MaxLengthValidator(300, "Body text should not exceed 300 characters.")])
     summary = models.CharField(max_length=60, validators=[MaxLengthValidator(60, "Summary should not exceed 60 characters.")])
-    pdf_file = models.FileField(upload_to='pdfs/')
+    # indexed so main.signals can tell cheaply whether a stored file is still referenced
+    pdf_file = models.FileField(upload_to='pdfs/', storage=get_pdf_storage, db_index=True)
+    # filled from the upload, and in the background once the pdf has been processed (None until then)
+    pdf_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    pdf_page_count = models.PositiveIntegerField(null=True, blank=True)
+    # derived from the pdf in the background too (see main.tasks.process_pdfs): its text, searched
+    # with the other text fields, and a png of its first page when a renderer is available
+    pdf_text = models.TextField(blank=True, editable=False)
+    thumbnail = models.FileField(upload_to='thumbnails/', storage=get_pdf_storage, blank=True, editable=False, db_index=True)
     categories = models.ManyToManyField(Category,blank=True)
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # read optimized copy of the categories, [{"id": .., "name": ..}] and the names joined by spaces,
+    # only written by ContentManager.refresh_category_data when CONTENT_DENORMALIZED_CATEGORIES is on;
+    # load contents with both deferred to save them, save() then leaves a fresher copy alone
+    category_data = models.JSONField(default=list, blank=True, editable=False)
+    category_names = models.TextField(blank=True, editable=False)
+    # indexed together with id below, which also serves author lookups
+    author = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+
+    objects = ContentManager()
+
+    class Meta:
+        indexes = [
+            # per author listing in id (cursor) order
+            models.Index(fields=['author', 'id'], name='content_author_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored file and its hash so replacing it can release the old one and its derivatives
+        instance._loaded_pdf_file = instance.__dict__.get('pdf_file')
+        instance._loaded_pdf_hash = instance.__dict__.get('pdf_hash')
+        return instance
+
+    def __str__(self):
+        return self.title
+
+class PdfDerivative(models.Model):
+    """
+    What main.tasks.process_pdfs derives from a pdf, computed once per distinct
+    file: contents whose pdf_hash is already here get a copy without their pdf
+    being read again. Dropped once no content has the hash any more.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    text = models.TextField(blank=True)
+    thumbnail = models.FileField(upload_to='thumbnails/', storage=get_pdf_storage, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class Job(models.Model):
+    """
+    A queued call of a task, run by the workers of main/jobs.py. Done jobs are deleted,
+    jobs failing max_attempts times are kept as failed with their last error.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    # dotted path of the task function and its JSON arguments
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # not run before, pushed back on every retry
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # workers claim the oldest due pending jobs
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return '%s%r' % (self.name, self.args)
@@ -0,0 +1,61 @@
+from django.conf import settings
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class ContentCursorPagination(CursorPagination):
+    """
+    Keyset pagination for contents ordered by primary key.
+
+    The opaque ``cursor`` query parameter encodes the last seen id, so every
+    page is fetched with ``WHERE id > <cursor> ORDER BY id LIMIT <size>`` and
+    deep pages cost the same as the first one.
+    """
+    ordering = 'id'
+    page_size = getattr(settings, 'CONTENT_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'CONTENT_MAX_PAGE_SIZE', 500)
+
+    def is_requested(self, request):
+        """
+        Pagination is opt-in so existing clients keep getting a plain list.
+        """
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+
+class SearchCursorPagination(ContentCursorPagination):
+    """
+    Pagination of search results in relevance order.
+
+    The opaque ``cursor`` holds the offset into the ranked matches, which the
+    search backend skips itself, so pages go past CONTENT_SEARCH_MAX_RESULTS.
+    Unpaginated searches get the first max_results matches of the backend and
+    get_next_link() points to the page following them, if any.
+    """
+    offset_cutoff = None
+
+    def paginate_search(self, backend, queryset, query, request, author=None):
+        """
+        Returns the requested page of the contents of queryset matching query.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        if self.is_requested(request):
+            self.page_size = self.get_page_size(request)
+            cursor = self.decode_cursor(request)
+            self.offset = cursor.offset if cursor is not None else 0
+        else:
+            self.page_size, self.offset = backend.max_results, 0
+        # one more than a page tells whether another one follows
+        results = list(backend.filter_queryset(queryset, query, author=author, offset=self.offset, limit=self.page_size + 1))
+        self.has_next = len(results) > self.page_size
+        return results[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=self.offset + self.page_size, reverse=False, position=None))
+
+    def get_previous_link(self):
+        if not self.offset:
+            return None
+        return self.encode_cursor(Cursor(offset=max(0, self.offset - self.page_size), reverse=False, position=None))
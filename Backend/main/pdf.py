@@ -0,0 +1,384 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zlib
+
+from .uploadhandlers import PDF_HEADER
+
+COUNT_RE = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b', re.S)
+PAGE_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+
+logger = logging.getLogger(__name__)
+
+
+def is_pdf(file):
+    """
+    Checks the %PDF- header of a file object and rewinds it.
+    """
+    file.seek(0)
+    header = file.read(len(PDF_HEADER))
+    file.seek(0)
+    return header == PDF_HEADER
+
+
+def file_sha256(file, chunk_size=64 * 1024):
+    """
+    SHA-256 hex digest of a Django File, read in chunks.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks(chunk_size):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def count_pages(data):
+    """
+    Counts the pages of a PDF given as bytes, from the /Count of the page tree root
+    or, failing that, from the number of /Type /Page objects. Returns None if the
+    page tree lives in compressed object streams and cannot be read this way.
+    """
+    counts = [int(first or second) for first, second in COUNT_RE.findall(data)]
+    if counts:
+        return max(counts)
+    return len(PAGE_RE.findall(data)) or None
+
+
+# text extraction without dependencies: page content streams, FlateDecode, ToUnicode CMaps
+
+OBJECT_RE = re.compile(rb'(\d+)\s+\d+\s+obj\b(.*?)\bendobj', re.S)
+STREAM_RE = re.compile(rb'\bstream\r?\n')
+REFERENCE_RE = re.compile(rb'(\d+)\s+\d+\s+R\b')
+NAMED_REFERENCE_RE = re.compile(rb'/([^\s/\[\]()<>{}%]+)\s*(\d+)\s+\d+\s+R\b')
+HEX_RE = re.compile(rb'<[0-9A-Fa-f\s]*>')
+BFCHAR_RE = re.compile(rb'beginbfchar(.*?)endbfchar', re.S)
+BFRANGE_RE = re.compile(rb'beginbfrange(.*?)endbfrange', re.S)
+BFRANGE_ENTRY_RE = re.compile(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*(<[0-9A-Fa-f]+>|\[[^\]]*\])')
+CONTENT_TOKEN_RE = re.compile(rb'''
+    \((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)   # literal string, with one level of nested parentheses
+  | <[0-9A-Fa-f\s]*>                            # hex string
+  | [\[\]]
+  | [+-]?(?:\d+\.?\d*|\.\d+)                   # number
+  | /[^\s/\[\]()<>{}%]*                        # name
+  | [^\s/\[\]()<>{}%]+                         # operator
+''', re.S | re.X)
+NUMBER_RE = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)$')
+LITERAL_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+LITERAL_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|\r\n|[\r\n]|.)', re.S)
+# bytes inflated from the compressed streams of one document at most
+DECODED_MAX_LENGTH = 32 * 1024 * 1024
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+
+def read_objects(data, decode):
+    """
+    Returns {object number: (dictionary bytes, raw stream or None)} for the
+    objects of a PDF, including the ones packed in object streams, which are
+    decoded with decode (a StreamDecoder) to find them. Other streams are left
+    to be decoded when they are needed.
+    """
+    objects = {}
+    for match in OBJECT_RE.finditer(data):
+        body = match.group(2)
+        stream = STREAM_RE.search(body)
+        if stream is None:
+            objects[int(match.group(1))] = (body, None)
+            continue
+        objects[int(match.group(1))] = (body[:stream.start()], body[stream.end():body.rfind(b'endstream')])
+    for dictionary, raw in list(objects.values()):
+        if raw is not None and b'/ObjStm' in dictionary:
+            stream = decode(dictionary, raw)
+            if stream is not None:
+                objects.update(read_object_stream(dictionary, stream))
+    return objects
+
+
+class StreamDecoder:
+    """
+    Decodes the streams of one PDF, unfiltered or FlateDecode ones, and returns
+    None for the others. Deflate expands over 1000 times, so the bytes inflated
+    per document are capped at max_length: a small upload cannot make it
+    allocate gigabytes, later streams are cut or skipped instead.
+    """
+    def __init__(self, max_length=DECODED_MAX_LENGTH):
+        self.remaining = max_length
+
+    def __call__(self, dictionary, raw):
+        if b'/Filter' not in dictionary:
+            return raw
+        if b'/FlateDecode' not in dictionary or re.search(rb'/(?:DCT|JPX|JBIG2|CCITTFax|LZW|ASCII85|ASCIIHex|RunLength)Decode', dictionary):
+            return None
+        if self.remaining <= 0:
+            return None
+        try:
+            # decompressobj tolerates the end of line some writers leave before endstream
+            stream = zlib.decompressobj().decompress(raw, self.remaining)
+        except zlib.error:
+            return None
+        self.remaining -= len(stream)
+        return stream
+
+
+def read_object_stream(dictionary, stream):
+    first = re.search(rb'/First\s+(\d+)', dictionary)
+    if first is None:
+        return {}
+    first = int(first.group(1))
+    header = [int(number) for number in stream[:first].split()]
+    offsets = list(zip(header[::2], header[1::2]))
+    objects = {}
+    for index, (number, offset) in enumerate(offsets):
+        end = first + offsets[index + 1][1] if index + 1 < len(offsets) else len(stream)
+        objects[number] = (stream[first + offset:end], None)
+    return objects
+
+
+def parse_cmap(cmap):
+    """
+    Reads the bfchar and bfrange mappings of a ToUnicode CMap into
+    ({code bytes: text}, code length in bytes).
+    """
+    mapping = {}
+    for block in BFCHAR_RE.findall(cmap):
+        values = [decode_hex(value) for value in HEX_RE.findall(block)]
+        for code, text in zip(values[::2], values[1::2]):
+            mapping[code] = text.decode('utf-16-be', 'ignore')
+    for block in BFRANGE_RE.findall(cmap):
+        for low, high, target in BFRANGE_ENTRY_RE.findall(block):
+            width = len(low) // 2
+            low, high = int(low, 16), int(high, 16)
+            if high - low > 0xffff:
+                continue
+            if target.startswith(b'['):
+                texts = [decode_hex(value).decode('utf-16-be', 'ignore') for value in HEX_RE.findall(target)]
+            else:
+                start = decode_hex(target)
+                base = int.from_bytes(start, 'big')
+                texts = [(base + offset).to_bytes(len(start), 'big').decode('utf-16-be', 'ignore') for offset in range(high - low + 1)]
+            for code, text in zip(range(low, high + 1), texts):
+                mapping[code.to_bytes(width, 'big')] = text
+    width = len(next(iter(mapping))) if mapping else 1
+    return mapping, width
+
+
+def decode_literal(token):
+    def unescape(match):
+        escape = match.group(1)
+        if escape[:1].isdigit():
+            return bytes([int(escape, 8) & 0xff])
+        if escape in (b'\r\n', b'\r', b'\n'):
+            return b''
+        return LITERAL_ESCAPES.get(escape, escape)
+    return LITERAL_ESCAPE_RE.sub(unescape, token[1:-1])
+
+
+def decode_hex(token):
+    digits = re.sub(rb'\s', b'', token[1:-1])
+    # an odd last digit is followed by an implicit 0
+    return bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode())
+
+
+def decode_string(value, cmap):
+    if cmap is None:
+        # standard 14 fonts and simple encodings are close enough to Latin-1
+        return value.decode('latin-1')
+    mapping, width = cmap
+    return ''.join(mapping.get(value[index:index + width], '') for index in range(0, len(value), width))
+
+
+def page_contents(objects, decode):
+    """
+    Returns the content streams of the pages decoded with decode, in page tree
+    order when the tree can be followed and in file order otherwise.
+    """
+    def contents_of(dictionary):
+        match = re.search(rb'/Contents\s*(\[[^\]]*\]|\d+\s+\d+\s+R)', dictionary)
+        if match is None:
+            return []
+        return [int(number) for number in REFERENCE_RE.findall(match.group(1))]
+
+    def walk(number, seen):
+        if number in seen or number not in objects:
+            return []
+        seen.add(number)
+        dictionary = objects[number][0]
+        kids = re.search(rb'/Kids\s*\[([^\]]*)\]', dictionary)
+        if kids is None:
+            return contents_of(dictionary)
+        return [stream for kid in REFERENCE_RE.findall(kids.group(1)) for stream in walk(int(kid), seen)]
+
+    streams = []
+    for dictionary, _ in objects.values():
+        if re.search(rb'/Type\s*/Catalog\b', dictionary):
+            pages = re.search(rb'/Pages\s+(\d+)\s+\d+\s+R', dictionary)
+            if pages is not None:
+                streams = walk(int(pages.group(1)), set())
+            break
+    if not streams:
+        streams = [
+            stream for dictionary, _ in objects.values() if PAGE_RE.search(dictionary)
+            for stream in contents_of(dictionary)
+        ]
+    contents = (objects.get(number, (b'', None)) for number in streams)
+    streams = (decode(dictionary, raw) for dictionary, raw in contents if raw is not None)
+    return [stream for stream in streams if stream]
+
+
+def font_cmaps(objects, decode):
+    """
+    Maps font resource names (F1, ...) to the parsed ToUnicode CMap of their font,
+    decoded with decode. Names are shared by all pages, which is right for the
+    usual one font set per document.
+    """
+    cmaps = {}
+    for number, (dictionary, _) in objects.items():
+        match = re.search(rb'/ToUnicode\s+(\d+)\s+\d+\s+R', dictionary)
+        if match is None:
+            continue
+        cmap_dictionary, raw = objects.get(int(match.group(1)), (b'', None))
+        cmap = decode(cmap_dictionary, raw) if raw is not None else None
+        if cmap:
+            cmaps[number] = parse_cmap(cmap)
+    fonts = {}
+    for dictionary, _ in objects.values():
+        for name, number in NAMED_REFERENCE_RE.findall(dictionary):
+            if int(number) in cmaps:
+                fonts[name] = cmaps[int(number)]
+    return fonts
+
+
+def content_text(content, fonts):
+    """
+    Interprets the text showing operators of a content stream: strings of Tj,
+    TJ, ' and ", a new line when the text moves down or a text object ends and a
+    space for wide TJ kerning gaps.
+    """
+    parts = []
+    operands = []
+    array = None
+    cmap = None
+    for token in CONTENT_TOKEN_RE.findall(content):
+        first = token[:1]
+        if first == b'(' or first == b'<':
+            value = decode_literal(token) if first == b'(' else decode_hex(token)
+            (array if array is not None else operands).append(decode_string(value, cmap))
+        elif token == b'[':
+            array = []
+        elif token == b']':
+            operands.append(array or [])
+            array = None
+        elif NUMBER_RE.match(token):
+            (array if array is not None else operands).append(float(token))
+        elif first == b'/':
+            operands.append(token[1:])
+        else:
+            if token == b'Tf' and len(operands) >= 2 and isinstance(operands[-2], bytes):
+                cmap = fonts.get(operands[-2])
+            elif token == b'Tj' and operands and isinstance(operands[-1], str):
+                parts.append(operands[-1])
+            elif token in (b"'", b'"') and operands and isinstance(operands[-1], str):
+                parts.extend(('\n', operands[-1]))
+            elif token == b'TJ' and operands and isinstance(operands[-1], list):
+                for item in operands[-1]:
+                    parts.append(item if isinstance(item, str) else ' ' if item < -250 else '')
+            elif token in (b'Td', b'TD') and len(operands) >= 2 and operands[-1] != 0:
+                parts.append('\n')
+            elif token in (b'T*', b'ET'):
+                parts.append('\n')
+            operands = []
+    return ''.join(parts)
+
+
+def extract_text(data, max_length=None):
+    """
+    Extracts the text of a PDF given as bytes, page by page, with pypdf when it
+    is installed and with the best effort content stream reader above otherwise.
+    Whitespace is collapsed, lines are kept. Returns '' when nothing is found.
+    """
+    text = None
+    if PdfReader is not None:
+        try:
+            text = '\n'.join(page.extract_text() or '' for page in PdfReader(io.BytesIO(data)).pages)
+        except Exception:
+            text = None
+    if text is None:
+        decode = StreamDecoder()
+        objects = read_objects(data, decode)
+        fonts = font_cmaps(objects, decode)
+        text = '\n'.join(content_text(content, fonts) for content in page_contents(objects, decode))
+    lines = (' '.join(''.join(char for char in line if char.isprintable()).split()) for line in text.splitlines())
+    text = '\n'.join(line for line in lines if line)
+    return text[:max_length] if max_length else text
+
+
+def render_thumbnail(data, width):
+    """
+    Renders the first page of a PDF given as bytes to a PNG width pixels wide,
+    with pypdfium2 (and Pillow) when installed or poppler's pdftoppm when it is
+    on the PATH. Returns None when neither is available.
+    """
+    if pypdfium2 is not None:
+        try:
+            document = pypdfium2.PdfDocument(data)
+            try:
+                page = document[0]
+                image = page.render(scale=width / page.get_width()).to_pil()
+            finally:
+                document.close()
+            output = io.BytesIO()
+            image.save(output, 'PNG', optimize=True)
+            return output.getvalue()
+        except ImportError:
+            pass
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'source.pdf')
+        with open(source, 'wb') as f:
+            f.write(data)
+        subprocess.run(
+            [pdftoppm, '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to-x', str(width), '-scale-to-y', '-1',
+             source, os.path.join(directory, 'thumbnail')],
+            check=True, capture_output=True, timeout=60,
+        )
+        with open(os.path.join(directory, 'thumbnail.png'), 'rb') as f:
+            return f.read()
+
+
+def derive(source, thumbnail_width, text_max_length):
+    """
+    Computes what is derived from a PDF given as bytes or a file path: returns
+    (page count, text, PNG thumbnail or None). Runs in the processes of
+    main.tasks.get_pdf_pool, so it only depends on its arguments.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            data = f.read()
+    else:
+        data = source
+    try:
+        text = extract_text(data, text_max_length)
+    except Exception:
+        logger.exception('Extracting the text of a pdf failed')
+        text = ''
+    try:
+        thumbnail = render_thumbnail(data, thumbnail_width) if thumbnail_width else None
+    except Exception:
+        logger.exception('Rendering the thumbnail of a pdf failed')
+        thumbnail = None
+    return count_pages(data), text, thumbnail
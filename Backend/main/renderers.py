@@ -0,0 +1,45 @@
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed, several times
+    faster on large lists, and with the standard library otherwise. The bytes
+    are the same as JSONRenderer's: compact, UTF-8, with U+2028 and U+2029
+    escaped, and values orjson does not know (dates, decimals, lazy strings)
+    go through the DRF encoder. Indented output (?indent in the Accept header)
+    is left to JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+    def render_array(self, chunks):
+        """
+        Yields the bytes of one JSON array made of all the items of chunks (an
+        iterable of lists), rendering a chunk at a time, for StreamingHttpResponse.
+        """
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if chunk:
+                yield separator + self.render(chunk)[1:-1]
+                separator = b','
+        yield b']'
+
+
+# renderers of the read endpoints
+READ_RENDERER_CLASSES = [FastJSONRenderer, BrowsableAPIRenderer]
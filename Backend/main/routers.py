@@ -0,0 +1,35 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# set by main.middleware.ReplicaPinningMiddleware for requests that must read from the primary
+pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+# models whose reads must never lag behind their writes: the job queue is polled
+# and claimed right after jobs are written and updated
+PRIMARY_MODELS = {'main.Job'}
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the default database and reads to one of the
+    DATABASE_REPLICAS, unless the current request is pinned to the primary or
+    the model is one of PRIMARY_MODELS. Without replicas every query goes to
+    default.
+    """
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or pinned_to_primary.get() or model._meta.label in PRIMARY_MODELS:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,301 @@
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, When
+from django.utils.module_loading import import_string
+
+from .inverted_index import InvertedIndex, tokenize
+from .models import Content
+
+
+def get_search_backend():
+    """
+    Returns the search backend configured by the CONTENT_SEARCH_BACKEND setting.
+    """
+    return _load_backend(getattr(settings, 'CONTENT_SEARCH_BACKEND', 'main.search.DatabaseSearchBackend'))
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+class BaseSearchBackend:
+    """
+    Interface every content search backend implements.
+
+    Backends that keep their own index are notified through index()/remove()
+    from main.signals whenever a content or one of its categories changes.
+    """
+    max_results = getattr(settings, 'CONTENT_SEARCH_MAX_RESULTS', 1000)
+
+    def setup(self):
+        """
+        Creates whatever storage the backend needs. Called after migrations.
+        """
+
+    def index(self, contents):
+        """
+        Adds or refreshes the given contents in the index.
+        """
+
+    def remove(self, content_ids):
+        """
+        Drops the given content ids from the index.
+        """
+
+    def rebuild(self):
+        """
+        Re-indexes every content from scratch.
+        """
+
+    def search(self, query, author=None, offset=0, limit=None):
+        """
+        Returns the ids of contents matching query, best match first: limit of
+        them (max_results by default) after the first offset ones.
+        """
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query, author=None, offset=0, limit=None):
+        """
+        Restricts queryset to the contents search() returns for query, offset
+        and limit, ordered by relevance.
+        """
+        ids = self.search(query, author=author, offset=offset, limit=limit)
+        if not ids:
+            return queryset.none()
+        ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Substring search with icontains on every text field. Works on any database;
+    on PostgreSQL setup() adds pg_trgm indexes matching the UPPER(...) LIKE
+    queries Django generates for icontains, elsewhere it scans the whole table.
+    """
+    # (index name, table, column) of the trigram indexes created on PostgreSQL
+    trigram_indexes = (
+        ('main_content_title_trgm', 'main_content', 'title'),
+        ('main_content_body_trgm', 'main_content', 'body'),
+        ('main_content_summary_trgm', 'main_content', 'summary'),
+        ('main_content_pdf_text_trgm', 'main_content', 'pdf_text'),
+        ('main_category_name_trgm', 'main_category', 'name'),
+        ('main_content_category_names_trgm', 'main_content', 'category_names'),
+    )
+
+    def setup(self):
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for name, table, column in self.trigram_indexes:
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS {} ON {} USING gin ((UPPER({}::text)) gin_trgm_ops)'.format(
+                        connection.ops.quote_name(name), connection.ops.quote_name(table), connection.ops.quote_name(column)
+                    )
+                )
+    def get_filter(self, query):
+        text = Q(title__icontains=query) | Q(body__icontains=query) | Q(summary__icontains=query) | Q(pdf_text__icontains=query)
+        if getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False):
+            return text | Q(category_names__icontains=query)
+        return text | Q(categories__name__icontains=query)
+
+    def search(self, query, author=None, offset=0, limit=None):
+        contents = Content.objects.filter(self.get_filter(query))
+        if author is not None:
+            contents = contents.filter(author=author)
+        return list(contents.order_by('id').values_list('id', flat=True).distinct()[offset:offset + (limit or self.max_results)])
+
+    def filter_queryset(self, queryset, query, author=None, offset=0, limit=None):
+        queryset = queryset.filter(self.get_filter(query))
+        if not getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False):
+            # the categories join repeats contents with several matching categories
+            queryset = queryset.distinct()
+        # no ranking: matches come in id order
+        return queryset.order_by('id')[offset:offset + (limit or self.max_results)]
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Inverted index stored in an SQLite FTS5 virtual table keyed by content id,
+    ranked with bm25 (title and summary weigh more than body, the pdf text least).
+    """
+    table = 'main_content_fts'
+    columns = ('title', 'body', 'summary', 'categories', 'pdf_text', 'author_id')
+    # bm25 weights for title, body, summary, categories, pdf_text, author_id
+    weights = (10.0, 1.0, 5.0, 3.0, 0.5, 0.0)
+
+    def setup(self):
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured('SQLiteFTSBackend requires the sqlite3 database backend.')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA table_info({})'.format(self.table))
+            existing = tuple(row[1] for row in cursor.fetchall())
+            # created by an earlier version with other columns: start over and index again
+            outdated = existing and existing != self.columns
+            if outdated:
+                cursor.execute('DROP TABLE {}'.format(self.table))
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+                "title, body, summary, categories, pdf_text, author_id UNINDEXED, "
+                "tokenize='unicode61', prefix='2 3')".format(self.table)
+            )
+        if outdated:
+            self.rebuild()
+
+    def index(self, contents):
+        rows = [
+            (content.pk, content.title, content.body, content.summary,
+             ' '.join(category.name for category in content.categories.all()), content.pdf_text, content.author_id)
+            for content in contents
+        ]
+        if not rows:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(self.table), [(row[0],) for row in rows])
+            cursor.executemany(
+                'INSERT INTO {} (rowid, title, body, summary, categories, pdf_text, author_id) '
+                'VALUES (%s, %s, %s, %s, %s, %s, %s)'.format(self.table), rows
+            )
+
+    def remove(self, content_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(self.table), [(pk,) for pk in content_ids])
+
+    @transaction.atomic
+    def rebuild(self, batch_size=1000):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(self.table))
+        contents = Content.objects.order_by('id').prefetch_related('categories')
+        last_id = 0
+        while True:
+            batch = list(contents.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            self.index(batch)
+            last_id = batch[-1].id
+
+    def build_match(self, query):
+        """
+        Turns free text into an FTS5 expression where every word must match
+        as a prefix, e.g. 'pdf guide' -> '"pdf"* AND "guide"*'.
+        """
+        return ' AND '.join('"{}"*'.format(token) for token in tokenize(query))
+
+    def search(self, query, author=None, offset=0, limit=None):
+        match = self.build_match(query)
+        if not match:
+            return []
+        sql = 'SELECT rowid FROM {table} WHERE {table} MATCH %s'.format(table=self.table)
+        params = [match]
+        if author is not None:
+            sql += ' AND author_id = %s'
+            params.append(author.pk)
+        sql += ' ORDER BY bm25({table}, {weights}) LIMIT %s OFFSET %s'.format(
+            table=self.table, weights=', '.join(str(weight) for weight in self.weights)
+        )
+        params += [limit or self.max_results, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Pure Python inverted index (main.inverted_index) held by each process.
+
+    The index is loaded from the database on the first search and then kept
+    up to date incrementally from model signals once the writing transaction
+    commits. Changes made by other processes are only seen after rebuild(),
+    so use it for single process deployments or read mostly data.
+    """
+    # term frequency multipliers for title, summary, body, category names and pdf text
+    weights = (3, 2, 1, 2, 1)
+
+    def __init__(self):
+        self.inverted_index = InvertedIndex()
+        self.loaded = False
+        # serializes rebuilds, reentrant as the first search rebuilds while holding it
+        self.lock = threading.RLock()
+        # changes committed during a rebuild, replayed on the new index, None between rebuilds
+        self.pending = None
+        self.pending_lock = threading.Lock()
+
+    def get_fields(self, content):
+        title_weight, summary_weight, body_weight, categories_weight, pdf_text_weight = self.weights
+        return (
+            (content.title, title_weight),
+            (content.summary, summary_weight),
+            (content.body, body_weight),
+            (' '.join(category.name for category in content.categories.all()), categories_weight),
+            (content.pdf_text, pdf_text_weight),
+        )
+
+    def index(self, contents):
+        def get_documents():
+            return [(content.pk, self.get_fields(content), content.author_id) for content in contents]
+        # before the first search, the contents are only read if a rebuild runs when the transaction commits
+        documents = get_documents() if self.loaded else None
+
+        def change(inverted_index):
+            nonlocal documents
+            if documents is None:
+                documents = get_documents()
+            for doc_id, fields, author_id in documents:
+                inverted_index.add(doc_id, fields, author_id)
+        transaction.on_commit(lambda: self.apply(change))
+
+    def remove(self, content_ids):
+        content_ids = list(content_ids)
+
+        def change(inverted_index):
+            for doc_id in content_ids:
+                inverted_index.remove(doc_id)
+        transaction.on_commit(lambda: self.apply(change))
+
+    def apply(self, change):
+        with self.pending_lock:
+            if self.pending is not None:
+                # the running rebuild may have read the rows before this commit
+                self.pending.append(change)
+            if self.loaded:
+                change(self.inverted_index)
+
+    def rebuild(self, batch_size=1000):
+        with self.lock:
+            with self.pending_lock:
+                self.pending = []
+            try:
+                # build a fresh index and swap it in so concurrent searches never see a partial one
+                inverted_index = InvertedIndex()
+                contents = Content.objects.order_by('id').prefetch_related('categories')
+                last_id = 0
+                while True:
+                    batch = list(contents.filter(id__gt=last_id)[:batch_size])
+                    if not batch:
+                        break
+                    for content in batch:
+                        inverted_index.add(content.pk, self.get_fields(content), content.author_id)
+                    last_id = batch[-1].id
+                with self.pending_lock:
+                    for change in self.pending:
+                        change(inverted_index)
+                    self.inverted_index = inverted_index
+                    self.loaded = True
+            finally:
+                with self.pending_lock:
+                    self.pending = None
+
+    def search(self, query, author=None, offset=0, limit=None):
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.rebuild()
+        ids = self.inverted_index.search(
+            query, prefix=True, author_id=author.pk if author is not None else None, limit=offset + (limit or self.max_results)
+        )
+        return ids[offset:]
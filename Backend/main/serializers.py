@@ -1,7 +1,14 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.contrib.auth.password_validation import validate_password
 from .models import User,Content,Category
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .tokens import CMSRefreshToken
+from .signals import contents_bulk_saved, release_uploaded_pdf_files
+from .pdf import is_pdf, file_sha256
+from django.conf import settings
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,21 +17,21 @@ class UserSerializer(serializers.ModelSerializer):
     """
     password = serializers.CharField(
         write_only=True,
-        required=True,
-        validators=[validate_password]
+        required=True
     )
 
     def validate_password(self, value):
         """
         This fucntion validates password for Min 8 length, 1 uppercase, 1 lowercase condition
+        and then runs the AUTH_PASSWORD_VALIDATORS once
         """
-        validate_password(value)
         if len(value) < 8:
             raise serializers.ValidationError("Password must be at least 8 characters long.")
         if not any(char.isupper() for char in value):
             raise serializers.ValidationError("Password must contain at least one uppercase letter.")
         if not any(char.islower() for char in value):
             raise serializers.ValidationError("Password must contain at least one lowercase letter.")
+        validate_password(value)
         return value
     
     def validate_phone(self,value):
@@ -64,6 +71,7 @@ class UserSerializer(serializers.ModelSerializer):
 class LoginSerializer(TokenObtainPairSerializer):
     email = serializers.EmailField()
     password = serializers.CharField()
+    token_class = CMSRefreshToken
 
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -75,18 +83,54 @@ class LoginSerializer(TokenObtainPairSerializer):
     class Meta:
         fields = ('email', 'password')
 
+class CMSTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes tokens only while their user exists, is active and has not revoked
+    them, and re-reads the user claims into the new tokens.
+    """
+    token_class = CMSRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}).first()
+        if user is None or not user.is_active or refresh.get('token_version', 0) != user.token_version:
+            raise InvalidToken('Token has been revoked')
+        refresh.set_user_claims(user)
+        return super().validate({'refresh': str(refresh)})
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name']
 
+    def validate_name(self, value):
+        """
+        This function validates that no other category has the same name, ignoring case
+        """
+        categories = Category.objects.filter_name(value)
+        if self.instance is not None:
+            categories = categories.exclude(pk=self.instance.pk)
+        if categories.exists():
+            raise serializers.ValidationError("A category with this name already exists.")
+        return value
+
 class ContentSerializer(serializers.ModelSerializer):
     categories =CategorySerializer(many=True)
     pdf_file = serializers.FileField()
+    # png of the first page of the pdf, null until it has been processed or when it cannot be rendered
+    thumbnail = serializers.FileField(read_only=True)
 
     class Meta:
         model = Content
-        fields = ['id', 'title', 'body', 'summary', 'pdf_file', 'categories']
+        fields = ['id', 'title', 'body', 'summary', 'pdf_file', 'thumbnail', 'categories']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False):
+            # same output, read from the content row instead of the categories join
+            fields['categories'] = serializers.JSONField(source='category_data', read_only=True)
+        return fields
 
     def get_pdf_file(self,obj):
         if obj.pdf_file:
@@ -94,22 +138,151 @@ class ContentSerializer(serializers.ModelSerializer):
         else:
             return None
         
+def get_category_ids(documents):
+    """
+    Collects the category ids referenced by submitted documents, ignoring malformed ones.
+    """
+    ids = set()
+    for document in documents:
+        if not hasattr(document, 'get'):
+            continue
+        values = document.getlist('categories') if hasattr(document, 'getlist') else document.get('categories')
+        for value in values if isinstance(values, (list, tuple)) else []:
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return ids
+
+
+class CategoryRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Category primary key field that resolves ids from context['categories'] when the
+    parent serializer preloaded them, instead of running one query per id.
+    """
+    def to_internal_value(self, data):
+        categories = self.context.get('categories')
+        if categories is not None and not isinstance(data, bool):
+            try:
+                return categories[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class ContentBulkListSerializer(serializers.ListSerializer):
+    """
+    Saves many contents in one transaction with bulk inserts and updates
+    instead of one save() and one categories.add() per document.
+    """
+    update_fields = ['title', 'body', 'summary', 'pdf_file', 'pdf_hash', 'pdf_page_count', 'pdf_text', 'thumbnail']
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            # resolve the categories of every document with a single query
+            self.context['categories'] = Category.objects.in_bulk(get_category_ids(data))
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        categories_data = [attrs.pop('categories', []) for attrs in validated_data]
+        contents = [Content(**attrs) for attrs in validated_data]
+        try:
+            # bulk_create() stores the uploads in pre_save(), within the transaction
+            with transaction.atomic():
+                Content.objects.bulk_create_with_ids(contents)
+                Content.objects.set_categories({
+                    content.pk: [category.pk for category in categories]
+                    for content, categories in zip(contents, categories_data)
+                })
+        except Exception:
+            release_uploaded_pdf_files(contents)
+            raise
+        contents_bulk_saved.send(sender=Content, contents=contents)
+        return contents
+
+    def update(self, instances, validated_data):
+        """
+        instances must be in the same order as the submitted items.
+        """
+        categories_by_content = {}
+        uploads = []
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            categories = attrs.pop('categories', None)
+            if categories is not None:
+                # an empty list clears the categories
+                categories_by_content[instance.pk] = [category.pk for category in categories]
+            pdf_file = attrs.pop('pdf_file', None)
+            if pdf_file is not None:
+                uploads.append((instance, pdf_file))
+                fields.add('pdf_file')
+            for field, value in attrs.items():
+                setattr(instance, field, value)
+                fields.add(field)
+        try:
+            with transaction.atomic():
+                for instance, pdf_file in uploads:
+                    # bulk_update() skips pre_save(), so store the upload now
+                    instance.pdf_file.save(pdf_file.name, pdf_file, save=False)
+                if fields:
+                    Content.objects.bulk_update(instances, [field for field in self.update_fields if field in fields], batch_size=500)
+                Content.objects.set_categories(categories_by_content)
+        except Exception:
+            release_uploaded_pdf_files(instances)
+            raise
+        contents_bulk_saved.send(sender=Content, contents=instances)
+        return instances
+
+
 class ContentViewSerializer(serializers.ModelSerializer):
+    categories = CategoryRelatedField(many=True, queryset=Category.objects.all(), required=False)
+
     class Meta:
         model = Content
         fields = ['id', 'title', 'body', 'summary', 'pdf_file', 'categories']
-    
+        list_serializer_class = ContentBulkListSerializer
+
+    def to_internal_value(self, data):
+        if 'categories' not in self.context:
+            # resolve all submitted category ids with a single query
+            self.context['categories'] = Category.objects.in_bulk(get_category_ids([data]))
+        return super().to_internal_value(data)
+
+    def validate_pdf_file(self, value):
+        """
+        Uploads streamed by main.uploadhandlers.PDFUploadHandler are already checked and hashed,
+        anything else (e.g. other upload handlers) is checked here.
+        """
+        if getattr(value, 'sha256', None) is None:
+            max_size = getattr(settings, 'PDF_UPLOAD_MAX_SIZE', None)
+            if max_size and value.size > max_size:
+                raise serializers.ValidationError('File is larger than the maximum allowed size of %d bytes.' % max_size)
+            if not is_pdf(value):
+                raise serializers.ValidationError('File is not a PDF.')
+            value.sha256 = file_sha256(value)
+        return value
+
+    def validate(self, attrs):
+        if 'pdf_file' in attrs:
+            # a new pdf has to be processed again in the background
+            attrs['pdf_hash'] = attrs['pdf_file'].sha256
+            attrs['pdf_page_count'] = None
+            attrs['pdf_text'] = ''
+            attrs['thumbnail'] = ''
+        return attrs
+
     def create(self, validated_data):
         if 'categories' in validated_data.keys():
             categories_data = validated_data.pop('categories')
         else:
             categories_data=[]
-        document = Content.objects.create(**validated_data)
-        for category_obj in categories_data:
-            category = Category.objects.get(id=category_obj.id)
-            document.categories.add(category)
+        with transaction.atomic():
+            document = Content.objects.create(**validated_data)
+            changed = Content.objects.set_categories({document.pk: [category.pk for category in categories_data]})
+        if changed:
+            contents_bulk_saved.send(sender=Content, contents=[document])
         return document
-    
+
     def update(self, instance, validated_data):
         if 'categories' in validated_data.keys():
             categories_data = validated_data.pop('categories')
@@ -119,10 +292,13 @@ class ContentViewSerializer(serializers.ModelSerializer):
         instance.body = validated_data.get('body', instance.body)
         instance.summary = validated_data.get('summary', instance.summary)
         instance.pdf_file = validated_data.get('pdf_file', instance.pdf_file)
-        if categories_data:
-            instance.categories.clear()
-            for category_data in categories_data:
-                category = Category.objects.get(id=category_data.id)
-                instance.categories.add(category)
+        instance.pdf_hash = validated_data.get('pdf_hash', instance.pdf_hash)
+        instance.pdf_page_count = validated_data.get('pdf_page_count', instance.pdf_page_count)
+        instance.pdf_text = validated_data.get('pdf_text', instance.pdf_text)
+        instance.thumbnail = validated_data.get('thumbnail', instance.thumbnail)
+        with transaction.atomic():
+            if categories_data:
+                # links are diffed in bulk before save() so post_save sees the final categories
+                Content.objects.set_categories({instance.pk: [category.pk for category in categories_data]})
             instance.save()
-        return instance
\ No newline at end of file
+        return instance
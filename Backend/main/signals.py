@@ -1,9 +1,204 @@
-from django.db.models.signals import post_migrate
-from main.models import User
-from django.dispatch import receiver
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete, m2m_changed
+from main.models import User, Content, Category
+from main.search import get_search_backend
+from main.cache import invalidate_contents, invalidate_categories
+from main.authentication import token_versions
+from main.jobs import enqueue
+from main.tasks import process_pdfs, release_pdf_files, release_pdf_derivatives
+from django.dispatch import receiver, Signal
+from django.conf import settings
+from django.db import connections
+from django.core.signals import request_started
+
+# sent with contents=[...] by bulk writes, which bypass post_save and m2m_changed
+contents_bulk_saved = Signal()
 
 @receiver(post_migrate)
 def create_admin_user(sender, **kwargs):
     if not User.objects.filter(email='admin@gmail.com').exists():
         User.objects.create_superuser(email='admin@gmail.com', password='admin')
 
+@receiver(post_migrate)
+def setup_search_index(sender, **kwargs):
+    if sender.name == 'main':
+        get_search_backend().setup()
+
+# tune SQLite connections as soon as they are opened
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+                cursor.execute('PRAGMA %s = %s' % (name, value))
+
+# drop persistent database connections that died while idle (CONN_HEALTH_CHECKS in settings)
+
+@receiver(request_started)
+def check_database_connections(sender, **kwargs):
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_HEALTH_CHECKS') and connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+# forget cached token versions so revoked tokens are refused right away by this process
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_token_version(sender, instance, **kwargs):
+    token_versions.pop(instance.pk)
+
+# keep the search index in sync with contents and their categories
+
+@receiver(post_save, sender=Content)
+def index_content(sender, instance, **kwargs):
+    get_search_backend().index([instance])
+
+@receiver(post_delete, sender=Content)
+def unindex_content(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+@receiver(m2m_changed, sender=Content.categories.through)
+def index_content_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            get_search_backend().index([instance])
+    elif action == 'pre_clear':
+        # remember which contents lose the category before the rows are gone
+        instance._cleared_content_ids = list(instance.content_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        content_ids = pk_set if action != 'post_clear' else instance._cleared_content_ids
+        get_search_backend().index(Content.objects.filter(id__in=content_ids).prefetch_related('categories'))
+
+@receiver(contents_bulk_saved)
+def index_bulk_contents(sender, contents, **kwargs):
+    get_search_backend().index(Content.objects.filter(id__in=[content.pk for content in contents]).prefetch_related('categories'))
+
+@receiver(post_save, sender=Category)
+def index_category_contents(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().index(Content.objects.filter(categories=instance).prefetch_related('categories'))
+
+@receiver(pre_delete, sender=Category)
+def remember_category_contents(sender, instance, **kwargs):
+    instance._cleared_content_ids = list(instance.content_set.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Category)
+def reindex_category_contents(sender, instance, **kwargs):
+    get_search_backend().index(Content.objects.filter(id__in=instance._cleared_content_ids).prefetch_related('categories'))
+
+# keep the denormalized categories of contents in sync (CONTENT_DENORMALIZED_CATEGORIES),
+# ContentManager.set_categories refreshes the contents it changes itself
+
+def refresh_category_data(content_ids):
+    if getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False):
+        Content.objects.refresh_category_data(content_ids)
+
+@receiver(m2m_changed, sender=Content.categories.through)
+def refresh_content_category_data(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_category_data([instance.pk])
+    else:
+        refresh_category_data(pk_set if action != 'post_clear' else instance._cleared_content_ids)
+
+@receiver(post_save, sender=Category)
+def refresh_category_contents_data(sender, instance, created, **kwargs):
+    if not created:
+        refresh_category_data(Content.objects.filter(categories=instance).values_list('id', flat=True))
+
+@receiver(post_delete, sender=Category)
+def refresh_deleted_category_contents_data(sender, instance, **kwargs):
+    refresh_category_data(instance._cleared_content_ids)
+
+# drop cached API responses built from changed rows
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def invalidate_content_cache(sender, instance, **kwargs):
+    invalidate_contents([instance.author_id])
+
+@receiver(contents_bulk_saved)
+def invalidate_bulk_content_cache(sender, contents, **kwargs):
+    invalidate_contents([content.author_id for content in contents])
+
+@receiver(m2m_changed, sender=Content.categories.through)
+def invalidate_content_categories_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_contents([instance.author_id])
+    else:
+        content_ids = pk_set if action != 'post_clear' else instance._cleared_content_ids
+        invalidate_contents(Content.objects.filter(id__in=content_ids).values_list('author_id', flat=True))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    invalidate_categories()
+
+# process new pdfs off the request, in the job queue
+
+def has_new_pdf(content):
+    # _loaded_pdf_file is only moved to the saved file by the receivers releasing replaced pdfs below
+    return bool(content.pdf_file) and content.pdf_page_count is None and getattr(content, '_loaded_pdf_file', None) != content.pdf_file.name
+
+@receiver(post_save, sender=Content)
+def process_content_pdf(sender, instance, **kwargs):
+    if has_new_pdf(instance):
+        enqueue(process_pdfs, [instance.pk])
+
+@receiver(contents_bulk_saved)
+def process_bulk_content_pdfs(sender, contents, **kwargs):
+    content_ids = [content.pk for content in contents if has_new_pdf(content)]
+    if content_ids:
+        enqueue(process_pdfs, content_ids)
+
+# delete stored pdfs and what was derived from them once no content references them
+# (identical uploads share one file), in the job queue
+
+def release_replaced_pdf_files(contents):
+    names = []
+    hashes = []
+    for content in contents:
+        previous = getattr(content, '_loaded_pdf_file', None)
+        if previous and previous != content.pdf_file.name:
+            names.append(previous)
+        previous_hash = getattr(content, '_loaded_pdf_hash', None)
+        if previous_hash and previous_hash != content.pdf_hash:
+            hashes.append(previous_hash)
+        content._loaded_pdf_file = content.pdf_file.name
+        content._loaded_pdf_hash = content.pdf_hash
+    if names:
+        enqueue(release_pdf_files, names)
+    if hashes:
+        enqueue(release_pdf_derivatives, hashes)
+
+
+def release_uploaded_pdf_files(contents):
+    """
+    Queues the release of the uploads stored for contents whose transaction
+    was rolled back, no row references them.
+    """
+    names = list(dict.fromkeys(
+        content.pdf_file.name for content in contents
+        if content.pdf_file and content.pdf_file._committed and content.pdf_file.name != getattr(content, '_loaded_pdf_file', None)
+    ))
+    if names:
+        enqueue(release_pdf_files, names)
+
+@receiver(post_delete, sender=Content)
+def release_deleted_content_pdf(sender, instance, **kwargs):
+    if instance.pdf_file:
+        enqueue(release_pdf_files, [instance.pdf_file.name])
+    if instance.pdf_hash:
+        enqueue(release_pdf_derivatives, [instance.pdf_hash])
+
+@receiver(post_save, sender=Content)
+def release_replaced_content_pdf(sender, instance, **kwargs):
+    release_replaced_pdf_files([instance])
+
+@receiver(contents_bulk_saved)
+def release_replaced_bulk_content_pdfs(sender, contents, **kwargs):
+    release_replaced_pdf_files(contents)
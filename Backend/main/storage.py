@@ -0,0 +1,68 @@
+import os
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+from .pdf import file_sha256
+
+
+def get_pdf_storage():
+    """
+    Storage of Content.pdf_file, chosen by the PDF_STORAGE setting.
+    """
+    return import_string(getattr(settings, 'PDF_STORAGE', 'django.core.files.storage.FileSystemStorage'))()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names every file after the SHA-256 of its bytes,
+    e.g. pdfs/9f/86/9f86d0...0a08.pdf, so identical uploads share one blob.
+
+    Saving bytes that are already stored only touches the existing blob and
+    returns its name, without writing anything. The storage does not track
+    references itself: a blob may be deleted once no row points at its name any
+    more and it was not saved again recently (see main.tasks.release_pdf_files).
+    """
+    def get_available_name(self, name, max_length=None):
+        # the final name is derived from the content in _save()
+        return name
+
+    def hashed_name(self, name, digest):
+        directory = posixpath.dirname(name.replace('\\', '/'))
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, digest[:2], digest[2:4], digest + extension)
+
+    def _save(self, name, content):
+        digest = getattr(content, 'sha256', None) or file_sha256(content)
+        name = self.hashed_name(name, digest)
+        full_path = self.path(name)
+        try:
+            # the new mtime keeps the blob from being released before the row reusing it is committed
+            os.utime(full_path)
+            return name
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # write next to the target and rename it into place, so readers never see a partial
+        # blob and concurrent uploads of the same bytes just replace each other
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    for chunk in content.chunks():
+                        temp_file.write(chunk)
+                os.replace(temp_path, full_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
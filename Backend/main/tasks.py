@@ -0,0 +1,173 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from itertools import repeat
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import router
+from django.utils import timezone
+
+from .jobs import enqueue, task
+from .models import Content, PdfDerivative
+from .pdf import derive, file_sha256
+from .routers import pinned_to_primary
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    """
+    Processes deriving text and thumbnails from pdfs (PDF_PROCESSING_PROCESSES,
+    None when 0). They are spawned rather than forked: the process running the
+    jobs has threads, which a fork would copy in whatever state they are.
+    """
+    global _pdf_pool
+    processes = getattr(settings, 'PDF_PROCESSING_PROCESSES', 2)
+    if not processes:
+        return None
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_pool
+
+
+def discard_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        _pdf_pool = None
+
+
+def pdf_source(pdf_file):
+    # the pdf processes read files of local storages themselves, others are sent the bytes
+    try:
+        return pdf_file.path
+    except NotImplementedError:
+        with pdf_file.open('rb'):
+            return pdf_file.read()
+
+
+def derive_pdfs(pdf_files):
+    """
+    Derives the page count, text and thumbnail of {sha256: pdf FieldFile} in the
+    pdf processes, saves them as PdfDerivative rows and returns these by hash.
+    """
+    width = getattr(settings, 'PDF_THUMBNAIL_WIDTH', 320)
+    max_length = getattr(settings, 'PDF_TEXT_MAX_LENGTH', 100000)
+    pool = get_pdf_pool()
+    # a few pdfs per process at a time, so storages without paths never hold a whole batch in memory
+    step = max(1, getattr(settings, 'PDF_PROCESSING_PROCESSES', 2)) * 2
+    items = list(pdf_files.items())
+    derivatives = {}
+    for start in range(0, len(items), step):
+        chunk = items[start:start + step]
+        sources = [pdf_source(pdf_file) for digest, pdf_file in chunk]
+        try:
+            if pool is None:
+                results = list(map(derive, sources, repeat(width), repeat(max_length)))
+            else:
+                results = list(pool.map(derive, sources, repeat(width), repeat(max_length)))
+        except BrokenProcessPool:
+            # a process died (e.g. a crashing renderer), start new ones for the retry
+            discard_pdf_pool()
+            raise
+        for (digest, pdf_file), (page_count, text, thumbnail) in zip(chunk, results):
+            derivative = PdfDerivative(sha256=digest, page_count=page_count, text=text)
+            if thumbnail:
+                derivative.thumbnail.save('%s.png' % digest, ContentFile(thumbnail), save=False)
+            derivatives[digest] = derivative
+    # another worker may have derived the same pdf meanwhile, both results are the same
+    PdfDerivative.objects.bulk_create(derivatives.values(), ignore_conflicts=True)
+    return derivatives
+
+
+@task(batch=True)
+def process_pdfs(content_ids):
+    """
+    Stores the page count, text and first page thumbnail of the uploaded pdfs
+    of the given contents. Each distinct pdf is only read once: what is derived
+    from it is kept by hash in PdfDerivative for every content sharing it.
+    """
+    # imported here, main.signals enqueues the tasks of this module
+    from .signals import contents_bulk_saved
+
+    # the rows were just committed, a replica may not have them yet
+    db = router.db_for_write(Content)
+    contents = [content for content in Content.objects.using(db).filter(id__in=content_ids).only('id', 'pdf_file', 'pdf_hash') if content.pdf_file]
+    for content in contents:
+        if not content.pdf_hash:
+            # stored before uploads were hashed
+            with content.pdf_file.open('rb'):
+                content.pdf_hash = file_sha256(content.pdf_file)
+            Content.objects.using(db).filter(id=content.id, pdf_file=content.pdf_file.name).update(pdf_hash=content.pdf_hash)
+    derivatives = PdfDerivative.objects.using(db).in_bulk({content.pdf_hash for content in contents})
+    missing = {content.pdf_hash: content.pdf_file for content in contents if content.pdf_hash not in derivatives}
+    if missing:
+        derivatives.update(derive_pdfs(missing))
+    for digest, derivative in derivatives.items():
+        # the pdf_hash condition skips contents whose pdf was replaced since
+        Content.objects.using(db).filter(id__in=[content.id for content in contents if content.pdf_hash == digest], pdf_hash=digest).update(
+            pdf_page_count=derivative.page_count or 0, pdf_text=derivative.text, thumbnail=derivative.thumbnail.name,
+        )
+    # reindex the text and drop the cached responses, as for any other bulk write;
+    # the receivers read the contents again, from the primary as well
+    token = pinned_to_primary.set(True)
+    try:
+        contents_bulk_saved.send(sender=Content, contents=list(
+            Content.objects.using(db).filter(id__in=[content.id for content in contents]).only('id', 'author', 'pdf_file', 'pdf_hash', 'pdf_page_count')
+        ))
+    finally:
+        pinned_to_primary.reset(token)
+
+
+@task(batch=True)
+def release_pdf_files(names):
+    """
+    Deletes the stored pdfs of the given names that no content references
+    anymore, identical uploads share one file. Files saved less than
+    PDF_RELEASE_GRACE seconds ago are checked again after that delay instead:
+    an upload of the same bytes reuses the file (see ContentAddressedStorage)
+    before its row is committed.
+    """
+    # a replica lagging behind could miss the contents that reference a file
+    referenced = set(Content.objects.using(router.db_for_write(Content)).filter(pdf_file__in=names).values_list('pdf_file', flat=True))
+    storage = Content._meta.get_field('pdf_file').storage
+    grace = getattr(settings, 'PDF_RELEASE_GRACE', 300)
+    saved_before = timezone.now() - timedelta(seconds=grace)
+    recent = []
+    for name in names:
+        if name in referenced:
+            continue
+        try:
+            modified = storage.get_modified_time(name)
+        except (OSError, NotImplementedError):
+            modified = None
+        if modified is not None and modified > saved_before:
+            recent.append(name)
+        else:
+            storage.delete(name)
+    # eager mode cannot wait: recent files are kept until they are released again
+    if recent and not getattr(settings, 'JOB_QUEUE_ALWAYS_EAGER', False):
+        enqueue(release_pdf_files, recent, delay=grace)
+
+
+@task(batch=True)
+def release_pdf_derivatives(hashes):
+    """
+    Drops the derivatives of the given pdf hashes that no content has anymore,
+    with their thumbnails unless an identical one is still used.
+    """
+    # as in release_pdf_files, a lagging replica could miss the contents using a hash
+    db = router.db_for_write(PdfDerivative)
+    referenced = set(Content.objects.using(db).filter(pdf_hash__in=hashes).values_list('pdf_hash', flat=True))
+    derivatives = PdfDerivative.objects.using(db).filter(sha256__in=[digest for digest in hashes if digest not in referenced])
+    thumbnails = set(derivatives.exclude(thumbnail='').values_list('thumbnail', flat=True))
+    derivatives.delete()
+    thumbnails -= set(PdfDerivative.objects.using(db).filter(thumbnail__in=thumbnails).values_list('thumbnail', flat=True))
+    thumbnails -= set(Content.objects.using(db).filter(thumbnail__in=thumbnails).values_list('thumbnail', flat=True))
+    storage = PdfDerivative._meta.get_field('thumbnail').storage
+    for name in thumbnails:
+        storage.delete(name)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+from asgiref.sync import SyncToAsync, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.test import SimpleTestCase, TestCase, AsyncRequestFactory
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+from main.async_views import async_view
+from main.authentication import token_versions
+from main.models import User, Content, Category
+from main.tokens import CMSRefreshToken
+from main.views import content_list_view, content_detail_view, category_list_view
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_versions.clear()
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', author=self.user)
+        Category.objects.create(name='Test Category')
+
+    def get(self, view, token=None, **kwargs):
+        headers = {'Authorization': 'Bearer %s' % token} if token is not None else {}
+        request = self.factory.get('/', **headers)
+        return async_view(view)(request, **kwargs)
+
+    def test_views_are_coroutines(self):
+        self.assertTrue(asyncio.iscoroutinefunction(async_view(content_list_view)))
+
+    async def test_content_list(self):
+        response = await self.get(content_list_view, CMSRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([content['title'] for content in response.data], ['Test Title'])
+
+    async def test_content_detail(self):
+        response = await self.get(content_detail_view, CMSRefreshToken.for_user(self.user).access_token, pk=self.content.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Test Title')
+
+    async def test_category_list_with_token_without_claims(self):
+        response = await self.get(category_list_view, RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([category['name'] for category in response.data], ['Test Category'])
+
+    async def test_unauthenticated_requests_are_refused(self):
+        response = await self.get(content_list_view)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.get(content_list_view, 'invalid')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ASGIApplicationTest(SimpleTestCase):
+    async def receive(self):
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(self, message):
+        pass
+
+    def test_middleware_chain_is_async(self):
+        # a sync only middleware would make Django run the whole chain in a worker thread
+        self.assertNotIsInstance(ASGIHandler()._middleware_chain, SyncToAsync)
+
+    def test_requests_share_long_lived_threads(self):
+        from Backend import asgi
+        threads = []
+
+        async def django_application(scope, receive, send):
+            await receive()
+            threads.append(await sync_to_async(threading.get_ident)())
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+
+        async def serve():
+            for _ in range(3):
+                await asgi.application({'type': 'http'}, self.receive, self.send)
+        # run as an ASGI server would, not from async_to_sync whose thread would run the sync code
+        with patch.object(asgi, 'django_application', django_application), patch.object(asgi, 'ASGI_THREADS', 1), \
+                patch.object(asgi, '_contexts', None):
+            asyncio.run(serve())
+        self.assertEqual(len(set(threads)), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_slow_clients_do_not_hold_threads(self):
+        from Backend import asgi
+        threads = []
+
+        async def django_application(scope, receive, send):
+            await receive()
+            threads.append(await sync_to_async(threading.get_ident)())
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'{}'})
+
+        async def slow_receive():
+            await asyncio.sleep(0.2)
+            return await self.receive()
+
+        async def slow_send(message):
+            await asyncio.sleep(0.2)
+
+        async def serve():
+            await asyncio.gather(*[asgi.application({'type': 'http'}, slow_receive, slow_send) for _ in range(10)])
+        with patch.object(asgi, 'django_application', django_application), patch.object(asgi, 'ASGI_THREADS', 2), \
+                patch.object(asgi, '_contexts', None):
+            start = time.monotonic()
+            asyncio.run(serve())
+            elapsed = time.monotonic() - start
+        self.assertEqual(len(threads), 10)
+        self.assertLessEqual(len(set(threads)), 2)
+        # holding a thread for the whole request would serve them two at a time, in 3 seconds
+        self.assertLess(elapsed, 1.5)
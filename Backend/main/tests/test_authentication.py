@@ -0,0 +1,136 @@
+import json
+from django.db import connection
+from django.test import TestCase
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from main.authentication import ClaimsJWTAuthentication, token_versions
+from main.hashers import ScryptPasswordHasher
+from main.validators import CommonPasswordValidator
+from main.models import User, Content
+from main.tokens import CMSRefreshToken
+
+
+class ClaimsJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_versions.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='Testpass@123', full_name='Test User')
+        Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', author=self.user)
+        self.refresh = CMSRefreshToken.for_user(self.user)
+        self.authenticate(self.refresh.access_token)
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(token))
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if '"main_user"' in query['sql']]
+
+    def test_login_token_carries_user_claims(self):
+        response = self.client.post(reverse('login'), data=json.dumps({'email': 'testemail@test.com', 'password': 'Testpass@123'}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access = AccessToken(response.data['access'])
+        self.assertEqual(access['user_id'], self.user.id)
+        self.assertFalse(access['is_staff'])
+        self.assertTrue(access['is_active'])
+        self.assertEqual(access['token_version'], 0)
+
+    def test_requests_do_not_query_the_user(self):
+        self.assertEqual(self.client.get(reverse('content-list')).status_code, status.HTTP_200_OK)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('content-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(self.user_queries(queries), [])
+
+    def test_token_user_claims_are_not_mixed_up(self):
+        other = User.objects.create_user(email='other@test.com', password='Testpass@123', full_name='Other User')
+        Content.objects.create(title='Other Title', body='Test Body', summary='Test Summary', author=other)
+        response = self.client.get(reverse('content-list'))
+        self.assertEqual([content['title'] for content in response.data], ['Test Title'])
+        other.revoke_tokens()
+        user = ClaimsJWTAuthentication().get_user(AccessToken(str(CMSRefreshToken.for_user(other).access_token)))
+        self.assertEqual(
+            (user.pk, user.email, user.is_staff, user.is_active, user.token_version),
+            (other.pk, 'other@test.com', False, True, 1),
+        )
+
+    def test_token_user_owns_contents(self):
+        content = Content.objects.get()
+        response = self.client.put(reverse('content-update', kwargs={'pk': content.pk}), data={'title': 'New Title'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Content.objects.get(title='New Title').author, self.user)
+
+    def test_password_change_revokes_tokens(self):
+        self.user.set_password('Newpass@123')
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('content-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_staff_change_revokes_tokens(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('content-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_unrelated_change_keeps_tokens(self):
+        self.user.full_name = 'New Name'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('content-list')).status_code, status.HTTP_200_OK)
+
+    def test_revoked_refresh_token_is_refused(self):
+        self.user.revoke_tokens()
+        response = self.client.post(reverse('token_refresh'), data={'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_reads_current_claims(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.post(reverse('token_refresh'), data={'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(AccessToken(response.data['access'])['is_staff'])
+
+    def test_tokens_without_claims_query_the_user(self):
+        self.authenticate(RefreshToken.for_user(self.user).access_token)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('content-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.user_queries(queries)), 1)
+        self.user.revoke_tokens()
+        self.assertEqual(self.client.get(reverse('content-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PasswordHashingTest(TestCase):
+    def test_scrypt_hasher(self):
+        hasher = ScryptPasswordHasher()
+        encoded = hasher.encode('Testpass@123', hasher.salt())
+        self.assertTrue(encoded.startswith('scrypt$16384$'))
+        self.assertTrue(hasher.verify('Testpass@123', encoded))
+        self.assertFalse(hasher.verify('Testpass@124', encoded))
+        self.assertFalse(hasher.must_update(encoded))
+        self.assertTrue(hasher.must_update(hasher.encode('Testpass@123', hasher.salt(), n=2 ** 10)))
+
+    def test_new_users_use_the_preferred_hasher(self):
+        user = User.objects.create_user(email='testemail@test.com', password='Testpass@123', full_name='Test User')
+        self.assertEqual(user.password.split('$')[0], get_hasher().algorithm)
+
+    def test_login_rehashes_old_passwords(self):
+        user = User.objects.create(email='testemail@test.com', password=make_password('Testpass@123', hasher='pbkdf2_sha256'), full_name='Test User')
+        response = self.client.post(reverse('login'), data=json.dumps({'email': 'testemail@test.com', 'password': 'Testpass@123'}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertEqual(user.password.split('$')[0], get_hasher().algorithm)
+        self.assertEqual(user.token_version, 0)
+
+    def test_common_password_list_is_loaded_once(self):
+        self.assertIs(CommonPasswordValidator().passwords, CommonPasswordValidator().passwords)
+        self.assertIsInstance(CommonPasswordValidator().passwords, frozenset)
+
+    def test_registration_rejects_common_password(self):
+        payload = {'email': 'testuser@test.com', 'full_name': 'Test User', 'phone': 1234567890, 'pincode': 123456, 'password': 'Password'}
+        response = self.client.post(reverse('register'), data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('too common', str(response.data))
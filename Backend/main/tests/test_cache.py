@@ -0,0 +1,91 @@
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from django.core.files.base import ContentFile
+from main.models import User, Content, Category
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.other_user = User.objects.create_user(email='testemail2@test.com', password='testpassword123', full_name='Test User')
+        self.category = Category.objects.create(name='Test Category')
+        self.content = self.create_content(self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def create_content(self, author):
+        content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=ContentFile(b'%PDF-1.4', name='dummy.pdf'), author=author)
+        content.categories.add(self.category)
+        return content
+
+    def test_repeated_reads_are_served_from_cache(self):
+        for url in [reverse('content-list'), reverse('content-detail', kwargs={'pk': self.content.pk}),
+                    reverse('category-list'), reverse('category-detail', kwargs={'pk': self.category.pk})]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.data, second.data)
+            self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_not_modified(self):
+        response = self.client.get(reverse('content-list'))
+        response = self.client.get(reverse('content-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(response.content)
+        response = self.client.get(reverse('content-list'), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cache_is_scoped_per_user(self):
+        self.create_content(self.other_user)
+        self.assertEqual(len(self.client.get(reverse('content-list')).data), 1)
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(len(self.client.get(reverse('content-list')).data), 1)
+
+    def test_content_changes_invalidate_cache(self):
+        self.client.get(reverse('content-list'))
+        self.create_content(self.user)
+        self.assertEqual(len(self.client.get(reverse('content-list')).data), 2)
+        self.content.delete()
+        self.assertEqual(len(self.client.get(reverse('content-list')).data), 1)
+
+    @override_settings(BACKGROUND_TASK_WORKERS=0)
+    def test_responses_cached_before_the_commit_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_content(self.user)
+            # e.g. another request reading the committed rows while the transaction is open
+            self.client.get(reverse('content-list'))
+            with self.assertNumQueries(0):
+                self.client.get(reverse('content-list'))
+        with self.assertNumQueries(2):
+            self.client.get(reverse('content-list'))
+
+    def test_other_authors_do_not_invalidate_cache(self):
+        self.client.get(reverse('content-list'))
+        self.create_content(self.other_user)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('content-list'))
+
+    def test_category_changes_invalidate_cache(self):
+        self.client.get(reverse('category-list'))
+        self.client.get(reverse('content-detail', kwargs={'pk': self.content.pk}))
+        self.category.name = 'Renamed'
+        self.category.save()
+        self.assertEqual(self.client.get(reverse('category-list')).data[0]['name'], 'Renamed')
+        response = self.client.get(reverse('content-detail', kwargs={'pk': self.content.pk}))
+        self.assertEqual(response.data['categories'][0]['name'], 'Renamed')
+
+    def test_errors_are_not_cached(self):
+        url = reverse('content-detail', kwargs={'pk': self.content.pk + 100})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    @override_settings(CONTENT_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.client.get(reverse('category-list'))
+        with self.assertNumQueries(1):
+            self.client.get(reverse('category-list'))
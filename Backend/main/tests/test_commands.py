@@ -0,0 +1,56 @@
+import io
+import shutil
+import tempfile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from main.management.commands.generate_data import generate_pdf
+from main.models import User, Content, Category, PdfDerivative
+from main.pdf import count_pages
+from main.search import get_search_backend
+
+
+class GenerateDataTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def generate(self, **options):
+        call_command('generate_data', stdout=io.StringIO(), **options)
+
+    def test_generates_rows_links_and_pdfs(self):
+        users = User.objects.count()
+        self.generate(users=5, categories=4, contents=30, pdfs=3, batch_size=7)
+        self.assertEqual(User.objects.count(), users + 5)
+        self.assertEqual(Category.objects.count(), 4)
+        self.assertEqual(Content.objects.count(), 30)
+        self.assertEqual(Content.objects.filter(categories=None).count(), 0)
+        self.assertEqual(len({content.pdf_file.name for content in Content.objects.all()}), 3)
+        content = Content.objects.first()
+        with content.pdf_file.open('rb') as pdf_file:
+            self.assertEqual(count_pages(pdf_file.read()), content.pdf_page_count)
+        self.assertTrue(content.pdf_text)
+        self.assertEqual(PdfDerivative.objects.get(sha256=content.pdf_hash).text, content.pdf_text)
+        self.assertTrue(self.client.login(email='user-0@example.com', password='Generated@1234'))
+        self.assertIn(content.id, get_search_backend().search(content.title))
+
+    def test_generation_is_deterministic(self):
+        self.generate(users=2, categories=2, contents=10, pdfs=2, seed=7)
+        first = list(Content.objects.order_by('id').values_list('title', 'body', 'pdf_hash', 'author_id'))
+        Content.objects.all().delete()
+        self.generate(users=0, categories=0, contents=10, pdfs=2, seed=7)
+        self.assertEqual(list(Content.objects.order_by('id').values_list('title', 'body', 'pdf_hash', 'author_id')), first)
+
+    def test_generation_adds_to_existing_rows(self):
+        self.generate(users=2, categories=2, contents=0)
+        self.generate(users=2, categories=2, contents=0)
+        self.assertTrue(User.objects.filter(email='user-3@example.com').exists())
+        self.assertEqual(Category.objects.count(), 4)
+
+    def test_generated_pdfs(self):
+        data, page_count, digest = generate_pdf('seed')
+        self.assertEqual(generate_pdf('seed'), (data, page_count, digest))
+        self.assertTrue(data.startswith(b'%PDF-1.4'))
+        self.assertEqual(count_pages(data), page_count)
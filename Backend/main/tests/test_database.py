@@ -0,0 +1,19 @@
+from django.db import connection, connections
+from django.test import TestCase
+from main.backends.sqlite3.base import DatabaseWrapper
+
+
+class SQLiteConnectionTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    def test_connection_uses_transactions_that_wait_for_the_lock(self):
+        self.assertIsInstance(connections['default'], DatabaseWrapper)
+
+    def test_pragmas_are_applied(self):
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 20000)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+        self.assertEqual(self.pragma('temp_store'), 2)
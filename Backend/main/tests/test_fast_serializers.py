@@ -0,0 +1,69 @@
+import datetime
+import decimal
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from main.fast_serializers import ContentValuesSerializer, CategoryValuesSerializer
+from main.models import User, Content, Category
+from main.renderers import FastJSONRenderer
+from main.serializers import ContentSerializer, CategorySerializer
+from main.views import get_content_queryset
+
+
+class FastSerializerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.categories = [Category.objects.create(name=name) for name in ('Finance', 'Santé', 'Tech ')]
+        with_file = Content.objects.create(title='Annual report', body='Body', summary='Summary', pdf_file=ContentFile(b'%PDF-1.4', name='report 2023 é.pdf'), author=self.user)
+        with_file.categories.add(*self.categories)
+        Content.objects.create(title='No file  ', body='Body', summary='Summary', author=self.user)
+
+    def assertSameOutput(self):
+        contents = get_content_queryset().order_by('id')
+        expected = ContentSerializer(contents, many=True, context={'request': self.request}).data
+        fast_serializer = ContentValuesSerializer()
+        data = fast_serializer.to_representation(fast_serializer.get_queryset(contents), self.request)
+        self.assertEqual(data, expected)
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_content_output_matches_content_serializer(self):
+        self.assertSameOutput()
+
+    @override_settings(CONTENT_DENORMALIZED_CATEGORIES=True)
+    def test_content_output_matches_with_denormalized_categories(self):
+        Content.objects.refresh_category_data(Content.objects.values_list('id', flat=True))
+        self.assertSameOutput()
+
+    def test_category_output_matches_category_serializer(self):
+        fast_serializer = CategoryValuesSerializer()
+        categories = Category.objects.all()
+        data = fast_serializer.to_representation(fast_serializer.get_queryset(categories))
+        self.assertEqual(data, CategorySerializer(categories, many=True).data)
+
+    def test_renderer_falls_back_to_drf_encoder(self):
+        data = {'when': datetime.datetime(2023, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc), 'price': decimal.Decimal('1.50'), 1: None}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+        self.assertEqual(
+            FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+            JSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+        )
+
+    def test_views_return_the_same_responses(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        content = Content.objects.order_by('id').first()
+        for url in (reverse('content-list'), reverse('content-list') + '?page_size=1', reverse('content-detail', kwargs={'pk': content.pk}), reverse('category-list')):
+            cache.clear()
+            fast = client.get(url)
+            cache.clear()
+            with override_settings(FAST_READ_SERIALIZERS=False):
+                slow = client.get(url)
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast.content, slow.content)
@@ -0,0 +1,50 @@
+import unittest
+from django.db import connection
+from django.test import TestCase, override_settings
+from main.models import User, Content, Category
+from main.search import SQLiteFTSBackend
+from main.views import get_content_queryset
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+@override_settings(CONTENT_SEARCH_BACKEND='main.search.SQLiteFTSBackend')
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.category = Category.objects.create(name='Finance')
+        self.content = Content.objects.create(title='Annual report', body='Test Body', summary='Test Summary', author=self.user)
+        self.content.categories.add(self.category)
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn('USING', plan)
+        self.assertIn(index, plan)
+        self.assertNotIn('SCAN main_content ', plan + ' ')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_author_list_uses_author_index(self):
+        contents = get_content_queryset().filter(author=self.user)
+        self.assertUsesIndex(contents.order_by('id').explain(), 'content_author_id_idx')
+        self.assertUsesIndex(contents.filter(id__gt=self.content.id).order_by('id')[:50].explain(), 'content_author_id_idx')
+
+    def test_detail_uses_primary_key(self):
+        self.assertUsesIndex(get_content_queryset().filter(pk=self.content.pk, author=self.user).explain(), 'PRIMARY KEY')
+
+    def test_categories_are_loaded_by_index(self):
+        plan = Content.categories.through.objects.filter(content_id__in=[self.content.pk]).explain()
+        self.assertUsesIndex(plan, 'INDEX')
+
+    def test_case_insensitive_category_lookup_uses_expression_index(self):
+        self.assertEqual(list(Category.objects.filter_name('FINANCE')), [self.category])
+        self.assertUsesIndex(Category.objects.filter_name('FINANCE').explain(), 'category_name_lower_idx')
+
+    def test_search_uses_fts_and_primary_key(self):
+        backend = SQLiteFTSBackend()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN SELECT rowid FROM main_content_fts WHERE main_content_fts MATCH %s AND author_id = %s',
+                [backend.build_match('annual'), self.user.pk],
+            )
+            self.assertIn('VIRTUAL TABLE INDEX', ' '.join(str(column) for row in cursor.fetchall() for column in row))
+        contents = backend.filter_queryset(get_content_queryset().filter(author=self.user), 'annual')
+        self.assertEqual(list(contents), [self.content])
+        self.assertIn('PRIMARY KEY', contents.explain())
@@ -0,0 +1,40 @@
+from django.test import SimpleTestCase
+from main.inverted_index import InvertedIndex
+
+
+class InvertedIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(1, [('Python guide', 3), ('learn django quickly', 1)], author_id=1)
+        self.index.add(2, [('Django report', 3), ('numbers about python', 1)], author_id=2)
+        self.index.add(3, [('Rust book', 3), ('systems programming', 1)], author_id=1)
+
+    def test_and_query(self):
+        self.assertEqual(set(self.index.search('python django')), {1, 2})
+        self.assertEqual(self.index.search('python rust'), [])
+
+    def test_or_query(self):
+        self.assertEqual(set(self.index.search('rust OR report')), {2, 3})
+
+    def test_prefix_query(self):
+        self.assertEqual(self.index.search('prog*'), [3])
+        self.assertEqual(set(self.index.search('pyth', prefix=True)), {1, 2})
+        self.assertEqual(self.index.search('pyth'), [])
+
+    def test_bm25_prefers_weighted_fields(self):
+        self.assertEqual(self.index.search('python'), [1, 2])
+        self.assertEqual(self.index.search('django'), [2, 1])
+
+    def test_author_filter_and_limit(self):
+        self.assertEqual(self.index.search('python', author_id=2), [2])
+        self.assertEqual(len(self.index.search('python', limit=1)), 1)
+
+    def test_incremental_updates(self):
+        self.index.add(1, [('Go guide', 3)], author_id=1)
+        self.assertEqual(self.index.search('python'), [2])
+        self.assertEqual(self.index.search('go'), [1])
+        self.index.remove(2)
+        self.index.remove(42)
+        self.assertEqual(self.index.search('python'), [])
+        self.assertEqual(self.index.expand('py'), [])
+        self.assertEqual(len(self.index), 2)
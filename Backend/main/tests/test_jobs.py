@@ -0,0 +1,130 @@
+import io
+from datetime import timedelta
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from main.jobs import Worker, enqueue, queue_stats, task
+from main.models import Job
+
+calls = []
+
+
+@task(batch=True)
+def record_batch(items):
+    calls.append(items)
+
+
+@task()
+def record(*args):
+    calls.append(list(args))
+
+
+@task()
+def fail():
+    raise ValueError('broken')
+
+
+@task(batch=True)
+def fail_on_bad(items):
+    if 'bad' in items:
+        raise ValueError('bad item')
+    calls.append(items)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_writes_a_pending_job(self):
+        job = enqueue(record, 1, 'a')
+        self.assertEqual(Job.objects.get(), job)
+        self.assertEqual((job.name, job.args, job.status), ('main.tests.test_jobs.record', [1, 'a'], Job.PENDING))
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(calls, [[1, 'a']])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_QUEUE_ALWAYS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue(record, 1)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [[1]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_batch_jobs_are_merged(self):
+        enqueue(record_batch, [1, 2])
+        enqueue(record, 'other')
+        enqueue(record_batch, [2, 3])
+        enqueue(record_batch, [4])
+        self.assertEqual(Worker(batch_size=2).run_pending(), 4)
+        self.assertEqual(calls, [[1, 2, 3], ['other'], [4]])
+
+    def test_failed_batches_only_retry_the_failing_jobs(self):
+        enqueue(fail_on_bad, [1, 2])
+        enqueue(fail_on_bad, ['bad'])
+        enqueue(fail_on_bad, [3])
+        with self.assertLogs('main.jobs') as logs:
+            self.assertEqual(Worker().run_pending(), 3)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(calls, [[1, 2], [3]])
+        job = Job.objects.get()
+        self.assertEqual((job.args, job.status, job.attempts), ([['bad']], Job.PENDING, 1))
+
+    def test_delayed_jobs_wait(self):
+        enqueue(record, 1, delay=60)
+        self.assertEqual(Worker().run_pending(), 0)
+        self.assertEqual(queue_stats(), ({('main.tests.test_jobs.record', Job.PENDING): 1}, 0))
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(Worker().run_pending(), 1)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=10)
+    def test_failed_jobs_are_retried_with_backoff(self):
+        enqueue(fail)
+        with self.assertLogs('main.jobs', 'ERROR'):
+            Worker().run_pending()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.PENDING, 1, ''))
+        self.assertIn('ValueError: broken', job.last_error)
+        self.assertAlmostEqual((job.run_at - timezone.now()).total_seconds(), 10, delta=2)
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('main.jobs', 'ERROR'):
+            Worker().run_pending()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(Worker().run_pending(), 0)
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        enqueue(record, 1)
+        jobs = Worker().claim()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(Worker().claim(), [])
+        self.assertEqual(jobs[0].status, Job.RUNNING)
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_stale_locks_are_released(self):
+        enqueue(record, 1)
+        Worker().claim()
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(calls, [[1]])
+
+    def test_run_jobs_command(self):
+        enqueue(record_batch, [1])
+        enqueue(fail)
+        Job.objects.filter(name='main.tests.test_jobs.fail').update(status=Job.FAILED)
+        stdout = io.StringIO()
+        call_command('run_jobs', stats=True, stdout=stdout)
+        self.assertIn('main.tests.test_jobs.record_batch', stdout.getvalue())
+        call_command('run_jobs', once=True, threads=1)
+        self.assertEqual(calls, [[1]])
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [Job.FAILED])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_queue_depth_is_exposed(self):
+        enqueue(record, 1)
+        enqueue(record, 2)
+        text = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('cms_jobs{task="main.tests.test_jobs.record",status="pending"} 2', text)
+        self.assertIn('# TYPE cms_jobs_oldest_pending_seconds gauge', text)
@@ -0,0 +1,96 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.test import TestCase, AsyncRequestFactory, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from main import metrics
+from main.async_views import async_view
+from main.middleware import MetricsMiddleware
+from main.models import User, Content, Category
+from main.tokens import CMSRefreshToken
+from main.views import category_list_view
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name='Finance')
+
+    def get_series(self, histogram, *label_values):
+        return histogram.series[tuple(label_values)]
+
+    def test_requests_are_recorded_per_route(self):
+        response = self.client.get(reverse('category-list'))
+        counts = self.get_series(metrics.REQUEST_SECONDS, 'category-list', 'GET', 200)
+        self.assertEqual(counts[-2], 1)
+        # session-less forced authentication: the categories query only
+        self.assertEqual(self.get_series(metrics.QUERY_COUNT, 'category-list', 'GET')[-1], 1)
+        self.assertEqual(self.get_series(metrics.RESPONSE_BYTES, 'category-list', 'GET')[-1], len(response.content))
+        self.assertGreater(self.get_series(metrics.RENDER_SECONDS, 'category-list', 'GET')[-1], 0)
+        self.client.get(reverse('content-detail', kwargs={'pk': 999}))
+        self.assertIn(('content-detail', 'GET', 400), metrics.REQUEST_SECONDS.series)
+
+    async def test_async_requests_are_recorded(self):
+        view = async_view(category_list_view)
+
+        async def get_response(request):
+            # the handler renders the response below the middlewares
+            response = await view(request)
+            return await sync_to_async(response.render)()
+        middleware = MetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        token = CMSRefreshToken.for_user(self.user).access_token
+        response = await middleware(AsyncRequestFactory().get('/', Authorization='Bearer %s' % token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_series(metrics.REQUEST_SECONDS, 'unmatched', 'GET', 200)[-2], 1)
+        # the token version of the user, not cached yet, and the categories
+        self.assertEqual(self.get_series(metrics.QUERY_COUNT, 'unmatched', 'GET')[-1], 2)
+
+    @override_settings(CONTENT_STREAM_CHUNK_SIZE=2)
+    def test_streamed_responses_are_measured_to_the_end(self):
+        for number in range(5):
+            Content.objects.create(title='Title %d' % number, body='Body', summary='Summary', author=self.user)
+        response = self.client.get(reverse('content-list'))
+        self.assertTrue(response.streaming)
+        self.assertNotIn(('content-list', 'GET', 200), metrics.REQUEST_SECONDS.series)
+        content = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(self.get_series(metrics.RESPONSE_BYTES, 'content-list', 'GET')[-1], len(content))
+        # the rows and the categories of each of the 3 chunks
+        self.assertEqual(self.get_series(metrics.QUERY_COUNT, 'content-list', 'GET')[-1], 4)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('category-list'))
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE cms_request_duration_seconds histogram', text)
+        self.assertIn('cms_request_duration_seconds_count{route="category-list",method="GET",status="200"} 1', text)
+        self.assertIn('cms_request_queries_bucket{route="category-list",method="GET",le="+Inf"} 1', text)
+
+    def test_metrics_endpoint_access(self):
+        # loopback is the address of every request behind a local reverse proxy
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_200_OK)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.assertLogs('main.middleware', 'WARNING') as logs:
+            self.client.get(reverse('category-list'))
+        self.assertIn('Slow request GET /api/categories/ (category-list, 200)', logs.output[0])
+        self.assertIn('main_category', logs.output[0])
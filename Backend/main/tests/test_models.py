@@ -1,6 +1,12 @@
-from django.test import TestCase
+from unittest.mock import patch
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from main.models import User, Category, Content
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from main.models import DENORMALIZED_CATEGORY_FIELDS, User, Category, Content
 from django.core.files.base import ContentFile
 
 
@@ -77,3 +83,82 @@ class ContentModelTest(TestCase):
         self.assertEqual(content.summary, 'Test Summary')
         self.assertEqual(content.author, user)
         self.assertEqual(list(content.categories.all()), [self.category])
+
+
+class ContentBulkCreateTest(TransactionTestCase):
+    def test_bulk_create_with_ids_requires_a_transaction(self):
+        user = User.objects.create_user(email='test@test.com', password='testpassword123', full_name='Test User')
+        contents = [Content(title='Title %d' % number, body='Test Body', summary='Test Summary', pdf_file='pdfs/test.pdf', author=user) for number in range(2)]
+        with self.assertRaises(TransactionManagementError):
+            Content.objects.bulk_create_with_ids(contents)
+        with transaction.atomic():
+            contents = Content.objects.bulk_create_with_ids(contents)
+        self.assertEqual([content.pk for content in contents], list(Content.objects.order_by('id').values_list('id', flat=True)))
+
+    @override_settings(BACKGROUND_TASK_WORKERS=0)
+    def test_bulk_create_with_ids_without_returned_ids(self):
+        user = User.objects.create_user(email='test@test.com', password='testpassword123', full_name='Test User')
+        contents = [Content(title='Title %d' % number, body='Test Body', summary='Test Summary', pdf_file='pdfs/test.pdf', author=user) for number in range(2)]
+        # a backend with concurrent writers (MySQL) inserts one by one
+        with patch.object(connection, 'vendor', 'mysql'), transaction.atomic():
+            contents = Content.objects.bulk_create_with_ids(contents)
+        self.assertEqual([content.pk for content in contents], list(Content.objects.order_by('id').values_list('id', flat=True)))
+        self.assertFalse(any(content._state.adding for content in contents))
+
+
+@override_settings(CONTENT_DENORMALIZED_CATEGORIES=True)
+class ContentCategoryDataTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@test.com', password='testpassword123', full_name='Test User')
+        self.finance = Category.objects.create(name='Finance')
+        self.health = Category.objects.create(name='Health')
+        self.content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', author=self.user)
+
+    def category_data(self):
+        content = Content.objects.get(pk=self.content.pk)
+        return content.category_data, content.category_names
+
+    def test_m2m_changes_are_copied(self):
+        self.content.categories.add(self.finance, self.health)
+        self.assertEqual(self.category_data(), ([{'id': self.finance.id, 'name': 'Finance'}, {'id': self.health.id, 'name': 'Health'}], 'Finance Health'))
+        self.content.categories.remove(self.finance)
+        self.assertEqual(self.category_data(), ([{'id': self.health.id, 'name': 'Health'}], 'Health'))
+        self.health.content_set.clear()
+        self.assertEqual(self.category_data(), ([], ''))
+
+    def test_set_categories_is_copied(self):
+        Content.objects.set_categories({self.content.pk: [self.finance.pk]})
+        self.assertEqual(self.category_data(), ([{'id': self.finance.id, 'name': 'Finance'}], 'Finance'))
+
+    def test_category_rename_and_delete_are_copied(self):
+        self.content.categories.add(self.finance, self.health)
+        self.finance.name = 'Money'
+        self.finance.save()
+        self.assertEqual(self.category_data()[1], 'Money Health')
+        self.health.delete()
+        self.assertEqual(self.category_data(), ([{'id': self.finance.id, 'name': 'Money'}], 'Money'))
+
+    def test_save_without_the_copy_does_not_overwrite_it(self):
+        stale = Content.objects.defer(*DENORMALIZED_CATEGORY_FIELDS).get(pk=self.content.pk)
+        self.content.categories.add(self.finance)
+        stale.title = 'New Title'
+        stale.save()
+        self.assertEqual(self.category_data()[1], 'Finance')
+
+    def test_save_keeps_the_model_contract(self):
+        content = Content.objects.get(pk=self.content.pk)
+        content.category_names = 'Edited'
+        content.save()
+        self.assertEqual(self.category_data()[1], 'Edited')
+        # a row deleted meanwhile is inserted again
+        Content.objects.filter(pk=content.pk).delete()
+        content.save()
+        self.assertTrue(Content.objects.filter(pk=content.pk).exists())
+
+    def test_update_view_does_not_overwrite_the_copy(self):
+        self.content.categories.add(self.finance)
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.put(reverse('content-update', kwargs={'pk': self.content.pk}), data={'categories': [self.health.pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.category_data(), ([{'id': self.health.id, 'name': 'Health'}], 'Health'))
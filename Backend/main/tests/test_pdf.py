@@ -0,0 +1,327 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import zlib
+from unittest.mock import patch
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from main.models import User, Content, Job, PdfDerivative
+from main.pdf import StreamDecoder, count_pages, is_pdf, extract_text
+from main.tasks import process_pdfs, release_pdf_derivatives, release_pdf_files
+from main.management.commands.generate_data import generate_pdf
+
+with open(os.path.join(os.path.dirname(__file__), 'dummy.pdf'), 'rb') as f:
+    dummy_pdf_content = f.read()
+
+
+class PdfHelpersTest(TestCase):
+    def test_count_pages(self):
+        self.assertEqual(count_pages(dummy_pdf_content), 1)
+        self.assertEqual(count_pages(b'%PDF-1.4 1 0 obj << /Type /Pages /Kids [2 0 R 3 0 R] /Count 2 >> endobj'), 2)
+        self.assertEqual(count_pages(b'%PDF-1.4 << /Type /Page >> << /Type /Page >>'), 2)
+        self.assertIsNone(count_pages(b'%PDF-1.5 compressed'))
+
+    def test_is_pdf(self):
+        self.assertTrue(is_pdf(ContentFile(dummy_pdf_content)))
+        self.assertFalse(is_pdf(ContentFile(b'GIF89a')))
+
+    def test_extract_text(self):
+        # subset TrueType font mapped through its ToUnicode CMap
+        self.assertEqual(extract_text(dummy_pdf_content), 'Dummy PDF file')
+        data, page_count, digest = generate_pdf('text')
+        self.assertEqual(len(extract_text(data).splitlines()), page_count)
+        stream = zlib.compress(b'BT /F1 12 Tf (Hello \\(PDF\\)) Tj 0 -14 Td [(Wor) -10 (ld) -400 (again)] TJ ET')
+        data = (
+            b'%%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n'
+            b'2 0 obj << /Type /Pages /Kids [3 0 R] /Count 1 >> endobj\n'
+            b'3 0 obj << /Type /Page /Parent 2 0 R /Contents 4 0 R >> endobj\n'
+            b'4 0 obj << /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream\nendobj\n%%%%EOF' % (len(stream), stream)
+        )
+        self.assertEqual(extract_text(data), 'Hello (PDF)\nWorld again')
+        self.assertEqual(extract_text(data, max_length=5), 'Hello')
+        self.assertEqual(extract_text(b'%PDF-1.4 garbage'), '')
+
+    def test_inflated_streams_are_capped(self):
+        decode = StreamDecoder(max_length=1000)
+        bomb = zlib.compress(b'0' * 1000000)
+        self.assertEqual(decode(b'<< /Filter /FlateDecode >>', bomb), b'0' * 1000)
+        self.assertIsNone(decode(b'<< /Filter /FlateDecode >>', bomb))
+        self.assertEqual(decode(b'<< /Length 3 >>', b'raw'), b'raw')
+        self.assertIsNone(decode(b'<< /Filter /DCTDecode >>', b'jpeg'))
+
+    def test_process_pdfs_stores_derivatives(self):
+        user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=ContentFile(dummy_pdf_content, name='dummy.pdf'), author=user)
+        self.assertIsNone(content.pdf_page_count)
+        # in the pdf processes
+        process_pdfs([content.id])
+        content.refresh_from_db()
+        self.assertEqual(content.pdf_page_count, 1)
+        self.assertEqual(content.pdf_text, 'Dummy PDF file')
+        self.assertEqual(content.pdf_hash, hashlib.sha256(dummy_pdf_content).hexdigest())
+        self.assertEqual(PdfDerivative.objects.get().sha256, content.pdf_hash)
+
+
+class PdfUploadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, data, name='dummy.pdf'):
+        payload = {'title': 'Test Title', 'body': 'Test Body', 'summary': 'Test Summary',
+                   'pdf_file': SimpleUploadedFile(name, data, content_type='application/pdf')}
+        return self.client.post(reverse('content-create'), data=payload, format='multipart')
+
+    def test_upload_is_hashed_while_streaming(self):
+        response = self.upload(dummy_pdf_content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        content = Content.objects.get()
+        self.assertEqual(content.pdf_hash, hashlib.sha256(dummy_pdf_content).hexdigest())
+        self.assertIsNone(content.pdf_page_count)
+
+    def test_upload_queues_pdf_processing(self):
+        self.upload(dummy_pdf_content)
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'main.tasks.process_pdfs')
+        self.assertEqual(job.args, [[Content.objects.get().id]])
+
+    def test_non_pdf_upload_is_rejected(self):
+        response = self.upload(b'GIF89a not a pdf', name='image.gif')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not a PDF', response.data['error'])
+        self.assertFalse(Content.objects.exists())
+
+    def test_other_uploads_use_the_default_handlers(self):
+        request = RequestFactory().post('/', {'file': SimpleUploadedFile('notes.txt', b'not a pdf')})
+        self.assertEqual(request.FILES['file'].read(), b'not a pdf')
+
+    @override_settings(PDF_UPLOAD_MAX_SIZE=1024)
+    def test_too_large_upload_is_rejected(self):
+        response = self.upload(dummy_pdf_content)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('maximum allowed size', response.data['error'])
+        self.assertFalse(Content.objects.exists())
+
+
+@override_settings(JOB_QUEUE_ALWAYS_EAGER=True, PDF_RELEASE_GRACE=0)
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+
+    def create(self, data=dummy_pdf_content, name='dummy.pdf'):
+        return Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=ContentFile(data, name=name), author=self.user)
+
+    def test_identical_pdfs_share_one_file(self):
+        first = self.create()
+        second = self.create(name='copy.pdf')
+        digest = hashlib.sha256(dummy_pdf_content).hexdigest()
+        self.assertEqual(first.pdf_file.name, 'pdfs/%s/%s/%s.pdf' % (digest[:2], digest[2:4], digest))
+        self.assertEqual(second.pdf_file.name, first.pdf_file.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.pdf_file.path))), 1)
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        first = self.create()
+        second = self.create()
+        path = first.pdf_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(JOB_QUEUE_ALWAYS_EAGER=False, BACKGROUND_TASK_WORKERS=0, PDF_RELEASE_GRACE=60)
+    def test_recently_saved_file_is_kept(self):
+        storage = Content._meta.get_field('pdf_file').storage
+        name = storage.save('pdfs/dummy.pdf', ContentFile(dummy_pdf_content))
+        path = storage.path(name)
+        os.utime(path, (0, 0))
+        self.assertEqual(storage.save('pdfs/copy.pdf', ContentFile(dummy_pdf_content)), name)
+        release_pdf_files([name])
+        self.assertTrue(os.path.exists(path))
+        job = Job.objects.get()
+        self.assertEqual(job.args, [[name]])
+        self.assertGreater(job.run_at, job.created_at)
+        os.utime(path, (0, 0))
+        release_pdf_files([name])
+        self.assertFalse(os.path.exists(path))
+
+    def test_replaced_file_is_released(self):
+        content = self.create()
+        path = content.pdf_file.path
+        content = Content.objects.get(pk=content.pk)
+        content.pdf_file = ContentFile(dummy_pdf_content + b'\n%%EOF', name='new.pdf')
+        with self.captureOnCommitCallbacks(execute=True):
+            content.save()
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(content.pdf_file.path))
+
+
+@override_settings(JOB_QUEUE_ALWAYS_EAGER=True, PDF_PROCESSING_PROCESSES=0)
+class PdfDerivativesTest(TestCase):
+    thumbnail = b'\x89PNG\r\n\x1a\nthumbnail'
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        render = patch('main.pdf.render_thumbnail', return_value=self.thumbnail)
+        render.start()
+        self.addCleanup(render.stop)
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, data=dummy_pdf_content):
+        payload = {'title': 'Test Title', 'body': 'Test Body', 'summary': 'Test Summary',
+                   'pdf_file': SimpleUploadedFile('dummy.pdf', data, content_type='application/pdf')}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('content-create'), data=payload, format='multipart')
+        return Content.objects.latest('id')
+
+    def test_upload_gets_text_and_thumbnail(self):
+        content = self.upload()
+        self.assertEqual(content.pdf_text, 'Dummy PDF file')
+        with content.thumbnail.open('rb') as f:
+            self.assertEqual(f.read(), self.thumbnail)
+        response = self.client.get(reverse('content-detail', kwargs={'pk': content.pk}))
+        self.assertEqual(response.data['thumbnail'], 'http://testserver/media/' + content.thumbnail.name)
+        response = self.client.get(reverse('content-list') + '?query=dummy')
+        self.assertEqual([item['id'] for item in response.data], [content.pk])
+
+    def test_duplicates_reuse_the_derivatives(self):
+        first = self.upload()
+        with patch('main.tasks.derive') as derive:
+            second = self.upload()
+        derive.assert_not_called()
+        self.assertEqual((second.pdf_text, second.thumbnail.name), (first.pdf_text, first.thumbnail.name))
+
+    def test_derivatives_are_released_with_the_last_content(self):
+        first = self.upload()
+        second = self.upload()
+        path = first.thumbnail.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(PdfDerivative.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(PdfDerivative.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(PDF_RELEASE_GRACE=0)
+    def test_tasks_read_from_the_primary(self):
+        content = self.upload()
+        Content.objects.filter(pk=content.pk).update(pdf_text='', pdf_page_count=None)
+        # the jobs run right after the commit, before a replica may have the rows: reading one fails here
+        with override_settings(DATABASE_REPLICAS=['replica_0']):
+            process_pdfs([content.pk])
+        content.refresh_from_db()
+        self.assertEqual(content.pdf_text, 'Dummy PDF file')
+        path = content.pdf_file.path
+        Content.objects.filter(pk=content.pk).delete()
+        with override_settings(DATABASE_REPLICAS=['replica_0']):
+            release_pdf_files([content.pdf_file.name])
+            release_pdf_derivatives([content.pdf_hash])
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(PdfDerivative.objects.exists())
+
+    def test_replaced_pdf_is_processed_again(self):
+        content = self.upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                reverse('content-update', kwargs={'pk': content.pk}),
+                data={'pdf_file': SimpleUploadedFile('new.pdf', dummy_pdf_content + b'\n%%EOF', content_type='application/pdf')},
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content.refresh_from_db()
+        self.assertEqual(content.pdf_hash, hashlib.sha256(dummy_pdf_content + b'\n%%EOF').hexdigest())
+        self.assertEqual(content.pdf_text, 'Dummy PDF file')
+        self.assertEqual(list(PdfDerivative.objects.values_list('sha256', flat=True)), [content.pdf_hash])
+
+
+class PdfDownloadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.client.force_authenticate(user=self.user)
+        self.content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=ContentFile(dummy_pdf_content, name='dummy.pdf'), pdf_hash=hashlib.sha256(dummy_pdf_content).hexdigest(), author=self.user)
+        self.url = reverse('content-pdf', kwargs={'pk': self.content.pk})
+
+    def download(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_download(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, dummy_pdf_content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Length'], str(len(dummy_pdf_content)))
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="test-title.pdf"')
+        self.assertEqual(response['ETag'], '"%s"' % self.content.pdf_hash)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_other_users_pdf_is_not_found(self):
+        other = User.objects.create_user(email='other@test.com', password='testpassword123', full_name='Other User')
+        self.client.force_authenticate(user=other)
+        response, body = self.download()
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_conditional_requests(self):
+        response, body = self.download(HTTP_IF_NONE_MATCH='"%s"' % self.content.pdf_hash)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(body, b'')
+        last_modified = self.download()[0]['Last-Modified']
+        response, body = self.download(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_range_requests(self):
+        size = len(dummy_pdf_content)
+        response, body = self.download(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body, dummy_pdf_content[:10])
+        self.assertEqual(response['Content-Range'], 'bytes 0-9/%d' % size)
+        self.assertEqual(response['Content-Length'], '10')
+        response, body = self.download(HTTP_RANGE='bytes=-5')
+        self.assertEqual(body, dummy_pdf_content[-5:])
+        response, body = self.download(HTTP_RANGE='bytes=10-')
+        self.assertEqual(body, dummy_pdf_content[10:])
+        response, body = self.download(HTTP_RANGE='bytes=%d-' % size)
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % size)
+
+    def test_stale_if_range_sends_whole_file(self):
+        response, body = self.download(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, dummy_pdf_content)
+
+    @override_settings(PDF_SENDFILE_MODE='x-accel-redirect', PDF_SENDFILE_PREFIX='/protected/')
+    def test_x_accel_redirect(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.content.pdf_file.name)
+        self.assertEqual(body, b'')
@@ -0,0 +1,141 @@
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from django.core.files.base import ContentFile
+from main.models import User, Content, Category
+
+
+class ContentQueryCountTest(TestCase):
+    """
+    Regression tests asserting that content reads issue a constant number of
+    queries no matter how many contents or categories are returned.
+    Authentication is forced so only the view's own queries are counted.
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='testemail@test.com',
+            password='testpassword123',
+            full_name='Test User'
+        )
+        self.superuser = User.objects.create_superuser(
+            email='testemail2@test.com',
+            password='testpassword123',
+            full_name='Test User'
+        )
+        self.categories = [Category.objects.create(name='Category %d' % i) for i in range(3)]
+        self.client.force_authenticate(user=self.user)
+
+    def create_contents(self, count):
+        contents = []
+        for i in range(count):
+            content = Content.objects.create(title='Title %d' % i, body='Body', summary='Summary', pdf_file=ContentFile(b'%PDF-1.4', name='dummy.pdf'), author=self.user)
+            content.categories.add(*self.categories)
+            contents.append(content)
+        return contents
+
+    def test_content_list_query_count_is_constant(self):
+        self.create_contents(1)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('content-list'))
+        self.assertEqual(len(response.data), 1)
+        self.create_contents(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('content-list'))
+        self.assertEqual(len(response.data), 11)
+        self.assertEqual(len(response.data[0]['categories']), 3)
+
+    def test_content_list_with_denormalized_categories_is_one_query(self):
+        self.create_contents(1)
+        expected = self.client.get(reverse('content-list')).data
+        cache.clear()
+        with override_settings(CONTENT_DENORMALIZED_CATEGORIES=True):
+            Content.objects.refresh_category_data(Content.objects.values_list('id', flat=True))
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('content-list'))
+        self.assertEqual(response.data, expected)
+
+    def test_content_list_query_count_for_admin_user(self):
+        self.create_contents(10)
+        self.client.force_authenticate(user=self.superuser)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('content-list'))
+        self.assertEqual(len(response.data), 10)
+
+    def test_content_list_paginated_query_count(self):
+        self.create_contents(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('content-list') + '?page_size=5')
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_content_list_fields(self):
+        content = self.create_contents(1)[0]
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('content-list') + '?fields=id,title')
+        self.assertEqual(response.data, [{'id': content.id, 'title': 'Title 0'}])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('content-list') + '?fields=title,pdf_file&page_size=5')
+        self.assertEqual(list(response.data['results'][0]), ['title', 'pdf_file'])
+        self.assertTrue(response.data['results'][0]['pdf_file'].startswith('http://testserver/'))
+
+    def test_content_list_exclude_matches_full_representation(self):
+        self.create_contents(3)
+        expected = self.client.get(reverse('content-list')).data
+        for denormalized in (False, True):
+            cache.clear()
+            with override_settings(CONTENT_DENORMALIZED_CATEGORIES=denormalized):
+                Content.objects.refresh_category_data(Content.objects.values_list('id', flat=True))
+                with self.assertNumQueries(1 if denormalized else 2):
+                    response = self.client.get(reverse('content-list') + '?exclude=body')
+            self.assertEqual(response.data, [
+                {key: value for key, value in content.items() if key != 'body'} for content in expected
+            ])
+
+    def test_content_list_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('content-list') + '?fields=id,author')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('author', response.data['error'])
+
+    def test_content_search_query_count_is_constant(self):
+        self.create_contents(10)
+        # one search index lookup, the contents and their categories
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('content-list') + '?query=Title')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 10)
+
+    def test_content_detail_query_count(self):
+        content = self.create_contents(1)[0]
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('content-detail', kwargs={'pk': content.id}))
+        self.assertEqual(len(response.data['categories']), 3)
+
+    def test_content_bulk_update_query_count_is_constant(self):
+        category_ids = [category.id for category in self.categories[1:]]
+        for count in (2, 10):
+            documents = [{'id': content.id, 'title': 'New', 'categories': category_ids} for content in self.create_contents(count)]
+            # contents and categories lookups, a savepoint around the update and the through table
+            # diff (select, delete), then the search index refresh (contents, categories, savepoint,
+            # fts delete and insert)
+            with self.assertNumQueries(13):
+                response = self.client.put(reverse('content-bulk-update'), data=documents, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_content_update_query_count_is_independent_of_categories(self):
+        content = self.create_contents(1)[0]
+        many_categories = [Category.objects.create(name='Extra %d' % i) for i in range(60)]
+        counts = []
+        # every step replaces all links, so each one deletes and inserts through rows
+        for categories in (many_categories[:50], many_categories[50:], self.categories):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.put(reverse('content-update', kwargs={'pk': content.id}), data={'categories': [category.id for category in categories]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(set(content.categories.values_list('id', flat=True)), {category.id for category in categories})
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertLess(counts[0], 20)
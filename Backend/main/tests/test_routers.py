@@ -0,0 +1,89 @@
+import asyncio
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from main.middleware import ReplicaPinningMiddleware, PIN_COOKIE
+from main.models import Content, Job, User
+from main.tokens import CMSRefreshToken
+from main.routers import PrimaryReplicaRouter, pinned_to_primary
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_PIN_SECONDS=10)
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def handle(self, request, status=200):
+        seen = {}
+
+        def get_response(request):
+            seen['read'] = self.router.db_for_read(Content)
+            return HttpResponse(status=status)
+        response = ReplicaPinningMiddleware(get_response)(request)
+        return response, seen['read']
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Content), 'replica_0')
+        self.assertEqual(self.router.db_for_write(Content), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'main'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'main'))
+
+    def test_job_queue_reads_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Job), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        self.assertEqual(self.router.db_for_read(Content), 'default')
+        response, read = self.handle(self.factory.post('/'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_pinned_reads_use_primary(self):
+        token = pinned_to_primary.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Content), 'default')
+        finally:
+            pinned_to_primary.reset(token)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response, read = self.handle(self.factory.post('/'))
+        self.assertEqual(read, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+        response, read = self.handle(self.factory.get('/', HTTP_COOKIE='%s=1' % PIN_COOKIE))
+        self.assertEqual(read, 'default')
+        response, read = self.handle(self.factory.get('/'))
+        self.assertEqual(read, 'replica_0')
+        self.assertFalse(pinned_to_primary.get())
+
+    def test_failed_writes_do_not_pin(self):
+        response, read = self.handle(self.factory.post('/'), status=400)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writes_pin_the_jwt_user_without_cookies(self):
+        user, other = User(id=1, email='one@test.com'), User(id=2, email='two@test.com')
+        header = {'HTTP_AUTHORIZATION': 'Bearer %s' % CMSRefreshToken.for_user(user).access_token}
+        other_header = {'HTTP_AUTHORIZATION': 'Bearer %s' % CMSRefreshToken.for_user(other).access_token}
+        request = self.factory.post('/', **header)
+        request.user = user
+        self.handle(request)
+        response, read = self.handle(self.factory.get('/', **header))
+        self.assertEqual(read, 'default')
+        response, read = self.handle(self.factory.get('/', **other_header))
+        self.assertEqual(read, 'replica_0')
+        response, read = self.handle(self.factory.get('/', HTTP_AUTHORIZATION='Bearer invalid'))
+        self.assertEqual(read, 'replica_0')
+
+    async def test_async_requests_are_pinned(self):
+        seen = {}
+
+        async def get_response(request):
+            seen['read'] = self.router.db_for_read(Content)
+            return HttpResponse()
+        middleware = ReplicaPinningMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(self.factory.post('/'))
+        self.assertEqual(seen['read'], 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        await middleware(self.factory.get('/'))
+        self.assertEqual(seen['read'], 'replica_0')
@@ -0,0 +1,185 @@
+from contextlib import nullcontext
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.core.files.base import ContentFile
+from main.inverted_index import InvertedIndex
+from main.models import User, Content, Category
+from main.search import SQLiteFTSBackend, DatabaseSearchBackend, InMemorySearchBackend, get_search_backend, _load_backend
+
+
+class SearchBackendTestMixin:
+    backend_class = None
+
+    def setUp(self):
+        cache.clear()
+        self.backend = self.get_backend()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.other_user = User.objects.create_user(email='testemail2@test.com', password='testpassword123', full_name='Test User')
+        self.category = Category.objects.create(name='Finance')
+        self.guide = self.create_content('Python guide', 'Learn django quickly', 'A short guide', self.user)
+        self.report = self.create_content('Quarterly report', 'Numbers about python usage', 'Report', self.other_user)
+        self.report.categories.add(self.category)
+
+    def get_backend(self):
+        return self.backend_class()
+
+    def changes(self):
+        """
+        Context manager around writes whose effects the next assertion expects.
+        """
+        return nullcontext()
+
+    def create_content(self, title, body, summary, author):
+        return Content.objects.create(title=title, body=body, summary=summary, pdf_file=ContentFile(b'%PDF-1.4', name='dummy.pdf'), author=author)
+
+    def test_search_pages(self):
+        ids = self.backend.search('python')
+        self.assertEqual(self.backend.search('python', limit=1) + self.backend.search('python', offset=1), ids)
+        self.assertEqual(self.backend.search('python', offset=2), [])
+
+    def test_search_matches_any_field(self):
+        self.assertEqual(set(self.backend.search('python')), {self.guide.id, self.report.id})
+        self.assertEqual(self.backend.search('django'), [self.guide.id])
+        self.assertEqual(self.backend.search('finance'), [self.report.id])
+
+    def test_search_scoped_by_author(self):
+        self.assertEqual(self.backend.search('python', author=self.user), [self.guide.id])
+
+    def test_search_follows_category_changes(self):
+        self.assertEqual(self.backend.search('finance'), [self.report.id])
+        with self.changes():
+            self.category.name = 'Marketing'
+            self.category.save()
+        self.assertEqual(self.backend.search('finance'), [])
+        self.assertEqual(self.backend.search('marketing'), [self.report.id])
+        with self.changes():
+            self.report.categories.clear()
+        self.assertEqual(self.backend.search('marketing'), [])
+        with self.changes():
+            self.category.content_set.add(self.guide)
+        self.assertEqual(self.backend.search('marketing'), [self.guide.id])
+        with self.changes():
+            self.category.delete()
+        self.assertEqual(self.backend.search('marketing'), [])
+
+    def test_search_follows_content_changes(self):
+        self.assertEqual(self.backend.search('rust'), [])
+        with self.changes():
+            self.guide.title = 'Rust guide'
+            self.guide.save()
+        self.assertEqual(self.backend.search('rust'), [self.guide.id])
+        with self.changes():
+            self.guide.delete()
+        self.assertEqual(self.backend.search('rust'), [])
+
+    def test_search_matches_pdf_text(self):
+        self.assertEqual(self.backend.search('kubernetes'), [])
+        with self.changes():
+            self.guide.pdf_text = 'Appendix about kubernetes'
+            self.guide.save()
+        self.assertEqual(self.backend.search('kubernetes'), [self.guide.id])
+
+
+class SQLiteFTSBackendTest(SearchBackendTestMixin, TestCase):
+    backend_class = SQLiteFTSBackend
+
+    def test_setup_upgrades_an_outdated_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE main_content_fts')
+            cursor.execute("CREATE VIRTUAL TABLE main_content_fts USING fts5(title, body, summary, categories, author_id UNINDEXED)")
+        self.backend.setup()
+        self.assertEqual(self.backend.search('finance'), [self.report.id])
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.backend.search('quart rep'), [self.report.id])
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.backend.search('python'), [self.guide.id, self.report.id])
+
+    def test_search_ignores_fts_syntax(self):
+        self.assertEqual(self.backend.search('"python" OR NEAR('), [])
+        self.assertEqual(self.backend.search('***'), [])
+
+    def test_rebuild(self):
+        self.backend.rebuild()
+        self.assertEqual(self.backend.search('finance'), [self.report.id])
+
+    def test_content_list_view_search(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('content-list') + '?query=python')
+        self.assertEqual([item['id'] for item in response.data], [self.guide.id])
+
+    def test_content_list_view_search_keeps_relevance_order_across_pages(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser(email='admin@test.com', password='testpassword123'))
+        response = client.get(reverse('content-list') + '?query=python&page_size=1')
+        self.assertEqual([item['id'] for item in response.data['results']], [self.guide.id])
+        response = client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [self.report.id])
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_content_list_view_search_exposes_truncation(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser(email='admin@test.com', password='testpassword123'))
+        with patch.object(SQLiteFTSBackend, 'max_results', 1):
+            response = client.get(reverse('content-list') + '?query=python')
+        self.assertEqual([item['id'] for item in response.data], [self.guide.id])
+        link = response['Link']
+        self.assertTrue(link.endswith('>; rel="next"'))
+        response = client.get(link[1:-len('>; rel="next"')])
+        self.assertEqual([item['id'] for item in response.data['results']], [self.report.id])
+
+
+class DatabaseSearchBackendTest(SearchBackendTestMixin, TestCase):
+    backend_class = DatabaseSearchBackend
+
+
+@override_settings(CONTENT_DENORMALIZED_CATEGORIES=True)
+class DenormalizedDatabaseSearchBackendTest(DatabaseSearchBackendTest):
+    pass
+
+
+@override_settings(CONTENT_SEARCH_BACKEND='main.search.InMemorySearchBackend', JOB_QUEUE_ALWAYS_EAGER=True)
+class InMemorySearchBackendTest(SearchBackendTestMixin, TestCase):
+    backend_class = InMemorySearchBackend
+
+    def get_backend(self):
+        # the backend is a per process singleton, start every test from an empty one
+        _load_backend.cache_clear()
+        return get_search_backend()
+
+    def changes(self):
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.backend.search('python'), [self.guide.id, self.report.id])
+
+    def test_content_list_view_search(self):
+        client = APIClient()
+        client.force_authenticate(user=self.other_user)
+        response = client.get(reverse('content-list') + '?query=pyth')
+        self.assertEqual([item['id'] for item in response.data], [self.report.id])
+
+    def test_changes_committed_during_the_first_rebuild_are_kept(self):
+        add = InvertedIndex.add
+        changed = []
+
+        def add_while_loading(index, *args):
+            if not changed:
+                # the guide has been read by the rebuild, which has not swapped its index in yet
+                changed.append(True)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.guide.title = 'Kubernetes guide'
+                    self.guide.save()
+            return add(index, *args)
+        self.assertFalse(self.backend.loaded)
+        with patch.object(InvertedIndex, 'add', autospec=True, side_effect=add_while_loading):
+            self.assertEqual(self.backend.search('quarterly'), [self.report.id])
+        self.assertEqual(self.backend.search('kubernetes'), [self.guide.id])
+        self.assertEqual(self.backend.search('python'), [self.report.id])
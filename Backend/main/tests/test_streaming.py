@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+import json
+from django.http import HttpResponse
+from django.test import TestCase, AsyncRequestFactory, override_settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from main.middleware import CompressionMiddleware
+from main.models import User, Content, Category
+
+
+@override_settings(CONTENT_STREAM_CHUNK_SIZE=4)
+class StreamingContentListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name='Finance')
+
+    def create_contents(self, count):
+        for number in range(count):
+            content = Content.objects.create(title='Title %d' % number, body='Body', summary='Summary', author=self.user)
+            content.categories.add(self.category)
+
+    def get_streamed(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_large_lists_are_streamed_with_the_same_output(self):
+        self.create_contents(10)
+        with override_settings(CONTENT_STREAM_CHUNK_SIZE=0):
+            expected = self.client.get(reverse('content-list')).content
+        cache.clear()
+        # the rows, then categories for each of the 3 chunks
+        with self.assertNumQueries(4):
+            response, content = self.get_streamed(reverse('content-list'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+        self.assertEqual(content, expected)
+        self.assertEqual(len(json.loads(content)), 10)
+
+    def test_small_lists_are_not_streamed(self):
+        self.create_contents(3)
+        response = self.client.get(reverse('content-list'))
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.data), 3)
+        self.assertIn('ETag', response)
+
+    def test_fieldsets_are_streamed(self):
+        self.create_contents(4)
+        response, content = self.get_streamed(reverse('content-list') + '?fields=id,title')
+        self.assertEqual([set(item) for item in json.loads(content)], [{'id', 'title'}] * 4)
+
+    def test_paginated_and_search_lists_are_not_streamed(self):
+        self.create_contents(10)
+        self.assertFalse(self.client.get(reverse('content-list') + '?page_size=5').streaming)
+        self.assertFalse(self.client.get(reverse('content-list') + '?query=Title').streaming)
+
+    def test_streamed_lists_are_compressed(self):
+        self.create_contents(10)
+        response, content = self.get_streamed(reverse('content-list'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(content))), 10)
+
+
+class CompressionMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='testemail@test.com', password='testpassword123', full_name='Test User')
+        self.client.force_authenticate(user=self.user)
+        for number in range(20):
+            Category.objects.create(name='Category %d' % number)
+
+    def test_json_is_compressed_when_accepted(self):
+        plain = self.client.get(reverse('category-list'))
+        self.assertNotIn('Content-Encoding', plain)
+        cache.clear()
+        response = self.client.get(reverse('category-list'), HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        # the weak ETag still revalidates
+        response = self.client.get(reverse('category-list'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_refused_and_unknown_encodings(self):
+        for accept_encoding in ('gzip;q=0', 'compress', ''):
+            response = self.client.get(reverse('category-list'), HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertNotIn('Content-Encoding', response)
+
+    async def test_async_responses_are_compressed(self):
+        body = json.dumps([{'name': 'Category %d' % number} for number in range(20)]).encode()
+
+        async def get_response(request):
+            return HttpResponse(body, content_type='application/json')
+        middleware = CompressionMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/', **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), body)
+
+    def test_pdf_downloads_are_not_compressed(self):
+        content = Content.objects.create(title='Title', body='Body', summary='Summary', pdf_file=ContentFile(b'%PDF-1.4' + b' ' * 1000, name='dummy.pdf'), author=self.user)
+        response = self.client.get(reverse('content-pdf', kwargs={'pk': content.pk}), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Content-Encoding', response)
+        response.close()
@@ -9,6 +9,10 @@ from main.views import (
     content_create_view,
     content_update_view,
     content_delete_view,
+    content_pdf_view,
+    content_bulk_create_view,
+    content_bulk_update_view,
+    content_bulk_delete_view,
     category_list_view,
     category_detail_view,
     category_create_view,
@@ -57,6 +61,17 @@ class TestUrls(SimpleTestCase):
         url = reverse('content-delete',args=[1])
         self.assertEquals(resolve(url).func,content_delete_view)
 
+    # Test if the content pdf URL resolves to the content_pdf_view function
+    def test_content_pdf_url_is_resolved(self):
+        url = reverse('content-pdf', kwargs={'pk': 1})
+        self.assertEquals(resolve(url).func,content_pdf_view)
+
+    # Test if the bulk content URLs resolve to the bulk view functions
+    def test_content_bulk_urls_are_resolved(self):
+        self.assertEquals(resolve(reverse('content-bulk-create')).func,content_bulk_create_view)
+        self.assertEquals(resolve(reverse('content-bulk-update')).func,content_bulk_update_view)
+        self.assertEquals(resolve(reverse('content-bulk-delete')).func,content_bulk_delete_view)
+
     # Test if the category list URL resolves to the category_list_view function
     def test_category_list_url_is_resolved(self):
         url = reverse('category-list')
@@ -1,15 +1,22 @@
 from django.test import TestCase, Client
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from main.models import User, Content, Category
+from django.db import DatabaseError
+from main.models import User, Content, Category, Job
 from main.serializers import UserSerializer, ContentSerializer, ContentViewSerializer
+from main.search import get_search_backend
 from django.urls import reverse
 from rest_framework.test import APIClient
 import json
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch
+from django.core.cache import cache
+import os
 
-with open('/home/joy/WORK_DIR/care24/Content-Management-System/Backend/main/tests/dummy.pdf', 'rb') as f:
+DUMMY_PDF_PATH = os.path.join(os.path.dirname(__file__), 'dummy.pdf')
+
+with open(DUMMY_PDF_PATH, 'rb') as f:
     dummy_pdf_content = f.read()
 dummy_pdf_file = ContentFile(dummy_pdf_content)
 
@@ -149,6 +156,7 @@ class LoginViewTest(TestCase):
 
 class ContentListViewTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             email='testemail@test.com',
@@ -165,7 +173,7 @@ class ContentListViewTest(TestCase):
             "title": "Test Title",
             "body": "Test Body",
             "summary": "Test Summary",
-            'pdf_file':open('/home/joy/WORK_DIR/care24/Content-Management-System/Backend/main/tests/dummy.pdf', 'rb'),
+            'pdf_file':open(DUMMY_PDF_PATH, 'rb'),
             "categories": [self.category.id]
         }
         refresh = RefreshToken.for_user(self.user)
@@ -185,6 +193,22 @@ class ContentListViewTest(TestCase):
         response = self.client.get(reverse('content-list') + '?query=' + 'hello')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_content_list_view_with_pagination(self):
+        for i in range(3):
+            Content.objects.create(title='Test Title %d' % i, body='Test Body', summary='Test Summary', pdf_file=dummy_pdf_file, author=self.user)
+        response = self.client.get(reverse('content-list') + '?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Test Title 0', 'Test Title 1'])
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.data['results']], ['Test Title 2'])
+        self.assertIsNone(response.data['next'])
+
+    def test_content_list_view_with_invalid_cursor(self):
+        response = self.client.get(reverse('content-list') + '?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     @patch('main.views.Content.objects.all')
     def test_content_list_view_exception_handling(self, mock_filter):
         mock_filter.side_effect = Exception('Something went wrong')
@@ -252,6 +276,16 @@ class ContentListViewTest(TestCase):
         response = self.client.put(url, data=self.content_data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_content_update_view_without_categories(self):
+        content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=dummy_pdf_file, author=self.user)
+        content.categories.add(self.category)
+        url = reverse('content-update', kwargs={'pk': content.id})
+        response = self.client.put(url, data={'title': 'New Title'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content.refresh_from_db()
+        self.assertEqual(content.title, 'New Title')
+        self.assertEqual(list(content.categories.all()), [self.category])
+
     def test_content_update_view_with_invalid_data(self):
         content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=dummy_pdf_file, author=self.user)
         url = reverse('content-update', kwargs={'pk': content.id})
@@ -348,6 +382,12 @@ class ContentListViewTest(TestCase):
         response = self.client.post(reverse('category-create'), data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_category_create_view_with_duplicate_name(self):
+        data = {'name': self.category.name.upper()}
+        response = self.client.post(reverse('category-create'), data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', response.data)
+
     def test_category_create_view_with_unauthenticated_user(self):
         self.client.credentials()
         data = {'name': 'test_category'}
@@ -378,3 +418,141 @@ class ContentListViewTest(TestCase):
         response = self.client.delete(
             reverse('category-delete', kwargs={'pk': self.category.pk}))
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ContentBulkViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='testemail@test.com',
+            password='testpassword123',
+            full_name='Test User'
+        )
+        self.other_user = User.objects.create_user(
+            email='testemail2@test.com',
+            password='testpassword123',
+            full_name='Test User'
+        )
+        self.categories = [Category.objects.create(name='Category %d' % i) for i in range(3)]
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token))
+
+    def create_content(self, author):
+        return Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=dummy_pdf_file, author=author)
+
+    def bulk_create_payload(self, count):
+        documents = []
+        data = {}
+        for i in range(count):
+            documents.append({
+                'title': 'Title %d' % i,
+                'body': 'Body',
+                'summary': 'Summary',
+                'categories': [category.id for category in self.categories[:i + 1]],
+                'pdf_file': 'file%d' % i,
+            })
+            data['file%d' % i] = SimpleUploadedFile('doc%d.pdf' % i, dummy_pdf_content, content_type='application/pdf')
+        data['documents'] = json.dumps(documents)
+        return data
+
+    def test_content_bulk_create_view(self):
+        response = self.client.post(reverse('content-bulk-create'), data=self.bulk_create_payload(3), format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        contents = [Content.objects.get(id=pk) for pk in response.data['created']]
+        self.assertEqual([content.title for content in contents], ['Title 0', 'Title 1', 'Title 2'])
+        self.assertEqual([content.categories.count() for content in contents], [1, 2, 3])
+        self.assertTrue(all(content.author == self.user and content.pdf_file for content in contents))
+        self.assertEqual(sorted(get_search_backend().search('title')), sorted(response.data['created']))
+
+    def test_content_bulk_create_view_reports_item_errors(self):
+        data = self.bulk_create_payload(2)
+        documents = json.loads(data['documents'])
+        documents[1]['title'] = 'x' * 31
+        data['documents'] = json.dumps(documents)
+        response = self.client.post(reverse('content-bulk-create'), data=data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'][0], {})
+        self.assertIn('title', response.data['errors'][1])
+        self.assertEqual(Content.objects.count(), 0)
+
+    def test_content_bulk_create_view_releases_uploads_on_rollback(self):
+        with patch.object(Content.objects, 'set_categories', side_effect=DatabaseError('failed')):
+            response = self.client.post(reverse('content-bulk-create'), data=self.bulk_create_payload(2), format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Content.objects.count(), 0)
+        # identical uploads are stored once
+        job = Job.objects.get(name='main.tasks.release_pdf_files')
+        self.assertEqual(len(job.args[0]), 1)
+        storage = Content._meta.get_field('pdf_file').storage
+        self.assertTrue(storage.exists(job.args[0][0]))
+
+    def test_content_bulk_create_view_with_too_many_documents(self):
+        with self.settings(CONTENT_BULK_MAX_ITEMS=2):
+            response = self.client.post(reverse('content-bulk-create'), data=self.bulk_create_payload(3), format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_content_bulk_create_view_with_unauthenticated_user(self):
+        self.client.credentials()
+        response = self.client.post(reverse('content-bulk-create'), data=self.bulk_create_payload(1), format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_content_bulk_update_view(self):
+        first, second = self.create_content(self.user), self.create_content(self.user)
+        first.categories.add(self.categories[0])
+        documents = [
+            {'id': first.id, 'title': 'New Title', 'categories': [self.categories[1].id, self.categories[2].id]},
+            {'id': second.id, 'summary': 'New Summary'},
+        ]
+        response = self.client.put(reverse('content-bulk-update'), data=documents, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.title, 'New Title')
+        self.assertEqual(set(first.categories.all()), set(self.categories[1:]))
+        self.assertEqual(second.summary, 'New Summary')
+        self.assertEqual(second.title, 'Test Title')
+
+    def test_content_bulk_update_view_clears_categories(self):
+        first, second = self.create_content(self.user), self.create_content(self.user)
+        first.categories.add(self.categories[0])
+        second.categories.add(self.categories[1])
+        documents = [{'id': first.id, 'categories': []}, {'id': second.id, 'title': 'New Title'}]
+        response = self.client.put(reverse('content-bulk-update'), data=documents, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        self.assertEqual(list(first.categories.all()), [])
+        self.assertEqual(first.category_names, '')
+        self.assertEqual(list(second.categories.all()), [self.categories[1]])
+
+    def test_content_bulk_update_view_releases_uploads_on_rollback(self):
+        content = Content.objects.create(title='Test Title', body='Test Body', summary='Test Summary', pdf_file=ContentFile(dummy_pdf_content, name='dummy.pdf'), author=self.user)
+        previous = content.pdf_file.name
+        data = {
+            'documents': json.dumps([{'id': content.id, 'pdf_file': 'file'}]),
+            'file': SimpleUploadedFile('new.pdf', dummy_pdf_content + b'\n%%EOF', content_type='application/pdf'),
+        }
+        with patch.object(Content.objects, 'set_categories', side_effect=DatabaseError('failed')):
+            response = self.client.put(reverse('content-bulk-update'), data=data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # only the new upload is released, the row still references the previous file
+        [name] = Job.objects.get(name='main.tasks.release_pdf_files').args[0]
+        self.assertNotEqual(name, previous)
+        self.assertEqual(Content.objects.get(pk=content.pk).pdf_file.name, previous)
+
+    def test_content_bulk_update_view_with_other_users_content(self):
+        content = self.create_content(self.other_user)
+        response = self.client.put(reverse('content-bulk-update'), data=[{'id': content.id, 'title': 'New Title'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data['errors'][0])
+
+    def test_content_bulk_delete_view(self):
+        own, other = self.create_content(self.user), self.create_content(self.other_user)
+        response = self.client.delete(reverse('content-bulk-delete'), data={'ids': [own.id, other.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'deleted': [own.id], 'not_found': [other.id]})
+        self.assertFalse(Content.objects.filter(id=own.id).exists())
+        self.assertTrue(Content.objects.filter(id=other.id).exists())
+
+    def test_content_bulk_delete_view_with_invalid_data(self):
+        response = self.client.delete(reverse('content-bulk-delete'), data={'ids': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
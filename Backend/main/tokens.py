@@ -0,0 +1,20 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# claims copied from the user into every issued token, see main.authentication
+USER_CLAIMS = ('is_staff', 'is_active', 'token_version')
+
+
+class CMSRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user claims the API needs to authorize a request,
+    so the access tokens derived from it authenticate without a user query.
+    """
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_user_claims(user)
+        return token
+
+    def set_user_claims(self, user):
+        for claim in USER_CLAIMS:
+            self[claim] = getattr(user, claim)
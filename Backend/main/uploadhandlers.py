@@ -0,0 +1,74 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+
+PDF_HEADER = b'%PDF-'
+
+
+class PDFUploadError(MultiPartParserError):
+    """
+    Raised while an upload is still streaming in; DRF turns it into a 400 parse error.
+    """
+
+
+class PDFUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every uploaded file to a temporary file chunk by chunk, so nothing is
+    buffered in memory and FileSystemStorage can later move it into place with a
+    rename. While writing it computes the SHA-256 of the file, checks the %PDF-
+    header on the first bytes and aborts the request as soon as the file grows
+    past PDF_UPLOAD_MAX_SIZE.
+
+    The finished upload carries the digest in its ``sha256`` attribute.
+    """
+    def new_file(self, *args, **kwargs):
+        if settings.FILE_UPLOAD_TEMP_DIR:
+            os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+        super().new_file(*args, **kwargs)
+        self.max_size = getattr(settings, 'PDF_UPLOAD_MAX_SIZE', None)
+        if self.max_size and self.content_length and self.content_length > self.max_size:
+            raise PDFUploadError(self.too_large_message())
+        self.digest = hashlib.sha256()
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.max_size and start + len(raw_data) > self.max_size:
+            self.upload_interrupted()
+            raise PDFUploadError(self.too_large_message())
+        if len(self.header) < len(PDF_HEADER):
+            self.header += raw_data[:len(PDF_HEADER) - len(self.header)]
+            if not PDF_HEADER.startswith(self.header[:len(PDF_HEADER)]):
+                self.upload_interrupted()
+                raise PDFUploadError('%s is not a PDF file.' % self.file_name)
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.header != PDF_HEADER:
+            self.upload_interrupted()
+            raise PDFUploadError('%s is not a PDF file.' % self.file_name)
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.digest.hexdigest()
+        return upload
+
+    def too_large_message(self):
+        return '%s is larger than the maximum allowed size of %d bytes.' % (self.file_name, self.max_size)
+
+
+class PDFMultiPartParser(MultiPartParser):
+    """
+    MultiPartParser streaming the files through PDFUploadHandler instead of
+    Django's FILE_UPLOAD_HANDLERS, for the views taking pdf uploads only.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']._request
+        request.upload_handlers = [PDFUploadHandler(request)]
+        return super().parse(stream, media_type, parser_context)
+
+
+# parsers of the content write views, whose uploads are all pdfs
+PDF_UPLOAD_PARSER_CLASSES = [JSONParser, FormParser, PDFMultiPartParser]
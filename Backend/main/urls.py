@@ -1,4 +1,6 @@
 from django.urls import path
+from django.conf import settings
+from .async_views import async_view
 from .views import RegistrationView
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
@@ -8,12 +10,20 @@ from .views import (
     content_create_view,
     content_update_view,
     content_delete_view,
+    content_pdf_view,
+    content_bulk_create_view,
+    content_bulk_update_view,
+    content_bulk_delete_view,
     category_list_view,
     category_detail_view,
     category_create_view,
-    category_delete_view
+    category_delete_view,
+    metrics_view
     )
 
+# under ASGI the read views run as native async views, see main.async_views
+read_view = async_view if getattr(settings, 'ASYNC_READ_VIEWS', False) else (lambda view: view)
+
 urlpatterns = [
     
     # api for user registration
@@ -26,15 +36,22 @@ urlpatterns = [
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
     # content URLs
-    path('contents/', content_list_view, name='content-list'),
-    path('contents/<int:pk>/', content_detail_view, name='content-detail'),
+    path('contents/', read_view(content_list_view), name='content-list'),
+    path('contents/<int:pk>/', read_view(content_detail_view), name='content-detail'),
     path('contents/create/', content_create_view, name='content-create'),
     path('contents/<int:pk>/update/', content_update_view, name='content-update'),
     path('contents/<int:pk>/delete/', content_delete_view, name='content-delete'),
+    path('contents/<int:pk>/pdf/', read_view(content_pdf_view), name='content-pdf'),
+    path('contents/bulk/create/', content_bulk_create_view, name='content-bulk-create'),
+    path('contents/bulk/update/', content_bulk_update_view, name='content-bulk-update'),
+    path('contents/bulk/delete/', content_bulk_delete_view, name='content-bulk-delete'),
 
     # Category URLs
-    path('categories/', category_list_view, name='category-list'),
-    path('categories/<int:pk>/', category_detail_view, name='category-detail'),
+    path('categories/', read_view(category_list_view), name='category-list'),
+    path('categories/<int:pk>/', read_view(category_detail_view), name='category-detail'),
     path('categories/create/', category_create_view, name='category-create'),
     path('categories/<int:pk>/delete/', category_delete_view, name='category-delete'),
+
+    # Prometheus metrics
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
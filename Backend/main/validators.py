@@ -0,0 +1,26 @@
+import gzip
+from functools import lru_cache
+
+from django.contrib.auth import password_validation
+
+
+@lru_cache(maxsize=None)
+def load_password_list(path):
+    """
+    Reads a (possibly gzipped) password list once per process into a frozenset.
+    """
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return frozenset(line.strip() for line in f)
+    except OSError:
+        with open(path) as f:
+            return frozenset(line.strip() for line in f)
+
+
+class CommonPasswordValidator(password_validation.CommonPasswordValidator):
+    """
+    Django's CommonPasswordValidator without re-reading its 20000 word list
+    every time the validator is instantiated.
+    """
+    def __init__(self, password_list_path=password_validation.CommonPasswordValidator.DEFAULT_PASSWORD_LIST_PATH):
+        self.passwords = load_password_list(str(password_list_path))
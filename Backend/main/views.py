@@ -1,13 +1,49 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import CMSRefreshToken
 from .serializers import UserSerializer,LoginSerializer,ContentSerializer,ContentViewSerializer,CategorySerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.decorators import api_view,permission_classes
-from django.db.models import Q
-from .models import Content,Category
+from rest_framework.decorators import api_view,permission_classes,parser_classes,renderer_classes
+from .models import DENORMALIZED_CATEGORY_FIELDS, Content,Category
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+import json
+from .pagination import ContentCursorPagination, SearchCursorPagination
+from .fieldsets import ContentFieldset
+from .fast_serializers import ContentValuesSerializer, CategoryValuesSerializer, use_fast_serializers
+from .renderers import READ_RENDERER_CLASSES, FastJSONRenderer
+from .search import get_search_backend
+from .cache import cached_response, content_namespaces, category_namespaces
+from .downloads import serve_file
+from .uploadhandlers import PDF_UPLOAD_PARSER_CLASSES
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from . import metrics
+from .jobs import queue_metrics
+from itertools import chain, islice
+from django.utils.text import slugify
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+def get_content_queryset():
+    """
+    Base queryset for content reads, with categories loaded in a single extra query
+    so serializing N contents never issues N category queries. With
+    CONTENT_DENORMALIZED_CATEGORIES they are read from the content rows instead.
+    The extracted pdf text is only read by the search backends.
+    """
+    if getattr(settings, 'CONTENT_DENORMALIZED_CATEGORIES', False):
+        return Content.objects.defer('category_names', 'pdf_text')
+    return Content.objects.all().defer('pdf_text').prefetch_related('categories')
+
+def get_stream_chunk_size():
+    """
+    Rows per chunk of streamed content lists, 0 when lists are not streamed. Django 3.2
+    iterates streamed bodies on the event loop under ASGI, where queries are not allowed.
+    """
+    if getattr(settings, 'ASYNC_READ_VIEWS', False):
+        return 0
+    return getattr(settings, 'CONTENT_STREAM_CHUNK_SIZE', 0)
 
 class RegistrationView(generics.CreateAPIView):
     """
@@ -39,7 +75,7 @@ class RegistrationView(generics.CreateAPIView):
             serializer.is_valid(raise_exception=True)
             user = serializer.save()
 
-            refresh = RefreshToken.for_user(user)
+            refresh = CMSRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token)
@@ -77,39 +113,93 @@ class LoginView(TokenObtainPairView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(READ_RENDERER_CLASSES)
+@cached_response('content-list', content_namespaces)
 def content_list_view(request):
     """
     API view to get a list of contents that match a search query (if provided) or all contents.
     
     To search, send the query parameter 'query' with your search terms in the format:
     /api/contents/?query=search+terms
+
+    To paginate, send 'page_size' and/or the opaque 'cursor' returned in 'next':
+    /api/contents/?page_size=50
+    The response is then {"next": url, "previous": url, "results": [...]} ordered by id, or by
+    relevance for a query. Without pagination, a query returns the CONTENT_SEARCH_MAX_RESULTS
+    best matches; when there are more, a 'Link: <url>; rel="next"' header points to the next page.
+    Without pagination or query, lists of at least CONTENT_STREAM_CHUNK_SIZE contents are streamed.
+
+    To only get some fields, send 'fields' or 'exclude' with comma separated field names:
+    /api/contents/?fields=id,title
     """
     try:
         query = request.GET.get('query')
-        if query:
-            # Filter contents based on search query using OR condition on title, body, summary, and category name fields
-            contents = Content.objects.filter(Q(title__icontains=query) | Q(body__icontains=query) | Q(summary__icontains=query) | Q(categories__name__icontains=query)).distinct()
-        else:
-            contents = Content.objects.all()
+        fieldset = ContentFieldset.from_request(request)
+        if fieldset is None and use_fast_serializers():
+            fieldset = ContentValuesSerializer()
+        contents = get_content_queryset()
+        author = None
         #check if user is admin or not
         if not request.user.is_staff:
-            contents = contents.filter(author=request.user)
-        serializer = ContentSerializer(contents, many=True,context={'request': request})
-        return Response(serializer.data,status=status.HTTP_200_OK)
+            author = request.user
+            contents = contents.filter(author=author)
+        if fieldset is not None:
+            contents = fieldset.get_queryset(contents)
+        if query:
+            # Filter contents through the search index on title, body, summary and category names, best match first,
+            # a page at a time so the relevance order is kept
+            paginator = SearchCursorPagination()
+            contents = paginator.paginate_search(get_search_backend(), contents, query, request, author=author)
+        else:
+            paginator = ContentCursorPagination()
+        if paginator.is_requested(request):
+            page = contents if query else paginator.paginate_queryset(contents, request)
+            if fieldset is not None:
+                return paginator.get_paginated_response(fieldset.to_representation(page, request))
+            serializer = ContentSerializer(page, many=True,context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+        if fieldset is not None:
+            chunk_size = get_stream_chunk_size()
+            if chunk_size and not query:
+                # a full table would be rendered into one string: when the first chunk is full,
+                # stream the rows from a server side cursor instead, one chunk at a time
+                rows = contents.iterator(chunk_size=chunk_size)
+                first = list(islice(rows, chunk_size))
+                if len(first) == chunk_size:
+                    chunks = fieldset.iter_representation(chain(first, rows), request, chunk_size)
+                    response = StreamingHttpResponse(FastJSONRenderer().render_array(chunks), content_type='application/json')
+                    # not cached nor given an ETag, but as private to the user as the cached responses
+                    patch_cache_control(response, private=True, no_cache=True)
+                    patch_vary_headers(response, ['Authorization'])
+                    return response
+                contents = first
+            response = Response(fieldset.to_representation(contents, request),status=status.HTTP_200_OK)
+        else:
+            serializer = ContentSerializer(contents, many=True,context={'request': request})
+            response = Response(serializer.data,status=status.HTTP_200_OK)
+        if query and paginator.has_next:
+            response['Link'] = '<%s>; rel="next"' % paginator.get_next_link()
+        return response
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(READ_RENDERER_CLASSES)
+@cached_response('content-detail', content_namespaces)
 def content_detail_view(request, pk):
     """
     API view to get a content detail by primary key.
     """
     try:
-        if request.user.is_staff:
-            content = get_object_or_404(Content, pk=pk)
-        else :
-            content = get_object_or_404(Content, pk=pk,author=request.user)
+        contents = get_content_queryset()
+        if not request.user.is_staff:
+            contents = contents.filter(author=request.user)
+        if use_fast_serializers():
+            fast_serializer = ContentValuesSerializer()
+            content = get_object_or_404(fast_serializer.get_queryset(contents), pk=pk)
+            return Response(fast_serializer.to_representation([content], request)[0],status=status.HTTP_200_OK)
+        content = get_object_or_404(contents, pk=pk)
         serializer = ContentSerializer(content,context={'request': request})
         return Response(serializer.data,status=status.HTTP_200_OK)
     except Exception as e:
@@ -117,6 +207,7 @@ def content_detail_view(request, pk):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@parser_classes(PDF_UPLOAD_PARSER_CLASSES)
 def content_create_view(request):
     """
     API view to create a new content. Required fields:
@@ -137,15 +228,18 @@ def content_create_view(request):
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@parser_classes(PDF_UPLOAD_PARSER_CLASSES)
 def content_update_view(request, pk):
     """
     API view to update an existing content.
     """
     try:
+        # without the denormalized categories, which set_categories refreshes before save()
+        contents = Content.objects.defer(*DENORMALIZED_CATEGORY_FIELDS)
         if request.user.is_staff:
-            content = get_object_or_404(Content, pk=pk)
+            content = get_object_or_404(contents, pk=pk)
         else:
-            content = get_object_or_404(Content, pk=pk,author=request.user)
+            content = get_object_or_404(contents, pk=pk,author=request.user)
         serializer = ContentViewSerializer(content, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -170,14 +264,129 @@ def content_delete_view(request, pk):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET', 'HEAD'])
+@permission_classes([IsAuthenticated])
+def content_pdf_view(request, pk):
+    """
+    API view to download the pdf of a content. Supports Range requests and
+    answers If-None-Match / If-Modified-Since with 304 Not Modified.
+    """
+    contents = Content.objects.only('id', 'title', 'author', 'pdf_file', 'pdf_hash')
+    if request.user.is_staff:
+        content = get_object_or_404(contents, pk=pk)
+    else:
+        content = get_object_or_404(contents, pk=pk, author=request.user)
+    storage = content.pdf_file.storage
+    if not content.pdf_file or not storage.exists(content.pdf_file.name):
+        raise Http404('Content has no pdf file.')
+    filename = '%s.pdf' % (slugify(content.title) or 'content-%s' % content.pk)
+    return serve_file(request, storage, content.pdf_file.name, filename, etag=content.pdf_hash)
+
+def get_bulk_documents(request):
+    """
+    Reads the list of documents sent to a bulk endpoint, either as a JSON array body
+    or as a multipart form whose 'documents' field holds the JSON array. In multipart
+    requests an item's "pdf_file" names the form field carrying its file.
+    """
+    if isinstance(request.data, list):
+        documents = request.data
+    else:
+        documents = json.loads(request.data.get('documents', '[]'))
+    if not isinstance(documents, list) or not all(isinstance(document, dict) for document in documents):
+        raise ValueError('Expected a list of documents.')
+    max_items = getattr(settings, 'CONTENT_BULK_MAX_ITEMS', 1000)
+    if len(documents) > max_items:
+        raise ValueError('At most %d documents can be sent at once.' % max_items)
+    for document in documents:
+        if isinstance(document.get('pdf_file'), str) and document['pdf_file'] in request.FILES:
+            document['pdf_file'] = request.FILES[document['pdf_file']]
+    return documents
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes(PDF_UPLOAD_PARSER_CLASSES)
+def content_bulk_create_view(request):
+    """
+    API view to create many contents in one transaction. Send a multipart form with:
+    - documents: JSON list of {"title", "body", "summary", "categories", "pdf_file"}
+      where "pdf_file" is the name of the form field holding that document's pdf
+    - one file field per document
+
+    Returns the created ids, or one error object per document if any of them is invalid.
+    """
+    try:
+        serializer = ContentViewSerializer(data=get_bulk_documents(request), many=True, context={'request': request})
+        if serializer.is_valid():
+            contents = serializer.save(author=request.user)
+            return Response({'created': [content.id for content in contents]}, status=status.HTTP_201_CREATED)
+        return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+@parser_classes(PDF_UPLOAD_PARSER_CLASSES)
+def content_bulk_update_view(request):
+    """
+    API view to update many existing contents in one transaction. Send a JSON list
+    of partial documents, each with its "id" (or the multipart form described in
+    content_bulk_create_view to replace pdfs).
+
+    Returns the updated ids, or one error object per document if any of them is invalid.
+    """
+    try:
+        documents = get_bulk_documents(request)
+        contents = Content.objects.all()
+        if not request.user.is_staff:
+            contents = contents.filter(author=request.user)
+        contents = contents.in_bulk([document.get('id') for document in documents if isinstance(document.get('id'), int)])
+        instances = [contents.get(document.get('id')) for document in documents]
+        if None in instances:
+            errors = [{} if instance else {'id': ['Content not found.']} for instance in instances]
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ContentViewSerializer(instances, data=documents, many=True, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response({'updated': [instance.id for instance in instances]}, status=status.HTTP_200_OK)
+        return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def content_bulk_delete_view(request):
+    """
+    API view to delete many contents at once. Send {"ids": [1, 2, 3]}.
+
+    Returns the deleted ids and the ids that were not found.
+    """
+    try:
+        ids = request.data.get('ids')
+        if not isinstance(ids, list):
+            raise ValueError('Expected a list of ids.')
+        contents = Content.objects.filter(id__in=ids)
+        if not request.user.is_staff:
+            contents = contents.filter(author=request.user)
+        deleted = list(contents.values_list('id', flat=True))
+        contents.delete()
+        found = set(deleted)
+        return Response({'deleted': deleted, 'not_found': [pk for pk in ids if pk not in found]}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(READ_RENDERER_CLASSES)
+@cached_response('category-list', category_namespaces)
 def category_list_view(request):
     """
     API view to get a list of all categories.
     """
     try:
         categories = Category.objects.all()
+        if use_fast_serializers():
+            fast_serializer = CategoryValuesSerializer()
+            return Response(fast_serializer.to_representation(fast_serializer.get_queryset(categories)),status=status.HTTP_200_OK)
         serializer = CategorySerializer(categories, many=True)
         return Response(serializer.data,status=status.HTTP_200_OK)
     except Exception as e:
@@ -185,6 +394,8 @@ def category_list_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(READ_RENDERER_CLASSES)
+@cached_response('category-detail', category_namespaces)
 def category_detail_view(request, pk):
     """
     API view to get a category detail by primary key.
@@ -223,4 +434,20 @@ def category_delete_view(request, pk):
         content.delete()
         return Response('Category deleted successfully',status=status.HTTP_200_OK)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def metrics_view(request):
+    """
+    API view exposing the request metrics of this process and the job queue gauges in the Prometheus text format.
+    Allowed for requests with 'Authorization: Bearer <METRICS_TOKEN>' when a token is
+    configured, otherwise only for requests coming from METRICS_ALLOWED_IPS (none by default).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token)
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if not allowed:
+        return HttpResponse('Forbidden', status=status.HTTP_403_FORBIDDEN, content_type='text/plain')
+    return HttpResponse(metrics.expose(queue_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')